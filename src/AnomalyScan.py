@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+""" The keys with fewer samples than this are skipped, e.g. the NetworkTables values which are logged once."""
+MIN_SAMPLES = 10
+
+""" A key is numeric when at least this fraction of its samples are numbers, the rest count as NaN samples."""
+NUMERIC_FRACTION = 0.5
+
+""" A spike is a single sample which jumps away from both of its neighbours by more than this many robust standard
+deviations of the key, 1.4826 MAD or 1.2533 times the mean absolute deviation when most samples are the same value
+(the MAD is 0). It must also be more than `SPIKE_STEPS` times the resolution of the key (its smallest change), so
+the jitter of a quantized sensor at rest isn't a spike."""
+SPIKE_MADS = 8.0
+SPIKE_STEPS = 2
+
+_MAD_SCALE = 1.4826
+_MEAN_AD_SCALE = 1.2533
+
+
+def _GroupMedians(groups: np.ndarray, values: np.ndarray, starts: np.ndarray, counts: np.ndarray):
+    # Sort by value within each group (the groups are already contiguous), the median is at the middle of each group
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    return 0.5 * (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2])
+
+
+def ScanAnomalies(source, keys: list = None, minSamples: int = MIN_SAMPLES, spikeMads: float = SPIKE_MADS):
+    """ Compute robust statistics of every numeric key in one grouped, vectorized pass over the log.
+
+    The samples are sorted by key and time once (a key index already is, so its arrays are only joined), and every
+    statistic is computed over the whole sorted array with the group boundaries, so the cost doesn't grow with the
+    number of keys.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        keys: optional list of keys to scan, by default every key is scanned
+        minSamples: the keys with fewer samples are skipped
+        spikeMads: the spike threshold in robust standard deviations
+
+    Returns:
+        stats: Pandas dataframe indexed by key with the `Samples`, `Median`, `MAD`, `Spike Count`, `Stuck Time (s)`,
+            `Stuck Fraction` (the longest run of an unchanged value over the span of the key, 1.0 if the value never
+            changes), `NaN Count`, `Max Gap (s)` and `Gap Ratio` (the longest time between samples over the median
+            `Max Gap (s)` of the keys, so a pause of the whole log such as while disabled isn't a gap) of each
+            numeric key
+
+    Raises:
+        None
+
+    """
+
+    columns = ['Samples', 'Median', 'MAD', 'Spike Count', 'Stuck Time (s)', 'Stuck Fraction', 'NaN Count',
+               'Max Gap (s)', 'Gap Ratio']
+    if isinstance(source, dict):
+        names = np.array(sorted(source if keys is None else [key for key in keys if key in source]), dtype=object)
+        if names.size == 0:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name='Key'), dtype=np.float64)
+        codes = np.repeat(np.arange(names.size), [len(source[name][0]) for name in names])
+        timestamps = np.concatenate([source[name][0] for name in names])
+        rawValues = np.concatenate([source[name][1] for name in names])
+    else:
+        robotTelemetry = source if keys is None else source[source['Name'].isin(keys)]
+        codes, names = pd.factorize(robotTelemetry['Name'], sort=True)
+        timestamps = robotTelemetry['Timestamp'].to_numpy(dtype=np.float64)
+        rawValues = robotTelemetry['Value'].to_numpy(dtype=object)
+
+    # Convert each distinct value once, logs repeat the same few values a lot (a missing value has the code -1)
+    valueCodes, distinctValues = pd.factorize(rawValues)
+    numericValues = pd.to_numeric(pd.Series(distinctValues, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    values = np.append(numericValues, np.nan)[valueCodes]
+    if not isinstance(source, dict):
+        order = np.lexsort((timestamps, codes))
+        codes, timestamps, values = codes[order], timestamps[order], values[order]
+
+    # Keep the numeric keys with enough samples
+    total = np.bincount(codes, minlength=len(names))
+    finite = np.isfinite(values)
+    numeric = np.bincount(codes, weights=finite, minlength=len(names))
+    selected = (total >= max(minSamples, 2)) & (numeric >= NUMERIC_FRACTION * total) & (numeric >= minSamples)
+    keep = selected[codes]
+    codes, timestamps, values, finite = codes[keep], timestamps[keep], values[keep], finite[keep]
+    if codes.size == 0:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='Key'), dtype=np.float64)
+
+    # The sample gaps and NaN samples, over every sample of the key
+    groups, starts, total = np.unique(codes, return_index=True, return_counts=True)
+    gaps = np.where(codes[1:] == codes[:-1], np.diff(timestamps), np.nan)
+    maxGap = np.fmax.reduceat(np.concatenate((gaps, [np.nan])), starts)
+    nanCount = total - np.bincount(codes, weights=finite, minlength=groups.max() + 1)[groups]
+
+    # The robust statistics, over the finite samples
+    codes, timestamps, values = codes[finite], timestamps[finite], values[finite]
+    _, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+    medians = _GroupMedians(codes, values, starts, counts)
+    mads = _GroupMedians(codes, np.abs(values - np.repeat(medians, counts)), starts, counts)
+    means = np.add.reduceat(values, starts) / counts
+    meanAds = np.add.reduceat(np.abs(values - np.repeat(means, counts)), starts) / counts
+
+    # Spikes jump away from both neighbours (of the same key) in the same direction by more than the threshold
+    jumps = np.diff(values)
+    sameKey = codes[1:] == codes[:-1]
+    changes = np.where(sameKey & (jumps != 0), np.abs(jumps), np.inf)
+    steps = np.minimum.reduceat(np.concatenate((changes, [np.inf])), starts)
+    steps[np.isinf(steps)] = 0.0
+    scales = np.where(mads > 0, _MAD_SCALE * mads, _MEAN_AD_SCALE * meanAds)
+    threshold = np.repeat(np.maximum(spikeMads * scales, SPIKE_STEPS * steps), counts)
+    before, after = jumps[:-1], -jumps[1:]
+    spikes = sameKey[:-1] & sameKey[1:] & (np.sign(before) == np.sign(after)) & \
+        (np.abs(before) > threshold[1:-1]) & (np.abs(after) > threshold[1:-1])
+    spikeCount = np.bincount(codes[1:-1][spikes], minlength=codes.max() + 1)[groups]
+
+    # The runs of an unchanged value, each lasting until the next change (or the last sample of the key)
+    runStarts = np.flatnonzero(np.concatenate(([True], (jumps != 0) | ~sameKey)))
+    keyStops = np.concatenate((starts[1:], [len(values)])) - 1
+    nextStart = np.concatenate((runStarts[1:], [len(values)]))
+    runStops = np.minimum(nextStart, keyStops[np.searchsorted(starts, runStarts, side='right') - 1])
+    runTimes = timestamps[runStops] - timestamps[runStarts]
+    stuckTime = np.maximum.reduceat(runTimes, np.searchsorted(runStarts, starts))
+    span = timestamps[keyStops] - timestamps[starts]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = pd.DataFrame({
+            'Samples': total,
+            'Median': medians,
+            'MAD': mads,
+            'Spike Count': spikeCount,
+            'Stuck Time (s)': stuckTime,
+            'Stuck Fraction': np.where(span > 0, stuckTime / span, np.nan),
+            'NaN Count': nanCount.astype(np.int64),
+            'Max Gap (s)': maxGap,
+            'Gap Ratio': maxGap / np.median(maxGap),
+        }, index=pd.Index(names[groups], name='Key'))
+
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import DataLogReader as dlr
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Scan every numeric key of a log for spikes, stuck values and gaps')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("--keys", nargs='+', default=None)
+    parser.add_argument("--spike-mads", type=float, default=SPIKE_MADS)
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    robotTelemetry = dlr.ReadDataLog(telemetryFile)
+    start = time.perf_counter()
+    stats = ScanAnomalies(robotTelemetry, args.keys, spikeMads=args.spike_mads)
+    elapsed = time.perf_counter() - start
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(stats.round(4))
+    print(f'{len(stats)} keys in {1000 * elapsed:.1f} ms')
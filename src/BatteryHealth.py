@@ -0,0 +1,266 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import DataLogReader as dlr
+import EventDetection as ed
+import SignalAlignment as sa
+
+VOLTAGE_KEY = 'PDH Input Voltage (V)'
+CURRENT_KEY = 'PDH Total Current (A)'
+
+""" An optional key with the label of the battery in the robot. Logs without it are matched to a battery with the
+battery map file instead."""
+BATTERY_ID_KEY = 'Battery ID'
+
+""" The voltage and current are aligned onto a uniform grid at the robot loop period (in seconds)."""
+SAMPLE_PERIOD = 0.02
+
+""" A load segment is an interval where the total current is above `LOAD_CURRENT` amps, widened by `SEGMENT_MARGIN`
+seconds on each side so the fit sees the battery both at rest and under load."""
+LOAD_CURRENT = 5.0
+SEGMENT_MARGIN = 0.5
+
+""" The fit of a segment is only reported when its current spans at least this many amps, a narrower span can't
+separate the resistance from the noise."""
+MIN_CURRENT_SPAN = 10.0
+
+""" A battery is flagged for retirement when its median resistance is this many times the median of all batteries.
+The resistance measured at the PDH includes the main breaker and wiring, so batteries are compared to each other
+rather than to a datasheet value."""
+RETIRE_RATIO = 1.25
+
+
+def FitInternalResistance(current: np.ndarray, voltage: np.ndarray, starts: np.ndarray = None,
+                          stops: np.ndarray = None):
+    """ Fit V = Voc - I * R by least squares over each segment of aligned current and voltage samples.
+
+    The fits of every segment come from the differences of cumulative sums, so all segments are fitted at once.
+
+    Args:
+        current: Numpy float array of current samples
+        voltage: Numpy float array of the voltage at the same times
+        starts: optional Numpy int array of the first sample of each segment, by default all samples are one segment
+        stops: optional Numpy int array of the sample after the last one of each segment
+
+    Returns:
+        fits: Dictionary of the `Open Circuit Voltage (V)`, `Internal Resistance (Ohm)`, `R2`, `Current Span (A)` and
+            `Samples` arrays with an entry per segment, the fits of segments with constant current are NaN
+
+    Raises:
+        None
+
+    """
+
+    if starts is None:
+        starts, stops = np.array([0]), np.array([len(current)])
+
+    def SegmentSums(values):
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        return sums[stops] - sums[starts]
+
+    # Center the samples first so the sums of squares don't lose the variance to rounding
+    offsetI = current.mean() if len(current) else 0.0
+    offsetV = voltage.mean() if len(voltage) else 0.0
+    centeredI, centeredV = current - offsetI, voltage - offsetV
+
+    n = (stops - starts).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        meanI = SegmentSums(centeredI) / n
+        meanV = SegmentSums(centeredV) / n
+        varI = SegmentSums(centeredI * centeredI) / n - meanI ** 2
+        varV = SegmentSums(centeredV * centeredV) / n - meanV ** 2
+        cov = SegmentSums(centeredI * centeredV) / n - meanI * meanV
+        resistance = np.where(varI > 0, -cov / varI, np.nan)
+        r2 = np.where((varI > 0) & (varV > 0), cov ** 2 / (varI * varV), np.nan)
+        meanI, meanV = meanI + offsetI, meanV + offsetV
+
+    # The current span of each segment, reducing over the (start, stop) pairs and keeping every other result
+    span = np.full(len(starts), np.nan)
+    if len(starts):
+        pairs = np.column_stack((starts, stops)).ravel()
+        padded = np.concatenate((current, [0.0]))
+        span = np.maximum.reduceat(padded, pairs)[::2] - np.minimum.reduceat(padded, pairs)[::2]
+        span[stops <= starts] = np.nan
+
+    return {
+        'Open Circuit Voltage (V)': meanV + resistance * meanI,
+        'Internal Resistance (Ohm)': resistance,
+        'R2': r2,
+        'Current Span (A)': span,
+        'Samples': stops - starts,
+    }
+
+
+def GetLoadSegments(timestamps: np.ndarray, current: np.ndarray, loadCurrent: float = LOAD_CURRENT,
+                    margin: float = SEGMENT_MARGIN):
+    """ Find the load segments of the current, see `LOAD_CURRENT`.
+
+    Returns:
+        starts: Numpy int array of the first sample of each segment
+        stops: Numpy int array of the sample after the last one of each segment
+    """
+
+    loadStarts, loadStops = ed.ThresholdIntervals(timestamps, current, loadCurrent, below=False)
+    if len(loadStarts) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Merge the segments which overlap once they are widened
+    loadStarts, loadStops = loadStarts - margin, loadStops + margin
+    merged = np.concatenate(([True], loadStarts[1:] > loadStops[:-1]))
+    loadStarts = loadStarts[merged]
+    loadStops = np.maximum.reduceat(loadStops, np.flatnonzero(merged))
+
+    return np.searchsorted(timestamps, loadStarts, side='left'), np.searchsorted(timestamps, loadStops, side='right')
+
+
+def EstimateBatteryHealth(source, voltageKey: str = VOLTAGE_KEY, currentKey: str = CURRENT_KEY):
+    """ Estimate the internal resistance and open-circuit voltage of the battery over a log and each load segment.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        voltageKey: the battery voltage telemetry key
+        currentKey: the total current telemetry key
+
+    Returns:
+        health: Dictionary with the `Battery` label (None if it isn't logged), the log wide `Open Circuit Voltage
+            (V)`, `Internal Resistance (Ohm)`, `R2` and `Samples`, and a list of the `Segments` with enough current
+            span for a fit. If the voltage or current isn't in the telemetry (e.g. logs from before the PDH was
+            added) the fit is None with 0 samples and no segments
+
+    Raises:
+        None
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, [voltageKey, currentKey,
+                                                                                  BATTERY_ID_KEY])
+    battery = None
+    if BATTERY_ID_KEY in keyIndex and len(keyIndex[BATTERY_ID_KEY][1]):
+        battery = str(keyIndex[BATTERY_ID_KEY][1][-1])
+
+    if voltageKey not in keyIndex or currentKey not in keyIndex:
+        return {
+            'Battery': battery,
+            'Open Circuit Voltage (V)': None,
+            'Internal Resistance (Ohm)': None,
+            'R2': None,
+            'Samples': 0,
+            'Segments': [],
+        }
+
+    aligned = sa.AlignSignals(keyIndex, [voltageKey, currentKey], method='linear', period=SAMPLE_PERIOD)
+    timestamps = aligned['Timestamp'].to_numpy()
+    voltage = aligned[voltageKey].to_numpy()
+    current = aligned[currentKey].to_numpy()
+
+    logFit = FitInternalResistance(current, voltage)
+    starts, stops = GetLoadSegments(timestamps, current)
+    segmentFits = FitInternalResistance(current, voltage, starts, stops)
+
+    segments = []
+    for i in np.flatnonzero(segmentFits['Current Span (A)'] >= MIN_CURRENT_SPAN):
+        segments.append({
+            'Start': float(timestamps[starts[i]]),
+            'Stop': float(timestamps[stops[i] - 1]),
+            **{name: _Float(values[i]) for name, values in segmentFits.items() if name != 'Samples'},
+        })
+
+    return {
+        'Battery': battery,
+        'Open Circuit Voltage (V)': _Float(logFit['Open Circuit Voltage (V)'][0]),
+        'Internal Resistance (Ohm)': _Float(logFit['Internal Resistance (Ohm)'][0]),
+        'R2': _Float(logFit['R2'][0]),
+        'Samples': int(logFit['Samples'][0]),
+        'Segments': segments,
+    }
+
+
+def ReadBatteryMap(batteryMapFile: Path):
+    """ Read a CSV file with `Log` and `Battery` columns into a dictionary of log name to battery label."""
+    batteryMap = pd.read_csv(batteryMapFile, dtype=str)
+    return dict(zip(batteryMap['Log'].map(dlr.GetLogName), batteryMap['Battery']))
+
+
+def TrackBatteries(telemetryFiles: list, batteryMap: dict = None):
+    """ Estimate the battery health of every log and track it per battery.
+
+    Args:
+        telemetryFiles: list of Paths to the robot telemetry files
+        batteryMap: optional dictionary of log name to battery label, for the logs which don't log `BATTERY_ID_KEY`
+
+    Returns:
+        logs: Pandas dataframe with the battery and fit of each log, the logs without the keys are skipped
+        batteries: Pandas dataframe indexed by battery with the `Logs`, the median and max `Internal Resistance (Ohm)`,
+            the median `Segment Resistance (Ohm)`, the min `Open Circuit Voltage (V)` and the `Retire` flag
+
+    Raises:
+        None
+
+    """
+
+    batteryMap = {} if batteryMap is None else batteryMap
+    rows = []
+    for telemetryFile in telemetryFiles:
+        health = EstimateBatteryHealth(dlr.ReadDataLog(telemetryFile))
+        if health['Samples'] == 0:
+            continue
+        logName = dlr.GetLogName(telemetryFile)
+        segmentResistance = [segment['Internal Resistance (Ohm)'] for segment in health['Segments']]
+        rows.append({
+            'Log': logName,
+            'Battery': health['Battery'] or batteryMap.get(logName, 'unknown'),
+            'Open Circuit Voltage (V)': health['Open Circuit Voltage (V)'],
+            'Internal Resistance (Ohm)': health['Internal Resistance (Ohm)'],
+            'R2': health['R2'],
+            'Segment Resistance (Ohm)': float(np.median(segmentResistance)) if segmentResistance else np.nan,
+            'Segments': len(segmentResistance),
+        })
+
+    logs = pd.DataFrame(rows, columns=['Log', 'Battery', 'Open Circuit Voltage (V)', 'Internal Resistance (Ohm)',
+                                       'R2', 'Segment Resistance (Ohm)', 'Segments'])
+    batteries = logs.groupby('Battery').agg(**{
+        'Logs': ('Log', 'size'),
+        'Internal Resistance (Ohm)': ('Internal Resistance (Ohm)', 'median'),
+        'Max Internal Resistance (Ohm)': ('Internal Resistance (Ohm)', 'max'),
+        'Segment Resistance (Ohm)': ('Segment Resistance (Ohm)', 'median'),
+        'Open Circuit Voltage (V)': ('Open Circuit Voltage (V)', 'min'),
+    })
+    batteries['Retire'] = batteries['Internal Resistance (Ohm)'] > \
+        RETIRE_RATIO * batteries['Internal Resistance (Ohm)'].median()
+
+    return logs, batteries
+
+
+def _Float(value):
+    return None if np.isnan(value) else float(value)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Estimate the internal resistance of the batteries across logs')
+    parser.add_argument("telemetry", nargs='+', help='telemetry files or directories of telemetry files')
+    parser.add_argument("--battery-map", default=None, help='CSV file with Log and Battery columns')
+    parser.add_argument("--output", default=None, help='write battery_logs.csv and batteries.csv to this directory')
+    args = parser.parse_args()
+
+    telemetryFiles = []
+    for path in map(Path, args.telemetry):
+        if path.is_dir():
+            telemetryFiles.extend(dlr.FindDataLogs(path))
+        elif path.is_file():
+            telemetryFiles.append(path)
+        else:
+            raise OSError(2, 'File not found', path)
+
+    batteryMap = ReadBatteryMap(Path(args.battery_map)) if args.battery_map else None
+    logs, batteries = TrackBatteries(telemetryFiles, batteryMap)
+    if args.output is not None:
+        outputDir = Path(args.output)
+        outputDir.mkdir(parents=True, exist_ok=True)
+        logs.to_csv(outputDir / 'battery_logs.csv', index=False)
+        batteries.to_csv(outputDir / 'batteries.csv')
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(logs.to_string(index=False))
+        print()
+        print(batteries)
@@ -1,6 +1,11 @@
+import DataLogReader as dlr
+import LodPyramid as lod
+import SignalAlignment as sa
 import SwerveModuleHoming
 import customtkinter as ctk
-import pandas as pd
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from matplotlib.figure import Figure
 from pathlib import Path
 from tkinter import filedialog
 
@@ -11,8 +16,8 @@ ctk.set_default_color_theme("dark-blue")
 class App(ctk.CTk):
     #tim is cool
 
-    WIDTH = 780
-    HEIGHT = 520
+    WIDTH = 1280
+    HEIGHT = 720
 
     def __init__(self):
         super().__init__()
@@ -20,8 +25,15 @@ class App(ctk.CTk):
         self.title("Data Log Analysis")
         self.geometry(f"{App.WIDTH}x{App.HEIGHT}")
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.grid_columnconfigure(1, weight=1)
+        self.grid_rowconfigure(4, weight=1)
 
         self.filename = "None"
+        self.robotTelemetry = None
+        self.keyIndex = {}
+        self.pyramids = {}
+        self.pyramid = None
+        self.homingData = None
         self.button_1 = ctk.CTkButton(master=self,
                                       text="Load Log File",
                                       command=self.load_file)
@@ -32,15 +44,98 @@ class App(ctk.CTk):
                                       text="Swerve Homing",
                                       command=self.swerve_homing)
         self.button_2.grid(row=2, column=0, pady=20, padx=20)
+        self.option_key = ctk.CTkOptionMenu(master=self,
+                                            values=["No log loaded"],
+                                            command=self.plot_key)
+        self.option_key.grid(row=3, column=0, pady=20, padx=20)
+
+        # The plot is embedded in the window and only the visible range is drawn, at the level of detail of the
+        # plot width, so panning and zooming cost the same no matter how long the signal is
+        self.frame_plot = ctk.CTkFrame(master=self)
+        self.frame_plot.grid(row=0, column=1, rowspan=5, pady=20, padx=20, sticky="nsew")
+        self.figure = Figure(figsize=(8, 5), dpi=100)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_xlabel('Time (s)')
+        self.line, = self.ax.plot([], [], linewidth=0.8)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.frame_plot)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self.frame_plot, pack_toolbar=False)
+        self.toolbar.pack(side="bottom", fill="x")
+        self.canvas.get_tk_widget().pack(side="top", fill="both", expand=True)
+        self.ax.callbacks.connect('xlim_changed', self.update_plot)
+
+        # The homing plots of the four modules are drawn on their own canvases, in a frame stacked on the key plot
+        self.frame_homing = ctk.CTkFrame(master=self)
+        self.frame_homing.grid(row=0, column=1, rowspan=5, pady=20, padx=20, sticky="nsew")
+        self.frame_homing.grid_columnconfigure((0, 1), weight=1)
+        self.frame_homing.grid_rowconfigure((0, 1), weight=1)
+        self.homingFigures = {}
+        self.homingCanvases = {}
+        for i, baseKey in enumerate(SwerveModuleHoming.BASE_KEYS):
+            self.homingFigures[baseKey] = Figure(figsize=(5.3, 3.3), dpi=100)
+            self.homingCanvases[baseKey] = FigureCanvasTkAgg(self.homingFigures[baseKey], master=self.frame_homing)
+            self.homingCanvases[baseKey].get_tk_widget().grid(row=i // 2, column=i % 2, sticky="nsew")
+        self.frame_plot.tkraise()
 
     def load_file(self):
         self.filename = filedialog.askopenfilename(
-            initialdir=Path.cwd, filetypes=(("CSV Files", "*.csv"),))
-        self.label_1.set_text(self.filename)
+            initialdir=Path.cwd, filetypes=(("Log Files", " ".join("*" + suffix for suffix in dlr.DATA_LOG_SUFFIXES)),
+                                             ("CSV Files", "*.csv")))
+        if not self.filename:
+            return
+        self.label_1.configure(text=Path(self.filename).name)
+
+        # The log is read once and shared by the plots and the analyses
+        self.robotTelemetry = dlr.ReadDataLog(self.filename)
+        self.keyIndex = sa.BuildKeyIndex(self.robotTelemetry)
+        self.pyramids = {}
+        self.pyramid = None
+        self.homingData = None
+        keys = [key for key, (_, values) in self.keyIndex.items() if not np.isnan(sa.ToNumeric(values)).all()]
+        self.option_key.configure(values=keys if keys else ["No numeric keys"])
+        if keys:
+            self.option_key.set(keys[0])
+            self.plot_key(keys[0])
+
+    def plot_key(self, key):
+        if key not in self.keyIndex:
+            return
+        self.frame_plot.tkraise()
+        if key not in self.pyramids:
+            self.pyramids[key] = lod.MinMaxPyramid(*sa.GetSignal(self.keyIndex, key))
+        pyramid = self.pyramid = self.pyramids[key]
+
+        self.ax.set_title(key)
+        if len(pyramid.timestamps):
+            self.ax.set_xlim(*_PaddedRange(pyramid.timestamps[0], pyramid.timestamps[-1]))
+        self.toolbar.update()
+        self.update_plot(self.ax)
+
+    def update_plot(self, ax):
+        if self.pyramid is None:
+            return
+        startTime, stopTime = ax.get_xlim()
+        x, y = self.pyramid.Query(startTime, stopTime, max(self.canvas.get_tk_widget().winfo_width(), 100))
+        self.line.set_data(x, y)
+        # Fit the y axis to the visible range, the query keeps the min and max of every bucket
+        if np.isfinite(y).any():
+            ax.set_ylim(*_PaddedRange(np.nanmin(y), np.nanmax(y)))
+        self.canvas.draw_idle()
 
     def swerve_homing(self):
-        df = pd.read_csv(self.filename)
-        SwerveModuleHoming.PlotSwerveModuleHoming(df)
+        if self.robotTelemetry is None:
+            return
+        if self.homingData is None:
+            try:
+                self.homingData = SwerveModuleHoming.GetSwerveModuleHomingData(self.robotTelemetry)
+            except KeyError as e:
+                self.label_1.configure(text=f"{Path(self.filename).name}\n{e.args[0]}")
+                return
+            filteredDfs, _ = self.homingData
+            for baseKey, figure in self.homingFigures.items():
+                figure.clear()
+                SwerveModuleHoming.DrawSwerveModuleHoming(figure, filteredDfs[baseKey], baseKey)
+                self.homingCanvases[baseKey].draw_idle()
+        self.frame_homing.tkraise()
 
         # # configure grid layout (2x1)
         # self.grid_columnconfigure(1, weight=1)
@@ -237,6 +332,11 @@ class App(ctk.CTk):
         self.mainloop()
 
 
+def _PaddedRange(lo, hi):
+    pad = (hi - lo) * 0.05 if hi > lo else 1.0
+    return lo - pad, hi + pad
+
+
 if __name__ == "__main__":
     app = App()
     app.start()
@@ -0,0 +1,97 @@
+import gzip
+import lzma
+import shutil
+from pathlib import Path
+import DataLogReader as dlr
+
+""" The archive formats, the zstandard one needs the optional `zstandard` package."""
+ARCHIVE_FORMATS = ('zst', 'xz', 'gz')
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def OpenArchiveWriter(archiveFile: Path, archiveFormat: str, level: int = None):
+    """ Open a compressed binary stream for writing a log archive.
+
+    Args:
+        archiveFile: Path to the archive file
+        archiveFormat: one of `ARCHIVE_FORMATS`
+        level: optional compression level, by default the format's default level is used
+
+    Returns:
+        stream: the binary stream, to be closed by the caller
+
+    Raises:
+        ValueError: if the archive format isn't supported
+        ImportError: if the format is zstandard and the `zstandard` package isn't installed
+
+    """
+
+    if archiveFormat == 'gz':
+        return gzip.open(archiveFile, 'wb', compresslevel=9 if level is None else level)
+    if archiveFormat == 'xz':
+        return lzma.open(archiveFile, 'wb', preset=level)
+    if archiveFormat == 'zst':
+        if not dlr.ZSTANDARD_AVAILABLE:
+            raise ImportError("the zstandard package is required to write .zst logs")
+        compressor = dlr.zstandard.ZstdCompressor(level=10 if level is None else level, threads=-1)
+        return compressor.stream_writer(open(archiveFile, 'wb'), closefd=True)
+    raise ValueError(f"expected one of {ARCHIVE_FORMATS} for the archive format")
+
+
+def ArchiveDataLog(telemetryFile: Path, archiveFormat: str = 'zst', level: int = None, verify: bool = True):
+    """ Compress a raw CSV log next to the original with streaming compression.
+
+    Args:
+        telemetryFile: Path to the raw `.csv` robot telemetry file
+        archiveFormat: one of `ARCHIVE_FORMATS`
+        level: optional compression level
+        verify: read the archive back and check it decompresses to the original bytes
+
+    Returns:
+        archiveFile: Path to the archive
+
+    Raises:
+        ValueError: if the file isn't a raw CSV log or the archive doesn't match the original
+
+    """
+
+    telemetryFile = Path(telemetryFile)
+    if telemetryFile.suffix.lower() != '.csv':
+        raise ValueError(f"expected a raw .csv log: {telemetryFile}")
+    archiveFile = telemetryFile.with_name(telemetryFile.name + '.' + archiveFormat)
+
+    with open(telemetryFile, 'rb') as src, OpenArchiveWriter(archiveFile, archiveFormat, level) as dst:
+        shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+
+    if verify and dlr.HashDataLog(telemetryFile) != dlr.HashDataLog(archiveFile):
+        archiveFile.unlink()
+        raise ValueError(f"the archive doesn't match the original log: {archiveFile}")
+
+    return archiveFile
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compress a directory of telemetry logs')
+    parser.add_argument("logdir")
+    parser.add_argument("--format", choices=ARCHIVE_FORMATS, default='zst' if dlr.ZSTANDARD_AVAILABLE else 'xz')
+    parser.add_argument("--level", type=int, default=None)
+    parser.add_argument("--delete", action='store_true', help='delete each original log once its archive is verified')
+    args = parser.parse_args()
+    logDir = Path(args.logdir)
+    if not logDir.is_dir():
+        raise OSError(2, 'Directory not found', logDir)
+
+    rawSize = archiveSize = 0
+    for telemetryFile in sorted(logDir.glob('*.csv')):
+        archiveFile = ArchiveDataLog(telemetryFile, args.format, args.level)
+        rawSize += telemetryFile.stat().st_size
+        archiveSize += archiveFile.stat().st_size
+        print(f'{telemetryFile.name} -> {archiveFile.name}')
+        if args.delete:
+            telemetryFile.unlink()
+
+    if archiveSize:
+        print(f'{rawSize / 1e6:.1f} MB -> {archiveSize / 1e6:.1f} MB ({rawSize / archiveSize:.1f}x)')
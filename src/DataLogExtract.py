@@ -0,0 +1,178 @@
+import fnmatch
+import re
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import DataLogReader as dlr
+import EventDetection as ed
+import SignalAlignment as sa
+
+
+def MatchKeys(keys, patterns: list, regex: bool = False):
+    """ Select the keys which match any of the patterns, in the order of `keys`.
+
+    Args:
+        keys: the telemetry keys to select from
+        patterns: glob patterns such as `FL *`, or regular expressions if `regex`
+        regex: treat the patterns as regular expressions (matched anywhere in the key) instead of globs
+
+    Returns:
+        keys: list of the matching keys
+
+    Raises:
+        re.error: if a regular expression is invalid
+
+    """
+
+    if regex:
+        compiled = [re.compile(pattern) for pattern in patterns]
+        return [key for key in keys if any(pattern.search(key) for pattern in compiled)]
+    return [key for key in keys if any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)]
+
+
+def GetExtractIntervals(source, startTime: float = None, stopTime: float = None, phase: str = None):
+    """ Get the time intervals to extract, the whole log by default.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        startTime: optional start of the time range
+        stopTime: optional end of the time range
+        phase: optional match phase (e.g. `Teleop`), every interval of the phase is extracted
+
+    Returns:
+        starts: Numpy float array of the start of each interval
+        stops: Numpy float array of the end of each interval
+
+    Raises:
+        KeyError: if the phase isn't in the log
+
+    """
+
+    if phase is None:
+        starts, stops = np.array([-np.inf]), np.array([np.inf])
+    else:
+        phaseIntervals = ed.GetPhaseIntervals(source)
+        if phase not in phaseIntervals:
+            raise KeyError(f"missing match phase: {phase}, the log has {sorted(phaseIntervals)}")
+        starts, stops = phaseIntervals[phase]
+
+    starts = np.maximum(starts, -np.inf if startTime is None else startTime)
+    stops = np.minimum(stops, np.inf if stopTime is None else stopTime)
+    keep = starts <= stops
+    return starts[keep], stops[keep]
+
+
+def ExtractDataLog(source, patterns: list, startTime: float = None, stopTime: float = None, phase: str = None,
+                   regex: bool = False):
+    """ Extract the samples of the matching keys in a time range or match phase.
+
+    The patterns are matched against the key names first, so only the matching keys (and `FMS Mode` for a phase) are
+    indexed. Each key's samples in the range are then sliced out of its time sorted arrays with a binary search.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        patterns: glob patterns (or regular expressions if `regex`) of the keys to extract
+        startTime: optional start of the time range
+        stopTime: optional end of the time range
+        phase: optional match phase to extract
+        regex: treat the patterns as regular expressions
+
+    Returns:
+        robotTelemetry: Pandas dataframe with the [Timestamp,Name,Value] columns, sorted by timestamp
+
+    Raises:
+        KeyError: if the phase isn't in the log
+
+    """
+
+    if isinstance(source, dict):
+        keys = MatchKeys(source.keys(), patterns, regex)
+        keyIndex = source
+    else:
+        keys = MatchKeys(source['Name'].dropna().unique(), patterns, regex)
+        keyIndex = sa.BuildKeyIndex(source, keys)
+    starts, stops = GetExtractIntervals(source, startTime, stopTime, phase)
+
+    timestamps, names, values = [], [], []
+    for key in keys:
+        keyTimestamps, keyValues = keyIndex[key]
+        lo = np.searchsorted(keyTimestamps, starts, side='left')
+        hi = np.searchsorted(keyTimestamps, stops, side='right')
+        for a, b in zip(lo, hi):
+            if a < b:
+                timestamps.append(keyTimestamps[a:b])
+                values.append(keyValues[a:b])
+                names.append(np.full(b - a, key, dtype=object))
+
+    if not timestamps:
+        return pd.DataFrame({'Timestamp': np.empty(0), 'Name': np.empty(0, dtype=object),
+                             'Value': np.empty(0, dtype=object)})
+
+    robotTelemetry = pd.DataFrame({
+        'Timestamp': np.concatenate(timestamps),
+        'Name': np.concatenate(names),
+        'Value': np.concatenate(values),
+    })
+    return robotTelemetry.sort_values('Timestamp', kind='stable', ignore_index=True)
+
+
+def ReadMatchingRows(telemetryFile: Path, patterns: list, regex: bool = False, extraKeys: list = ()):
+    """ Read only the rows of the keys which match the patterns, streaming the log in chunks so the whole log is never
+    held in memory.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+        patterns: glob patterns (or regular expressions if `regex`) of the keys to read
+        regex: treat the patterns as regular expressions
+        extraKeys: keys to read as well, e.g. `FMS Mode` to find the match phases
+
+    Returns:
+        robotTelemetry: Pandas dataframe with the [Timestamp,Name,Value] columns of the matching rows
+
+    Raises:
+        ImportError: if the file is zstandard compressed and the `zstandard` package isn't installed
+
+    """
+
+    matched, seen, chunks = set(extraKeys), set(), []
+    for chunk in dlr.ReadDataLogChunks(telemetryFile):
+        names = [name for name in chunk['Name'].dropna().unique() if name not in seen]
+        matched.update(MatchKeys(names, patterns, regex))
+        seen.update(names)
+        chunks.append(chunk.loc[chunk['Name'].isin(matched)])
+
+    if not chunks:
+        return pd.DataFrame({'Timestamp': np.empty(0), 'Name': np.empty(0, dtype=object),
+                             'Value': np.empty(0, dtype=object)})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def WriteDataLog(robotTelemetry: pd.DataFrame, telemetryFile: Path):
+    """ Write telemetry as a WPILib style CSV log, compressed if the file ends in `.gz`, `.xz` or `.zst`."""
+    robotTelemetry.to_csv(telemetryFile, index=False, columns=['Timestamp', 'Name', 'Value'], compression='infer')
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Extract a smaller log of some keys in a time range or match phase')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("output", help='the extracted log, compressed if it ends in .gz, .xz or .zst')
+    parser.add_argument("--keys", nargs='+', required=True, help="key globs, e.g. 'FL *'")
+    parser.add_argument("--regex", action='store_true', help='the key patterns are regular expressions')
+    parser.add_argument("--start", type=float, default=None)
+    parser.add_argument("--stop", type=float, default=None)
+    parser.add_argument("--phase", default=None, help='the match phase to extract, e.g. Teleop')
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    start = time.perf_counter()
+    phaseKeys = ['FMS Mode', sa.SESSION_LOG_KEY] if args.phase else []
+    robotTelemetry = ReadMatchingRows(telemetryFile, args.keys, args.regex, phaseKeys)
+    extracted = ExtractDataLog(robotTelemetry, args.keys, args.start, args.stop, args.phase, args.regex)
+    WriteDataLog(extracted, Path(args.output))
+    print(f'{extracted["Name"].nunique()} keys, {len(extracted)} samples extracted in '
+          f'{time.perf_counter() - start:.2f} s')
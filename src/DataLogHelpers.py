@@ -1,5 +1,10 @@
+import threading
 import pandas as pd
 
+""" pyplot keeps global state, so the analyses which run concurrently (see `DataLogPipeline.RunAnalyses`) only draw
+and save their figures while holding this lock."""
+PYPLOT_LOCK = threading.Lock()
+
 
 def GetStringColumn(df, base, telemetry):
     if base == '':
@@ -0,0 +1,250 @@
+import json
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+import BatteryHealth as bh
+import DataLogExtract as dle
+import DataLogHelpers as dlh
+import DataLogReader as dlr
+import EventDetection as ed
+import QuantileSketch as qsk
+import RobotSensors as rs
+import RunLengthSignals as rls
+import SessionStitch as sst
+import SignalAlignment as sa
+import SwerveModuleHoming as smh
+import SwerveOscillation as so
+sys.path.append(str(Path(__file__).resolve().parent / 'stoplight'))
+import StoplightSummary as ss  # noqa: E402
+
+OUTPUT_DIR = Path(__file__).resolve().parents[1] / 'output'
+
+
+class LoadedLog:
+    """A telemetry log which is parsed once and shared by every analysis.
+
+    The derived structures (key index, run-length index, phase index and wide tables) are built on first
+    use and cached, so each one is derived at most once no matter how many analyses
+    use it.
+
+    Attributes:
+        telemetryFile (:obj:`Path`): the robot telemetry file
+        robotTelemetry (:obj:`pd.DataFrame`): the [Timestamp,Name,Value] telemetry
+    """
+
+    def __init__(self, telemetryFile, robotTelemetry=None):
+        self.telemetryFile = Path(telemetryFile)
+        self.robotTelemetry = dlr.ReadDataLog(self.telemetryFile) if robotTelemetry is None else robotTelemetry
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    @property
+    def name(self):
+        return dlr.GetLogName(self.telemetryFile)
+
+    @property
+    def keyIndex(self):
+        return self._Cached('keyIndex', lambda: sa.BuildKeyIndex(self.robotTelemetry))
+
+    @property
+    def runLengthIndex(self):
+        return self._Cached('runLengthIndex', lambda: rls.DetectRunLengthKeys(self.keyIndex))
+
+    @property
+    def phaseIndex(self):
+        return self._Cached('phaseIndex', lambda: ed.GetPhaseIntervals(self.keyIndex))
+
+    def GetWideTable(self, keys, method='hold', tolerance=None, period=None):
+        """Get the keys aligned onto a common time base (see `AlignSignals`), cached per argument set."""
+        cacheKey = ('wideTable', tuple(keys), method, tolerance, period)
+        return self._Cached(cacheKey, lambda: sa.AlignSignals(self.keyIndex, list(keys), method=method,
+                                                              tolerance=tolerance, period=period))
+
+    def _Cached(self, cacheKey, build):
+        with self._lock:
+            if cacheKey not in self._cache:
+                self._cache[cacheKey] = build()
+            return self._cache[cacheKey]
+
+
+class LoadedSession(LoadedLog):
+    """The logs of one session stitched onto a single timeline (see `StitchDataLogs`), shared by every analysis.
+
+    The key index is merged from the key indexes of the logs, and the [Timestamp,Name,Value] telemetry is only built
+    from it when an analysis asks for it.
+
+    Not every analysis is session aware. The ones which look at consecutive samples or intervals cut at the log
+    boundaries (see `SignalAlignment.GetSegmentStarts`): `phases`, `sensors`, the loop period of `sketches` and
+    `homing`. The others (`stoplight`, `oscillation`, `battery` and the other sketches) treat the session as one long
+    log, so their rolling windows, gaps, stuck times and fits can span the time between two logs.
+
+    Attributes:
+        telemetryFiles (list): the robot telemetry files of the session
+        telemetryFile (:obj:`Path`): the first of the telemetry files
+        logs (:obj:`pd.DataFrame`): the start time and offset of each log (see `StitchDataLogs`)
+    """
+
+    def __init__(self, telemetryFiles, timeSource=None):
+        self.telemetryFiles = [Path(telemetryFile) for telemetryFile in telemetryFiles]
+        self.telemetryFile = self.telemetryFiles[0]
+        self._cache = {}
+        self._lock = threading.RLock()
+        self._cache['keyIndex'], self.logs = sst.StitchDataLogs(self.telemetryFiles, timeSource)
+
+    @property
+    def name(self):
+        return f'{self.logs["Log"].iloc[0]}_session'
+
+    @property
+    def robotTelemetry(self):
+        return self._Cached('robotTelemetry', lambda: dle.ExtractDataLog(self.keyIndex, ['*']))
+
+
+def _Stoplight(log, results, outputDir, plots):
+    ss.WriteStoplightSummary(log.keyIndex, outputDir, runLengthIndex=log.runLengthIndex)
+
+
+def _HomingData(log, results, outputDir, plots):
+    return smh.GetSwerveModuleHomingData(log.robotTelemetry)
+
+
+def _Homing(log, results, outputDir, plots):
+    stats = smh.ComputeSwerveModuleHomingStats(log.robotTelemetry, results['homingData'])
+    smh.WriteSwerveModuleHomingStats(stats, outputDir, log.telemetryFile.name)
+    if plots:
+        with dlh.PYPLOT_LOCK:
+            smh.PlotSwerveModuleHoming(log.robotTelemetry, outputDir, results['homingData'])
+    return stats
+
+
+def _Oscillation(log, results, outputDir, plots):
+    stats = so.ComputeSwerveOscillationStats(log.keyIndex)
+    so.WriteSwerveOscillationStats(stats, outputDir)
+    return stats
+
+
+def _Sensors(log, results, outputDir, plots):
+    stats = rs.ComputeLoopTimeStats(log.keyIndex)
+    with open(outputDir / 'sensor_stats.json', 'w') as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+def _Battery(log, results, outputDir, plots):
+    health = bh.EstimateBatteryHealth(log.keyIndex)
+    with open(outputDir / 'battery_health.json', 'w') as f:
+        json.dump(health, f, indent=2)
+    return health
+
+
+def _Sketches(log, results, outputDir, plots):
+    sketches = qsk.BuildKeySketches(log.keyIndex)
+    qsk.WriteKeySketches(sketches, outputDir)
+    return sketches
+
+
+def _Phases(log, results, outputDir, plots):
+    phases = {phase: {'Intervals': len(starts), 'Duration (s)': float((stops - starts).sum())}
+              for phase, (starts, stops) in log.phaseIndex.items()}
+    with open(outputDir / 'phases.json', 'w') as f:
+        json.dump(phases, f, indent=2)
+    return phases
+
+
+""" The analysis dependency graph. Each node runs once its `requires` nodes have finished, and the nodes which don't
+depend on each other run concurrently. The names in `ANALYSES` are the ones that can be selected on the command line,
+the others are intermediate results."""
+ANALYSIS_NODES = {
+    'stoplight':   {'func': _Stoplight,   'requires': []},
+    'homingData':  {'func': _HomingData,  'requires': []},
+    'homing':      {'func': _Homing,      'requires': ['homingData']},
+    'oscillation': {'func': _Oscillation, 'requires': []},
+    'sensors':     {'func': _Sensors,     'requires': []},
+    'battery':     {'func': _Battery,     'requires': []},
+    'sketches':    {'func': _Sketches,    'requires': []},
+    'phases':      {'func': _Phases,      'requires': []},
+}
+
+ANALYSES = ['stoplight', 'homing', 'oscillation', 'sensors', 'battery', 'sketches', 'phases']
+
+
+def RunAnalyses(log, analyses=ANALYSES, outputDir=OUTPUT_DIR, plots=False, maxWorkers=None):
+    """Run a set of analyses over a loaded log, running the independent ones concurrently.
+
+    Args:
+        log (:obj:`LoadedLog`): the loaded telemetry log
+        analyses (list): the names of the analyses to run, their dependencies are added automatically
+        outputDir (:obj:`Path`): the directory to write the analysis outputs to
+        plots (bool): save the optional plots of the analyses
+        maxWorkers (int): the maximum number of analyses to run at the same time
+
+    Returns:
+        results (dict): analysis name to its result, or to the exception it raised
+
+    Raises:
+        KeyError: if an analysis isn't in `ANALYSIS_NODES`
+    """
+
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+
+    # Add the dependencies of the selected analyses
+    selected = []
+    pending = list(analyses)
+    while pending:
+        name = pending.pop()
+        if name not in ANALYSIS_NODES:
+            raise KeyError(f"unknown analysis: {name}")
+        if name not in selected:
+            selected.append(name)
+            pending.extend(ANALYSIS_NODES[name]['requires'])
+
+    results = {}
+    running = {}
+    remaining = set(selected)
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        while remaining or running:
+            for name in sorted(remaining):
+                requires = ANALYSIS_NODES[name]['requires']
+                failed = [r for r in requires if isinstance(results.get(r), Exception)]
+                if failed:
+                    results[name] = RuntimeError(f"{failed[0]} failed: {results[failed[0]]!r}")
+                    remaining.discard(name)
+                elif all(r in results for r in requires):
+                    running[executor.submit(ANALYSIS_NODES[name]['func'], log, results, outputDir, plots)] = name
+                    remaining.discard(name)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = e
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import matplotlib.pyplot as plt
+
+    parser = argparse.ArgumentParser(description='Run the post-match analyses over a log which is parsed once')
+    parser.add_argument("telemetryfile", nargs='+', help='several files are stitched into one session')
+    parser.add_argument("--analyses", nargs='+', choices=ANALYSES, default=ANALYSES)
+    parser.add_argument("--output", default=str(OUTPUT_DIR), help='the per log outputs go in a sub-directory')
+    parser.add_argument("--plots", action='store_true', help='save the optional plots')
+    args = parser.parse_args()
+    telemetryFiles = [Path(telemetryFile) for telemetryFile in args.telemetryfile]
+    for telemetryFile in telemetryFiles:
+        if not telemetryFile.is_file():
+            raise OSError(2, 'File not found', telemetryFile)
+
+    plt.switch_backend('Agg')
+    log = LoadedLog(telemetryFiles[0]) if len(telemetryFiles) == 1 else LoadedSession(telemetryFiles)
+    results = RunAnalyses(log, args.analyses, Path(args.output) / log.name, args.plots)
+    for name in args.analyses:
+        status = f'failed, {results[name]!r}' if isinstance(results[name], Exception) else 'done'
+        print(f'{name}: {status}')
@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import time
+import pandas as pd
+from pathlib import Path
+
+""" The fixed schema of a WPILib Data Log Tool CSV export. Skipping type inference keeps the `Value` column as strings,
+which is what the `cFunc` conversion functions expect."""
+DATA_LOG_SCHEMA = {
+    'Timestamp': 'float64',
+    'Name': str,
+    'Value': str,
+}
+
+""" Logs at least this large (in bytes) are parsed with the multithreaded pyarrow engine when it is installed."""
+PYARROW_MIN_FILE_SIZE = 1024 * 1024
+
+""" Compressed logs are estimated to be this many times larger once decompressed when selecting the parser engine."""
+COMPRESSION_RATIO_ESTIMATE = 10
+
+""" The supported telemetry file extensions, raw CSV and the streaming compressed archive formats."""
+DATA_LOG_SUFFIXES = ('.csv', '.csv.gz', '.csv.zst', '.csv.xz')
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTANDARD_AVAILABLE = True
+except ImportError:
+    ZSTANDARD_AVAILABLE = False
+
+
+def IsDataLog(telemetryFile: Path):
+    """ Check if a file has one of the supported telemetry file extensions (`DATA_LOG_SUFFIXES`)."""
+    return Path(telemetryFile).name.lower().endswith(DATA_LOG_SUFFIXES)
+
+
+def GetLogName(telemetryFile: Path):
+    """ Get the name of a log without its extensions, e.g. `FRC_20221116_011206` for `FRC_20221116_011206.csv.gz`."""
+    return Path(telemetryFile).name.split('.')[0]
+
+
+def FindDataLogs(directory: Path):
+    """ Find the telemetry files in a directory, one per log sorted by name.
+
+    A log which is archived without deleting the original (see `DataLogArchive`) has several files with the same
+    `GetLogName`, the raw CSV is preferred and then the archives in the order of `DATA_LOG_SUFFIXES`.
+    """
+    logs = {}
+    for path in sorted(Path(directory).iterdir()):
+        if path.is_file() and IsDataLog(path):
+            logs.setdefault(GetLogName(path), []).append(path)
+    return sorted(min(paths, key=_SuffixRank) for paths in logs.values())
+
+
+def _SuffixRank(telemetryFile: Path):
+    name = Path(telemetryFile).name.lower()
+    return next(i for i, suffix in enumerate(DATA_LOG_SUFFIXES) if name.endswith(suffix))
+
+
+def OpenDataLog(telemetryFile: Path, binary: bool = False):
+    """ Open a raw or compressed telemetry file as a stream, decompressing as it is read.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+        binary: open a binary stream instead of a text stream
+
+    Returns:
+        stream: the text (or binary) stream, to be closed by the caller
+
+    Raises:
+        ImportError: if the file is zstandard compressed and the `zstandard` package isn't installed
+
+    """
+
+    suffix = Path(telemetryFile).suffix.lower()
+    if suffix == '.gz':
+        stream = gzip.open(telemetryFile, 'rb')
+    elif suffix == '.xz':
+        stream = lzma.open(telemetryFile, 'rb')
+    elif suffix == '.zst':
+        if not ZSTANDARD_AVAILABLE:
+            raise ImportError("the zstandard package is required to read .zst logs")
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(telemetryFile, 'rb'), closefd=True))
+    else:
+        stream = open(telemetryFile, 'rb')
+
+    return stream if binary else io.TextIOWrapper(stream, newline='')
+
+
+def HashDataLog(telemetryFile: Path, chunkSize: int = 1024 * 1024):
+    """ Get the SHA-256 of the decompressed contents of a telemetry file, a raw log and its archives hash the same."""
+    digest = hashlib.sha256()
+    with OpenDataLog(telemetryFile, binary=True) as stream:
+        for chunk in iter(lambda: stream.read(chunkSize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def SelectEngine(telemetryFile: Path):
+    """ Select the CSV parser engine for a telemetry file.
+
+    The pyarrow engine parses blocks of the file on all cores, but has a startup cost that makes it slower than the C
+    engine for small files.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+
+    Returns:
+        engine: 'pyarrow' or 'c'
+
+    Raises:
+        None
+
+    """
+
+    fileSize = os.path.getsize(telemetryFile)
+    if Path(telemetryFile).suffix.lower() != '.csv':
+        fileSize *= COMPRESSION_RATIO_ESTIMATE
+    if PYARROW_AVAILABLE and fileSize >= PYARROW_MIN_FILE_SIZE:
+        return 'pyarrow'
+    return 'c'
+
+
+def ReadDataLog(telemetryFile: Path, engine: str = None):
+    """ Read a WPILib Data Log Tool CSV export into a pandas dataframe.
+
+    The `.csv.gz`, `.csv.zst` and `.csv.xz` archives are decompressed as they are parsed.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+        engine: Force a parser engine ('pyarrow' or 'c'), by default it is selected by the file size
+
+    Returns:
+        robotTelemetry: Pandas dataframe with the [Timestamp,Name,Value] columns
+
+    Raises:
+        ValueError: if the requested engine isn't supported
+        ImportError: if the file is zstandard compressed and the `zstandard` package isn't installed
+
+    """
+
+    if engine is None:
+        engine = SelectEngine(telemetryFile)
+    if engine not in ('pyarrow', 'c'):
+        raise ValueError(f"unsupported CSV engine: {engine}")
+    if engine == 'pyarrow' and not PYARROW_AVAILABLE:
+        engine = 'c'
+
+    if Path(telemetryFile).suffix.lower() == '.zst' and not ZSTANDARD_AVAILABLE:
+        raise ImportError("the zstandard package is required to read .zst logs")
+
+    return pd.read_csv(str(telemetryFile), engine=engine, dtype=DATA_LOG_SCHEMA,
+                       usecols=list(DATA_LOG_SCHEMA.keys()), compression='infer')
+
+
+def ReadDataLogChunks(telemetryFile: Path, chunkSize: int = 1000000):
+    """ Read a raw or compressed telemetry file as a stream of dataframes, to read a log of any size in bounded memory.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+        chunkSize: the number of rows in each dataframe
+
+    Returns:
+        chunks: iterator of Pandas dataframes with the [Timestamp,Name,Value] columns
+
+    Raises:
+        ImportError: if the file is zstandard compressed and the `zstandard` package isn't installed
+
+    """
+
+    if Path(telemetryFile).suffix.lower() == '.zst' and not ZSTANDARD_AVAILABLE:
+        raise ImportError("the zstandard package is required to read .zst logs")
+
+    with pd.read_csv(str(telemetryFile), engine='c', dtype=DATA_LOG_SCHEMA, usecols=list(DATA_LOG_SCHEMA.keys()),
+                     compression='infer', chunksize=chunkSize) as reader:
+        yield from reader
+
+
+def BenchmarkDataLogReaders(telemetryFile: Path, repeat: int = 3):
+    """ Time the available CSV ingestion paths against the original `pd.read_csv` call.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+        repeat: Number of times each reader is run, the best time is reported
+
+    Returns:
+        timings: Dictionary of reader name to the best time in seconds
+
+    Raises:
+        None
+
+    """
+
+    readers = {
+        'default': lambda: pd.read_csv(str(telemetryFile)),
+        'c': lambda: ReadDataLog(telemetryFile, engine='c'),
+    }
+    if PYARROW_AVAILABLE:
+        readers['pyarrow'] = lambda: ReadDataLog(telemetryFile, engine='pyarrow')
+
+    timings = {}
+    for name, reader in readers.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            reader()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+
+    return timings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the telemetry CSV readers')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    print(f'{telemetryFile.name}: {os.path.getsize(telemetryFile) / 1e6:.1f} MB, '
+          f'selected engine: {SelectEngine(telemetryFile)}')
+    for name, seconds in BenchmarkDataLogReaders(telemetryFile, args.repeat).items():
+        print(f'{name:>8}: {1000 * seconds:.1f} ms')
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import DataLogPipeline as dlp
+import DataLogReader as dlr
+
+""" How often (in seconds) the log directory is scanned for new files."""
+POLL_INTERVAL = 0.5
+
+""" A log is processed once its size and modification time haven't changed for this many seconds, so files which are
+still being copied or written by the Data Log Tool aren't read half finished."""
+STABLE_TIME = 2.0
+
+""" The manifest of processed logs in the output directory, keyed by the content hash of each log. It records the
+result of each analysis, and the analyses which failed (or weren't run) are run again the next time the log is seen."""
+MANIFEST_NAME = 'processed.json'
+
+
+class DataLogWatcher:
+    """Watches a log directory and runs the analyses on each new log as soon as it has finished being written.
+
+    Stable logs are queued and processed by a bounded number of worker processes. Each log is identified by the hash
+    of its decompressed contents, so copies of a log (including its archives) and logs processed by an earlier run of
+    the watcher are skipped once all of their analyses have succeeded.
+
+    Attributes:
+        logDir (:obj:`Path`): the directory to watch
+        outputDir (:obj:`Path`): the outputs of each log go in a sub-directory named after the log
+        analyses (list): the `DataLogPipeline` analyses to run on each log
+        maxConcurrent (int): the maximum number of logs processed at the same time
+        manifest (dict): content hash to the record of each processed log
+    """
+
+    def __init__(self, logDir, outputDir=dlp.OUTPUT_DIR, analyses=('stoplight',), maxConcurrent=2,
+                 pollInterval=POLL_INTERVAL, stableTime=STABLE_TIME):
+        self.logDir = Path(logDir)
+        self.outputDir = Path(outputDir)
+        self.analyses = list(analyses)
+        self.maxConcurrent = maxConcurrent
+        self.pollInterval = pollInterval
+        self.stableTime = stableTime
+        self.manifestFile = self.outputDir / MANIFEST_NAME
+        self.manifest = json.loads(self.manifestFile.read_text()) if self.manifestFile.is_file() else {}
+
+        self._pending = {}   # path to ((size, mtime), time it was first seen with that size and mtime)
+        self._handled = {}   # path to the (size, mtime) it was queued with
+        self._hashing = set()
+
+    async def Run(self, once=False):
+        """Watch the log directory until cancelled, or process the logs already in it and return if `once`."""
+        queue = asyncio.Queue()
+        with ProcessPoolExecutor(max_workers=self.maxConcurrent, initializer=_InitWorker) as executor:
+            workers = [asyncio.create_task(self._Worker(queue, executor)) for _ in range(self.maxConcurrent)]
+            try:
+                if once:
+                    for telemetryFile in dlr.FindDataLogs(self.logDir):
+                        self._handled[telemetryFile] = _Signature(telemetryFile)
+                        queue.put_nowait(telemetryFile)
+                    await queue.join()
+                else:
+                    while True:
+                        for telemetryFile in self._Scan():
+                            queue.put_nowait(telemetryFile)
+                        await asyncio.sleep(self.pollInterval)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    def _Scan(self):
+        """Get the logs which have become stable since the last scan."""
+        now = time.monotonic()
+        stable = []
+        for telemetryFile in dlr.FindDataLogs(self.logDir):
+            try:
+                signature = _Signature(telemetryFile)
+            except FileNotFoundError:
+                continue
+            if self._handled.get(telemetryFile) == signature:
+                continue
+            lastSignature, since = self._pending.get(telemetryFile, (None, now))
+            if signature != lastSignature:
+                self._pending[telemetryFile] = (signature, now)
+            elif now - since >= self.stableTime and signature[0] > 0:
+                del self._pending[telemetryFile]
+                self._handled[telemetryFile] = signature
+                stable.append(telemetryFile)
+        return stable
+
+    async def _Worker(self, queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            telemetryFile = await queue.get()
+            try:
+                await self._Process(loop, executor, telemetryFile)
+            except Exception as e:
+                print(f'{telemetryFile.name}: failed, {e!r}')
+            finally:
+                queue.task_done()
+
+    async def _Process(self, loop, executor, telemetryFile):
+        # Hashing is I/O bound, so it runs on a thread while the analyses run in the worker processes
+        contentHash = await loop.run_in_executor(None, dlr.HashDataLog, telemetryFile)
+        record = self.manifest.get(contentHash, {'results': {}})
+        analyses = [name for name in self.analyses if record['results'].get(name) != 'done']
+        if not analyses or contentHash in self._hashing:
+            print(f'{telemetryFile.name}: skipped, already processed')
+            return
+        self._hashing.add(contentHash)
+        try:
+            start = time.perf_counter()
+            logDir = self.outputDir / dlr.GetLogName(telemetryFile)
+            results = await loop.run_in_executor(executor, _ProcessLog, telemetryFile, logDir, analyses)
+            # Keep the analyses which already succeeded, so only the failed ones are run again
+            self.manifest[contentHash] = {'log': telemetryFile.name, 'output': str(logDir),
+                                          'results': {**record['results'], **results}}
+            self._WriteManifest()
+            print(f'{telemetryFile.name}: {results} in {time.perf_counter() - start:.1f} s')
+        finally:
+            self._hashing.discard(contentHash)
+
+    def _WriteManifest(self):
+        # Write then rename so an interrupted watcher never leaves a truncated manifest
+        self.outputDir.mkdir(parents=True, exist_ok=True)
+        tmpFile = self.manifestFile.with_suffix('.tmp')
+        tmpFile.write_text(json.dumps(self.manifest, indent=2))
+        os.replace(tmpFile, self.manifestFile)
+
+
+def _Signature(telemetryFile):
+    stat = telemetryFile.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _InitWorker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _ProcessLog(telemetryFile, outputDir, analyses):
+    results = dlp.RunAnalyses(dlp.LoadedLog(telemetryFile), analyses, outputDir)
+    return {name: repr(results[name]) if isinstance(results[name], Exception) else 'done' for name in analyses}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Watch a log directory and analyze each new log as it arrives')
+    parser.add_argument("logdir")
+    parser.add_argument("--output", default=str(dlp.OUTPUT_DIR), help='the per log outputs go in a sub-directory')
+    parser.add_argument("--analyses", nargs='+', choices=dlp.ANALYSES, default=['stoplight'])
+    parser.add_argument("--jobs", type=int, default=2, help='the maximum number of logs processed at the same time')
+    parser.add_argument("--stable-time", type=float, default=STABLE_TIME)
+    parser.add_argument("--once", action='store_true', help='process the logs already in the directory and exit')
+    args = parser.parse_args()
+    logDir = Path(args.logdir)
+    if not logDir.is_dir():
+        raise OSError(2, 'Directory not found', logDir)
+
+    watcher = DataLogWatcher(logDir, args.output, args.analyses, args.jobs, stableTime=args.stable_time)
+    try:
+        asyncio.run(watcher.Run(args.once))
+    except KeyboardInterrupt:
+        pass
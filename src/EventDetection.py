@@ -0,0 +1,314 @@
+import numpy as np
+import pandas as pd
+import SignalAlignment as sa
+
+INTERVAL_REDUCERS = ('max', 'min', 'mean', 'count')
+
+
+def FindIntervals(timestamps: np.ndarray, condition: np.ndarray, segments: np.ndarray = None):
+    """ Turn a boolean condition sampled at sorted timestamps into intervals where the condition is true.
+
+    An interval starts at the first sample where the condition is true and stops at the first sample where it is false
+    again. An interval which is still open at the end of the signal, or of its segment, stops at its last sample.
+
+    Args:
+        timestamps: Numpy float array of sorted timestamps
+        condition: Numpy boolean array of the condition at each timestamp
+        segments: optional Numpy int array of the segment of each timestamp (see `SignalAlignment.SegmentIndex`), the
+            intervals are split where the segment changes
+
+    Returns:
+        starts: Numpy float array of interval start timestamps
+        stops: Numpy float array of interval stop timestamps
+
+    Raises:
+        ValueError: if the timestamps and condition aren't the same length
+
+    """
+
+    if len(timestamps) != len(condition):
+        raise ValueError("expected the timestamps and condition to be the same length")
+    if len(timestamps) == 0:
+        return np.empty(0), np.empty(0)
+
+    condition = np.asarray(condition, dtype=bool)
+    # Whether each sample is the last one of its segment (or of the signal)
+    segmentEnd = np.zeros(len(condition), dtype=bool) if segments is None else \
+        np.concatenate((segments[1:] != segments[:-1], [False]))
+    segmentEnd[-1] = True
+    startIdx = np.flatnonzero(condition & ~np.concatenate(([False], condition[:-1] & ~segmentEnd[:-1])))
+    lastIdx = np.flatnonzero(condition & (segmentEnd | ~np.concatenate((condition[1:], [False]))))
+    stopIdx = np.where(segmentEnd[lastIdx], lastIdx, lastIdx + 1)
+
+    return timestamps[startIdx], timestamps[stopIdx]
+
+
+def ThresholdIntervals(timestamps: np.ndarray, values: np.ndarray, threshold: float, below: bool = True,
+                       segments: np.ndarray = None):
+    """ Find the intervals where a signal is below (or above) a threshold.
+
+    Args:
+        timestamps: Numpy float array of sorted timestamps
+        values: Numpy float array of values
+        threshold: the threshold
+        below: True for the intervals below the threshold, False for the intervals above it
+        segments: optional Numpy int array of the segment of each timestamp, see `FindIntervals`
+
+    Returns:
+        starts: Numpy float array of interval start timestamps
+        stops: Numpy float array of interval stop timestamps
+
+    Raises:
+        None
+
+    """
+
+    condition = values < threshold if below else values > threshold
+    return FindIntervals(timestamps, condition, segments)
+
+
+def IncrementEvents(timestamps: np.ndarray, values: np.ndarray):
+    """ Find the timestamps where a cumulative counter (e.g. `RoboRio CAN Tx Error Count`) increments.
+
+    Args:
+        timestamps: Numpy float array of sorted timestamps
+        values: Numpy float array of counter values
+
+    Returns:
+        eventTimes: Numpy float array of the timestamps where the counter incremented
+        increments: Numpy float array of the amount of each increment
+
+    Raises:
+        None
+
+    """
+
+    steps = np.diff(values)
+    idx = np.flatnonzero(steps > 0)
+    return timestamps[idx + 1], steps[idx]
+
+
+def EventWindows(eventTimes: np.ndarray, before: float, after: float = 0.0):
+    """ Build intervals around events, e.g. the 2 s before each CAN bus-off.
+
+    Args:
+        eventTimes: Numpy float array of event timestamps
+        before: time (in seconds) before each event
+        after: time (in seconds) after each event
+
+    Returns:
+        starts: Numpy float array of interval start timestamps
+        stops: Numpy float array of interval stop timestamps
+
+    Raises:
+        None
+
+    """
+
+    return eventTimes - before, eventTimes + after
+
+
+def IntervalReduce(starts: np.ndarray, stops: np.ndarray, timestamps: np.ndarray, values: np.ndarray,
+                   reducer: str = 'max'):
+    """ Reduce a signal over each interval, e.g. the peak total current during each brownout.
+
+    The samples in each interval are located with a binary search over the sorted timestamps and reduced with a single
+    `reduceat`, so this stays linear in the number of samples. The intervals may overlap.
+
+    Args:
+        starts: Numpy float array of interval start timestamps (inclusive)
+        stops: Numpy float array of interval stop timestamps (inclusive)
+        timestamps: Numpy float array of sorted sample timestamps
+        values: Numpy float array of sample values
+        reducer: 'max', 'min', 'mean' or 'count'
+
+    Returns:
+        reduced: Numpy float array with a value per interval, NaN for intervals without samples
+
+    Raises:
+        ValueError: if the reducer isn't supported
+
+    """
+
+    if reducer not in INTERVAL_REDUCERS:
+        raise ValueError(f"expected one of {INTERVAL_REDUCERS} for reducer")
+
+    lo = np.searchsorted(timestamps, starts, side='left')
+    hi = np.searchsorted(timestamps, stops, side='right')
+    counts = (hi - lo).astype(np.float64)
+    if reducer == 'count':
+        return counts
+
+    reduced = np.full(len(starts), np.nan)
+    nonEmpty = hi > lo
+    if not nonEmpty.any():
+        return reduced
+
+    if reducer == 'mean':
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+        reduced[nonEmpty] = (cumsum[hi] - cumsum[lo])[nonEmpty] / counts[nonEmpty]
+        return reduced
+
+    # Interleave the bounds so every other reduceat segment is an interval, the padding makes `hi == len` valid
+    ufunc = np.maximum if reducer == 'max' else np.minimum
+    padded = np.concatenate((values, [np.nan]))
+    bounds = np.column_stack((lo[nonEmpty], hi[nonEmpty])).ravel()
+    reduced[nonEmpty] = ufunc.reduceat(padded, bounds)[::2]
+
+    return reduced
+
+
+def OverlapIntervals(aStarts: np.ndarray, aStops: np.ndarray, bStarts: np.ndarray, bStops: np.ndarray):
+    """ Find the pairs of overlapping intervals between two interval sets.
+
+    The `b` intervals must be sorted and not overlap each other (as returned by `FindIntervals`).
+
+    Args:
+        aStarts: Numpy float array of the `a` interval start timestamps
+        aStops: Numpy float array of the `a` interval stop timestamps
+        bStarts: Numpy float array of the sorted `b` interval start timestamps
+        bStops: Numpy float array of the sorted `b` interval stop timestamps
+
+    Returns:
+        aIdx: Numpy int array of the `a` interval of each overlapping pair
+        bIdx: Numpy int array of the `b` interval of each overlapping pair
+        overlap: Numpy float array of the overlap duration (in seconds) of each pair
+
+    Raises:
+        None
+
+    """
+
+    first = np.searchsorted(bStops, aStarts, side='left')
+    last = np.searchsorted(bStarts, aStops, side='right')
+    counts = np.maximum(last - first, 0)
+
+    aIdx = np.repeat(np.arange(len(aStarts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    bIdx = np.repeat(first, counts) + offsets
+    overlap = np.minimum(aStops[aIdx], bStops[bIdx]) - np.maximum(aStarts[aIdx], bStarts[bIdx])
+
+    return aIdx, bIdx, overlap
+
+
+def GetPhaseIntervals(source, key: str = 'FMS Mode'):
+    """ Get the intervals of each match phase (`Disabled`, `Auto`, `Teleop`, ...) from the FMS mode telemetry.
+
+    Each phase lasts until the next mode change, the last one lasts until the end of the log. In a stitched session
+    each log starts a new phase and the last phase of a log lasts until the end of that log (see
+    `SignalAlignment.GetSegmentStarts`), so a phase never spans the gap between two logs.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        key: the FMS mode telemetry key
+
+    Returns:
+        phaseIntervals: Dictionary of phase name to a (starts, stops) tuple of numpy float arrays
+
+    Raises:
+        None
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, [key, sa.SESSION_LOG_KEY])
+    if key not in keyIndex:
+        return {}
+    segmentStarts = sa.GetSegmentStarts(keyIndex)
+    segmentEnds = sa.GetSegmentEnds(source, segmentStarts)
+
+    timestamps, modes = keyIndex[key]
+    segments = sa.SegmentIndex(segmentStarts, timestamps)
+    changes = np.concatenate(([True], (modes[1:] != modes[:-1]) | (segments[1:] != segments[:-1])))
+    starts, segments, modes = timestamps[changes], segments[changes], modes[changes]
+    sameSegment = np.concatenate((segments[1:] == segments[:-1], [False]))
+    stops = np.where(sameSegment, np.append(starts[1:], np.nan), segmentEnds[segments])
+
+    return {mode: (starts[modes == mode], stops[modes == mode]) for mode in pd.unique(modes)}
+
+
+def BrownoutPeakCurrent(source, brownoutKey: str = 'RoboRio Browned Out', currentKey: str = 'PDH Total Current (A)'):
+    """ Get the peak total current during each brownout.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        brownoutKey: the browned out telemetry key
+        currentKey: the total current telemetry key
+
+    Returns:
+        brownouts: Pandas dataframe with the `Start`, `Stop` and `Peak Current (A)` of each brownout
+
+    Raises:
+        KeyError: if a key isn't in the telemetry
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, [brownoutKey, currentKey,
+                                                                                  sa.SESSION_LOG_KEY])
+    timestamps, brownedOut = _BooleanSignal(keyIndex, brownoutKey)
+    starts, stops = FindIntervals(timestamps, brownedOut, sa.SegmentIndex(sa.GetSegmentStarts(keyIndex), timestamps))
+    timestamps, current = sa.GetSignal(keyIndex, currentKey)
+
+    return pd.DataFrame({
+        'Start': starts,
+        'Stop': stops,
+        'Peak Current (A)': IntervalReduce(starts, stops, timestamps, current, 'max'),
+    })
+
+
+def CanUtilizationBeforeBusOff(source, window: float = 2.0, busOffKey: str = 'RoboRio CAN Off Count',
+                               utilizationKey: str = 'RoboRio CAN Utilization'):
+    """ Get the CAN utilization in the window before each CAN bus-off.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        window: time (in seconds) before each bus-off
+        busOffKey: the CAN off count telemetry key
+        utilizationKey: the CAN utilization telemetry key
+
+    Returns:
+        busOffs: Pandas dataframe with the `Timestamp`, `Increment`, `Mean Utilization` and `Max Utilization` of each
+            bus-off
+
+    Raises:
+        KeyError: if a key isn't in the telemetry
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, [busOffKey, utilizationKey])
+    eventTimes, increments = IncrementEvents(*sa.GetSignal(keyIndex, busOffKey))
+    starts, stops = EventWindows(eventTimes, window)
+    timestamps, utilization = sa.GetSignal(keyIndex, utilizationKey)
+
+    return pd.DataFrame({
+        'Timestamp': eventTimes,
+        'Increment': increments,
+        'Mean Utilization': IntervalReduce(starts, stops, timestamps, utilization, 'mean'),
+        'Max Utilization': IntervalReduce(starts, stops, timestamps, utilization, 'max'),
+    })
+
+
+def _BooleanSignal(keyIndex, key):
+    timestamps, values = sa.GetSignal(keyIndex, key)
+    return timestamps, values > 0.5
+
+
+if __name__ == "__main__":
+    import argparse
+    import DataLogReader as dlr
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Correlate fault events with the robot load')
+    parser.add_argument("telemetryfile")
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    keyIndex = sa.BuildKeyIndex(dlr.ReadDataLog(telemetryFile))
+    for phase, (starts, stops) in GetPhaseIntervals(keyIndex).items():
+        print(f'{phase}: {(stops - starts).sum():.1f} s over {len(starts)} interval(s)')
+    for title, analysis in (('Brownouts', BrownoutPeakCurrent), ('CAN bus-offs', CanUtilizationBeforeBusOff)):
+        try:
+            print(f'{title}:\n{analysis(keyIndex)}')
+        except KeyError as e:
+            print(f'{title}: {e}')
@@ -0,0 +1,146 @@
+import difflib
+import sys
+import pandas as pd
+from pathlib import Path
+import DataLogReader as dlr
+import SwerveModuleHoming as smh
+sys.path.append(str(Path(__file__).resolve().parent / 'stoplight'))
+import TelemetryKeys as tk  # noqa: E402
+
+""" The keys the analyses expect, by the group they are reported under. The stoplight keys come from `TelemetryKeys`
+and the swerve keys from `SwerveModuleHoming`, so this list can't drift from the keys the analyses actually use."""
+EXPECTED_KEYS = {
+    'RoboRio': list(tk.ROBORIO_TELEMETRY_KEYS.keys()) + ['FMS Mode'],
+    'PH': list(tk.PH_TELEMETRY_KEYS.keys()),
+    'PDH': list(tk.PDH_TELEMETRY_KEYS.keys()),
+    'Swerve': [f'{base} {key}' for base in smh.BASE_KEYS for key in smh.TELEMETRY_KEYS.keys()],
+}
+
+""" How similar (0 to 1) a logged key has to be to a missing key to be suggested as the match."""
+SUGGESTION_CUTOFF = 0.8
+
+_BOOLEAN_VALUES = ['true', 'false']
+
+
+def ScanKeyCatalog(telemetryFile: Path, chunkSize: int = 1000000):
+    """ Catalog the keys of a log in one streaming pass, without loading the whole log into memory.
+
+    Args:
+        telemetryFile: Path to the robot telemetry file
+        chunkSize: the number of rows parsed at a time
+
+    Returns:
+        catalog: Pandas dataframe indexed by key with the `Count`, `Type`, `Start`, `Stop`, `Span (s)` and
+            `Rate (Hz)` of each key. The type is boolean, numeric, string, mixed (numeric and string) or empty
+
+    Raises:
+        None
+
+    """
+
+    partials = []
+    for chunk in dlr.ReadDataLogChunks(telemetryFile, chunkSize):
+        values = chunk['Value']
+        isBoolean = values.isin(_BOOLEAN_VALUES)
+        isNumeric = pd.to_numeric(values, errors='coerce').notna()
+        flags = pd.DataFrame({
+            'Name': chunk['Name'],
+            'Timestamp': chunk['Timestamp'],
+            'Boolean': isBoolean,
+            'Numeric': isNumeric,
+            'String': values.notna() & ~isBoolean & ~isNumeric,
+        })
+        partials.append(flags.groupby('Name', sort=False).agg(
+            Count=('Timestamp', 'size'), Start=('Timestamp', 'min'), Stop=('Timestamp', 'max'),
+            Boolean=('Boolean', 'sum'), Numeric=('Numeric', 'sum'), String=('String', 'sum')))
+
+    if not partials:
+        return pd.DataFrame(columns=['Count', 'Type', 'Start', 'Stop', 'Span (s)', 'Rate (Hz)'])
+
+    # Each chunk only holds one row per key, so combining them is cheap
+    catalog = pd.concat(partials).groupby(level=0).agg(
+        {'Count': 'sum', 'Start': 'min', 'Stop': 'max', 'Boolean': 'sum', 'Numeric': 'sum', 'String': 'sum'})
+    catalog['Type'] = 'empty'
+    catalog.loc[catalog['Numeric'] > 0, 'Type'] = 'numeric'
+    catalog.loc[(catalog['Boolean'] > 0) & (catalog['Numeric'] == 0), 'Type'] = 'boolean'
+    catalog.loc[catalog['String'] > 0, 'Type'] = 'string'
+    catalog.loc[(catalog['String'] > 0) & (catalog['Numeric'] > 0), 'Type'] = 'mixed'
+    catalog['Span (s)'] = catalog['Stop'] - catalog['Start']
+    catalog['Rate (Hz)'] = (catalog['Count'] - 1) / catalog['Span (s)'].where(catalog['Span (s)'] > 0)
+    catalog.index.name = 'Key'
+
+    return catalog[['Count', 'Type', 'Start', 'Stop', 'Span (s)', 'Rate (Hz)']].sort_index()
+
+
+def SuggestKey(key: str, loggedKeys, cutoff: float = SUGGESTION_CUTOFF):
+    """ Suggest the logged key that a missing key was most likely meant to be, None if nothing is close.
+
+    Keys that only differ in whitespace or case (e.g. `' Pressure (psi)'` for `'Pressure (psi)'`) always match,
+    otherwise the closest key by `difflib` similarity is suggested.
+    """
+    normalized = _NormalizeKey(key)
+    for loggedKey in loggedKeys:
+        if _NormalizeKey(loggedKey) == normalized:
+            return loggedKey
+    matches = difflib.get_close_matches(key, list(loggedKeys), n=1, cutoff=cutoff)
+    return matches[0] if matches else None
+
+
+def ValidateKeys(catalog: pd.DataFrame, expectedKeys: dict = EXPECTED_KEYS):
+    """ Check that the keys the analyses expect are in a log.
+
+    Args:
+        catalog: the key catalog from `ScanKeyCatalog`
+        expectedKeys: group name to the list of keys expected in the log
+
+    Returns:
+        report: Pandas dataframe with the `Group`, `Key`, `Found` and `Suggestion` of each expected key, the
+            suggestion is the closest logged key for the keys which weren't found
+
+    Raises:
+        None
+
+    """
+
+    loggedKeys = set(catalog.index)
+    rows = []
+    for group, keys in expectedKeys.items():
+        for key in keys:
+            found = key in loggedKeys
+            rows.append({'Group': group, 'Key': key, 'Found': found,
+                         'Suggestion': None if found else SuggestKey(key, loggedKeys)})
+    return pd.DataFrame(rows, columns=['Group', 'Key', 'Found', 'Suggestion'])
+
+
+def _NormalizeKey(key):
+    return ' '.join(key.split()).casefold()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='List the keys of a log and check the keys the analyses expect')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("--missing-only", action='store_true', help="only report the expected keys that weren't found")
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    start = time.perf_counter()
+    catalog = ScanKeyCatalog(telemetryFile)
+    elapsed = time.perf_counter() - start
+    if not args.missing_only:
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200,
+                               'display.float_format', '{:.3f}'.format):
+            print(catalog)
+        print()
+
+    report = ValidateKeys(catalog)
+    missing = report[~report['Found']]
+    for row in missing.itertuples():
+        suggestion = f", did you mean {row.Suggestion!r}?" if pd.notna(row.Suggestion) else ''
+        print(f'{row.Group}: missing {row.Key!r}{suggestion}')
+    print(f'{len(catalog)} keys scanned in {elapsed:.2f} s, {len(report) - len(missing)} of {len(report)} '
+          f'expected keys found')
@@ -0,0 +1,82 @@
+import numpy as np
+
+""" Each pyramid level merges this many buckets of the level below."""
+PYRAMID_FACTOR = 4
+
+
+class MinMaxPyramid:
+    """A multi-resolution min/max summary of a signal for fast, peak preserving plotting.
+
+    Level 0 is the raw signal. Each level above it splits the signal into buckets of
+    `PYRAMID_FACTOR` times as many samples and keeps the minimum and maximum of each
+    bucket with the timestamps where they occur. Drawing the min and max of every
+    bucket keeps every peak visible no matter how far the plot is zoomed out.
+
+    Attributes:
+        timestamps (:obj:`np.ndarray`): the sorted raw timestamps
+        values (:obj:`np.ndarray`): the raw values
+        levels (list): a (minTimes, mins, maxTimes, maxs) tuple of arrays for each level above the raw signal
+    """
+
+    def __init__(self, timestamps, values, factor=PYRAMID_FACTOR):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.factor = factor
+        self.levels = []
+
+        minTimes, mins, maxTimes, maxs = self.timestamps, self.values, self.timestamps, self.values
+        while len(mins) > factor:
+            minTimes, mins = _ReduceLevel(minTimes, mins, factor, np.argmin, np.inf)
+            maxTimes, maxs = _ReduceLevel(maxTimes, maxs, factor, np.argmax, -np.inf)
+            self.levels.append((minTimes, mins, maxTimes, maxs))
+
+    def Query(self, startTime, stopTime, maxPoints):
+        """Get the points to draw for a visible time range.
+
+        The finest level with at most `maxPoints` buckets in the range is used, so the
+        cost depends on the screen width and not on the number of samples.
+
+        Args:
+            startTime (float): the start of the visible range
+            stopTime (float): the end of the visible range
+            maxPoints (int): the number of points that can be shown, e.g. the plot width in pixels
+
+        Returns:
+            x (:obj:`np.ndarray`): the timestamps to draw
+            y (:obj:`np.ndarray`): the values to draw
+        """
+
+        # Include one sample either side of the range so the line runs to the edges of the plot
+        lo = max(np.searchsorted(self.timestamps, startTime, side='left') - 1, 0)
+        hi = min(np.searchsorted(self.timestamps, stopTime, side='right') + 1, len(self.timestamps))
+        if hi - lo <= maxPoints or not self.levels:
+            return self.timestamps[lo:hi], self.values[lo:hi]
+
+        level = 0
+        bucketSize = self.factor
+        while level + 1 < len(self.levels) and (hi - lo) / bucketSize > maxPoints:
+            level += 1
+            bucketSize *= self.factor
+
+        minTimes, mins, maxTimes, maxs = self.levels[level]
+        first, last = lo // bucketSize, -(-hi // bucketSize)
+        minTimes, mins = minTimes[first:last], mins[first:last]
+        maxTimes, maxs = maxTimes[first:last], maxs[first:last]
+
+        # Emit the min and max of each bucket in time order
+        minFirst = minTimes <= maxTimes
+        x = np.column_stack((np.where(minFirst, minTimes, maxTimes), np.where(minFirst, maxTimes, minTimes))).ravel()
+        y = np.column_stack((np.where(minFirst, mins, maxs), np.where(minFirst, maxs, mins))).ravel()
+        return x, y
+
+
+def _ReduceLevel(times, values, factor, argReduce, padValue):
+    numBuckets = -(-len(values) // factor)
+    padding = numBuckets * factor - len(values)
+    values = np.concatenate((values, np.full(padding, padValue))).reshape(numBuckets, factor)
+    times = np.concatenate((times, np.full(padding, times[-1]))).reshape(numBuckets, factor)
+
+    # NaN samples never win a bucket
+    idx = argReduce(np.where(np.isnan(values), padValue, values), axis=1)
+    rows = np.arange(numBuckets)
+    return times[rows, idx], values[rows, idx]
@@ -0,0 +1,223 @@
+import json
+import zlib
+import numpy as np
+import SignalAlignment as sa
+from pathlib import Path
+
+""" The size of the sketches. The rank error shrinks roughly as 1/k and a sketch holds about 3k values."""
+SKETCH_K = 200
+
+""" The derived loop period key, sketched from the timestamps of `RobotSensors.LOOP_TIME_KEY`. RobotSensors is only
+imported to build the sketches, it pulls in scipy and pyplot which the merge CLI doesn't need."""
+LOOP_PERIOD_KEY = 'Loop Period (ms)'
+
+_COMPACTOR_RATIO = 2 / 3
+
+
+class KllSketch:
+    """A mergeable KLL quantile sketch of a stream of values.
+
+    Values are kept in compactors, an item at level `h` stands for `2**h` values. When a level holds more items than
+    its capacity it is sorted and every other item (starting at a random offset) moves up a level, so memory stays
+    bounded no matter how many values are added. The offsets come from `seed`, so the same values and seed give the
+    same sketch. Sketches of different logs merge by joining their levels and compacting, and the quantiles of a merge
+    have the same error bound as those of one sketch over all of the values.
+
+    Attributes:
+        k (int): the size of the sketch
+        n (int): the number of values added
+        minimum (float): the smallest value added
+        maximum (float): the largest value added
+        levels (list): the Numpy float array of the items at each level
+    """
+
+    def __init__(self, k=SKETCH_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def Update(self, values):
+        """Add an array of values, NaNs are skipped."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.n += int(values.size)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._Compress()
+        return self
+
+    def Merge(self, other):
+        """Merge another sketch into this one."""
+        if other.n == 0:
+            return self
+        self.n += other.n
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], items))
+        self._Compress()
+        return self
+
+    def Quantile(self, q):
+        """Get the approximate value at a quantile (0 to 1) or an array of quantiles, NaN for an empty sketch."""
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = np.asarray(q, dtype=np.float64) * cumulative[-1]
+        values = items[np.minimum(np.searchsorted(cumulative, ranks, side='left'), len(items) - 1)]
+        values = np.clip(values, self.minimum, self.maximum)
+        return values if np.ndim(q) else float(values)
+
+    def RankError(self):
+        """Get the approximate normalized rank error of a quantile at 99% confidence (see `NormalizedRankError`)."""
+        return NormalizedRankError(self.k)
+
+    def ToDict(self):
+        """Serialize the sketch to a JSON friendly dictionary."""
+        return {'k': self.k, 'n': self.n, 'min': self.minimum if self.n else None,
+                'max': self.maximum if self.n else None, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def FromDict(cls, sketchDict, seed=None):
+        """Load a sketch serialized with `ToDict`, `seed` seeds its later compactions."""
+        sketch = cls(sketchDict['k'], seed)
+        sketch.n = sketchDict['n']
+        if sketch.n:
+            sketch.minimum, sketch.maximum = sketchDict['min'], sketchDict['max']
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in sketchDict['levels']] or [np.empty(0)]
+        return sketch
+
+    def _Capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(2, int(np.ceil(self.k * _COMPACTOR_RATIO ** depth)))
+
+    def _Compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._Capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                # Compact an even number of items, an odd one out stays at this level
+                items = np.sort(items)
+                keep = items[:len(items) % 2]
+                promoted = items[len(keep):][self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+                # A new top level shrinks the capacity of the levels below it, so check them again
+                h = 0 if h + 2 == len(self.levels) else h + 1
+            else:
+                h += 1
+
+
+def NormalizedRankError(k: int = SKETCH_K):
+    """ Get the normalized rank error of a single quantile of a KLL sketch at 99% confidence.
+
+    This is the empirical bound of the KLL sketch, e.g. about 1.1% for k = 200, so a p99 query returns a value whose
+    true rank is between p97.9 and p100.
+    """
+    return 1.854 / k ** 0.9657
+
+
+def KeySeed(key: str):
+    """ Get the seed of a key's sketch, from the key name so the `sketches.json` of a log is reproducible."""
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def BuildKeySketches(source, keys: list = None, k: int = SKETCH_K):
+    """ Sketch every numeric key of a log, and the loop period. Each sketch is seeded with `KeySeed`.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        keys: optional list of keys to sketch, by default every key is sketched
+        k: the size of the sketches
+
+    Returns:
+        sketches: Dictionary of key to `KllSketch`, the keys without numeric samples are skipped
+
+    Raises:
+        None
+
+    """
+
+    import RobotSensors as rs
+
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, keys)
+    keys = list(keyIndex.keys()) if keys is None else [key for key in keys if key in keyIndex]
+
+    sketches = {}
+    for key in keys:
+        _, values = sa.GetSignal(keyIndex, key)
+        if len(values):
+            sketches[key] = KllSketch(k, KeySeed(key)).Update(values)
+    if rs.LOOP_TIME_KEY in keyIndex:
+        sketches[LOOP_PERIOD_KEY] = KllSketch(k, KeySeed(LOOP_PERIOD_KEY)).Update(rs.GetLoopPeriods(keyIndex))
+
+    return sketches
+
+
+def WriteKeySketches(sketches: dict, outputDir: Path):
+    """ Write the sketches of a log to `sketches.json` in the output directory."""
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+    with open(outputDir / 'sketches.json', 'w') as f:
+        json.dump({key: sketch.ToDict() for key, sketch in sketches.items()}, f, separators=(',', ':'))
+
+
+def MergeKeySketches(sketchFiles: list, keys: list = None):
+    """ Merge the `sketches.json` of many logs into one sketch per key.
+
+    Args:
+        sketchFiles: list of Paths to `sketches.json` files
+        keys: optional list of the keys to merge, by default every key is merged
+
+    Returns:
+        sketches: Dictionary of key to the merged `KllSketch`
+
+    Raises:
+        None
+
+    """
+
+    merged = {}
+    for sketchFile in sketchFiles:
+        with open(sketchFile) as f:
+            logSketches = json.load(f)
+        for key, sketchDict in logSketches.items():
+            if keys is not None and key not in keys:
+                continue
+            sketch = KllSketch.FromDict(sketchDict, KeySeed(key))
+            merged[key] = merged[key].Merge(sketch) if key in merged else sketch
+    return merged
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Report percentiles of keys across the sketches of many logs')
+    parser.add_argument("output", help='the output directory, with a sub-directory per log')
+    parser.add_argument("--keys", nargs='+', default=None)
+    parser.add_argument("--percentiles", nargs='+', type=float, default=[1, 5, 50, 95, 99])
+    args = parser.parse_args()
+    outputDir = Path(args.output)
+    if not outputDir.is_dir():
+        raise OSError(2, 'Directory not found', outputDir)
+
+    sketchFiles = sorted(outputDir.glob('*/sketches.json'))
+    sketches = MergeKeySketches(sketchFiles, args.keys)
+    quantiles = np.asarray(args.percentiles) / 100
+    print(f'{len(sketchFiles)} logs, rank error +/- {100 * NormalizedRankError():.1f}%')
+    for key, sketch in sorted(sketches.items()):
+        values = ' '.join(f'P{p:g}={v:.4g}' for p, v in zip(args.percentiles, sketch.Quantile(quantiles)))
+        print(f'{key:<50} n={sketch.n:<9} {values}')
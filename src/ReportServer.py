@@ -0,0 +1,195 @@
+import hashlib
+import re
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from html import escape
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mimetypes import guess_type
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+OUTPUT_DIR = Path(__file__).resolve().parents[1] / 'output'
+RESOURCES_DIR = Path(__file__).resolve().parents[1] / 'resources'
+
+""" The page of each log, the other files of its output directory are served as they are."""
+STOPLIGHT_PAGE = 'stoplight_robot.html'
+
+# The resource image paths written by the stoplight, including the old Windows style `..\resources\` ones
+_RESOURCE_SRC = re.compile(r'src="[^"]*?resources[\\/]([^"\\/]+)"')
+
+
+class ReportStore:
+    """The processed logs in an output directory, served without re-running any analysis.
+
+    Every response is cached with the size and modification time of the file it came from, so a file is only read
+    (and a stoplight page only re-rendered) when its log has been processed again.
+
+    Attributes:
+        outputDir (:obj:`Path`): the directory with a sub-directory of outputs per log
+        resourcesDir (:obj:`Path`): the directory of the stoplight images
+    """
+
+    def __init__(self, outputDir=OUTPUT_DIR, resourcesDir=RESOURCES_DIR):
+        self.outputDir = Path(outputDir).resolve()
+        self.resourcesDir = Path(resourcesDir).resolve()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def GetLogs(self):
+        """Get the names of the logs which have a stoplight page, newest first by their timestamped names."""
+        logDirs = [path for path in self.outputDir.iterdir() if (path / STOPLIGHT_PAGE).is_file()]
+        return [path.name for path in sorted(logDirs, key=lambda path: path.name, reverse=True)]
+
+    def Get(self, urlPath: str):
+        """Get the response for a URL path.
+
+        Returns:
+            response: a (body, content type, etag, modified time) tuple, None if there is nothing at the path
+        """
+        parts = [unquote(part) for part in urlPath.split('/') if part]
+        if not parts:
+            logDirs = [self.outputDir / logName for logName in self.GetLogs()]
+            stats = [path.stat() for path in [self.outputDir] + logDirs]
+            signature = tuple((path.name, stat.st_mtime_ns) for path, stat in zip([self.outputDir] + logDirs, stats))
+            return self._Cached(('index',), signature, max(stat.st_mtime for stat in stats), self._RenderIndex,
+                                'text/html; charset=utf-8')
+        if parts[0] == 'resources' and len(parts) == 2:
+            return self._File(self.resourcesDir, parts[1])
+        if parts[0] == 'logs' and len(parts) in (2, 3):
+            name = parts[2] if len(parts) == 3 else STOPLIGHT_PAGE
+            return self._File(self.outputDir / parts[1], name, render=name == STOPLIGHT_PAGE)
+        return None
+
+    def _File(self, directory, name, render=False):
+        # Only serve the files directly inside the resources directory or a log's output directory
+        path = (directory / name).resolve()
+        inResources = path.parent == self.resourcesDir
+        inLog = path.parent.parent == self.outputDir
+        if not (inResources or inLog) or not path.is_file():
+            return None
+        stat = path.stat()
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if render:
+            return self._Cached(('page', path), signature, stat.st_mtime, lambda: self._RenderPage(path),
+                                'text/html; charset=utf-8')
+        contentType = guess_type(path.name)[0] or 'application/octet-stream'
+        return self._Cached(('file', path), signature, stat.st_mtime, path.read_bytes, contentType)
+
+    def _Cached(self, cacheKey, signature, modified, build, contentType):
+        with self._lock:
+            cached = self._cache.get(cacheKey)
+        if cached is None or cached[0] != signature:
+            etag = f'"{hashlib.blake2b(repr(signature).encode(), digest_size=8).hexdigest()}"'
+            cached = (signature, (build(), contentType, etag, modified))
+            with self._lock:
+                self._cache[cacheKey] = cached
+        return cached[1]
+
+    def _RenderPage(self, path):
+        # Point the images at the served resources, wherever the page was written relative to them
+        html = path.read_text(encoding='utf-8')
+        return _RESOURCE_SRC.sub(lambda m: f'src="/resources/{quote(m.group(1))}"', html).encode('utf-8')
+
+    def _RenderIndex(self):
+        rows = []
+        for logName in self.GetLogs():
+            logDir = self.outputDir / logName
+            files = sorted(path.name for path in logDir.iterdir() if path.is_file() and path.name != STOPLIGHT_PAGE)
+            links = ' '.join(f'<a href="/logs/{quote(logName)}/{quote(name)}">{escape(name)}</a>' for name in files)
+            rows.append(f'<tr><td><a href="/logs/{quote(logName)}/">{escape(logName)}</a></td><td>{links}</td></tr>')
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Data Log Analysis</title></head><body>\n'
+                '<table>\n' + '\n'.join(rows) + '\n</table>\n</body></html>\n').encode('utf-8')
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """Serves a `ReportStore` with conditional GET responses (ETag and Last-Modified)."""
+
+    store = None
+
+    def do_GET(self):
+        self._Respond(sendBody=True)
+
+    def do_HEAD(self):
+        self._Respond(sendBody=False)
+
+    def _Respond(self, sendBody):
+        response = self.store.Get(urlsplit(self.path).path)
+        if response is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body, contentType, etag, modified = response
+
+        if self._NotModified(etag, modified):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._SendCacheHeaders(etag, modified)
+            self.end_headers()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self._SendCacheHeaders(etag, modified)
+        self.end_headers()
+        if sendBody:
+            self.wfile.write(body)
+
+    def _NotModified(self, etag, modified):
+        ifNoneMatch = self.headers.get('If-None-Match')
+        if ifNoneMatch is not None:
+            return ifNoneMatch.strip() == '*' or etag in [tag.strip() for tag in ifNoneMatch.split(',')]
+        ifModifiedSince = self.headers.get('If-Modified-Since')
+        if ifModifiedSince is not None:
+            try:
+                return int(modified) <= parsedate_to_datetime(ifModifiedSince).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _SendCacheHeaders(self, etag, modified):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(modified, usegmt=True))
+        self.send_header('Cache-Control', 'no-cache')
+
+
+def CreateReportServer(outputDir=OUTPUT_DIR, host='0.0.0.0', port=8000, resourcesDir=RESOURCES_DIR):
+    """ Create a threaded HTTP server for the processed logs in an output directory, call `serve_forever` to run it.
+
+    Args:
+        outputDir: the directory with a sub-directory of outputs per log
+        host: the address to listen on, the default listens on every interface so tablets on the network can connect
+        port: the port to listen on
+        resourcesDir: the directory of the stoplight images
+
+    Returns:
+        server: the `ThreadingHTTPServer`
+
+    Raises:
+        OSError: if the port can't be bound
+
+    """
+
+    handler = type('Handler', (ReportRequestHandler,), {'store': ReportStore(outputDir, resourcesDir)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the stoplight pages, plots and JSON of the processed logs')
+    parser.add_argument("--output", default=str(OUTPUT_DIR), help='the directory with a sub-directory per log')
+    parser.add_argument("--host", default='0.0.0.0')
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    outputDir = Path(args.output)
+    if not outputDir.is_dir():
+        raise OSError(2, 'Directory not found', outputDir)
+
+    server = CreateReportServer(outputDir, args.host, args.port)
+    print(f'Serving {outputDir} on http://{args.host}:{args.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,9 +1,16 @@
 import DataLogHelpers as dlh
+import DataLogReader as dlr
+import SignalAlignment as sa
 import pandas as pd
 import numpy as np
 from scipy.stats import shapiro
 import matplotlib.pyplot as plt
 
+LOOP_TIME_KEY = 'IMU Yaw Angle (deg)'
+LOOP_TIME_START = 10.0
+LOOP_TIME_PERCENTILES = [50, 95, 99]
+LOOP_OVERRUN_MS = 21.0
+
 
 def Test(df):
     """Process the telemetry for swerve module homing analysis.
@@ -57,13 +64,75 @@ def Test(df):
     #               ax1["D"], 'FMS Mode')
 
     loopTime = sensorsDf[['Timestamp', 'IMU Yaw Angle (deg)']].dropna()
-    loopTime = loopTime.loc[loopTime['Timestamp'] >= 10.0]['Timestamp']
+    loopTime = loopTime.loc[loopTime['Timestamp'] >= LOOP_TIME_START]['Timestamp']
     loopTime = 1000 * (loopTime - loopTime.shift(-1))
     __PlotHistogram(loopTime, ax2, 'Loop Time (ms)')
     plt.tight_layout()
     plt.show()
 
 
+def GetLoopPeriods(source, key=LOOP_TIME_KEY, startTime=LOOP_TIME_START):
+    """Get the robot loop periods, the time between consecutive samples of a key logged once per loop.
+
+    In a stitched session the `startTime` applies to each log and the time between two logs isn't a loop period
+    (see `SignalAlignment.GetSegmentStarts`).
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        key (str): the telemetry key logged once per loop
+        startTime (float): ignore the samples before this timestamp (robot startup), from the start of each log
+
+    Returns:
+        loopTime (:obj:`np.ndarray`): float array of the loop periods in ms, without the periods which cross a log
+            boundary
+
+    Raises:
+        KeyError: if the key isn't in the telemetry
+    """
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, [key, sa.SESSION_LOG_KEY])
+    timestamps, _ = sa.GetSignal(keyIndex, key)
+    segmentStarts = sa.GetSegmentStarts(keyIndex)
+    segments = sa.SegmentIndex(segmentStarts, timestamps)
+    keep = timestamps >= segmentStarts[segments] + startTime
+    timestamps, segments = timestamps[keep], segments[keep]
+    return 1000 * np.diff(timestamps)[segments[1:] == segments[:-1]]
+
+
+def ComputeLoopTimeStats(source, key=LOOP_TIME_KEY, startTime=LOOP_TIME_START):
+    """Compute the robot loop period statistics without any plotting.
+
+    The loop period is the time between consecutive samples of a key which is logged
+    once per robot loop.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        key (str): the telemetry key logged once per loop
+        startTime (float): ignore the samples before this timestamp (robot startup)
+
+    Returns:
+        stats (dict): the loop period statistics
+
+    Raises:
+        KeyError: if the key isn't in the telemetry
+    """
+
+    loopTime = GetLoopPeriods(source, key, startTime)
+
+    stats = {'Key': key, 'Loops': int(loopTime.size)}
+    if loopTime.size == 0:
+        return stats
+    for percentile, value in zip(LOOP_TIME_PERCENTILES, np.percentile(loopTime, LOOP_TIME_PERCENTILES)):
+        stats[f'P{percentile} (ms)'] = float(value)
+    stats['Mean (ms)'] = float(np.mean(loopTime))
+    stats['Max (ms)'] = float(np.max(loopTime))
+    stats['Overrun (%)'] = float(100 * np.count_nonzero(loopTime >= LOOP_OVERRUN_MS) / loopTime.size)
+    if loopTime.size >= 3 and np.ptp(loopTime) > 0.0:
+        stat, p = shapiro(loopTime)
+        stats['Shapiro P'] = float(p)
+
+    return stats
+
+
 def __PlotSignals(module, axis, title):
     module.plot(ax=axis, x='Timestamp', linestyle='--',
                 marker='o', title=title)
@@ -72,7 +141,7 @@ def __PlotSignals(module, axis, title):
 
 def __PlotHistogram(module, axis, title):
     stat, p = shapiro(module.dropna())
-    garbage = module.loc[abs(module) >= 21.0]
+    garbage = module.loc[abs(module) >= LOOP_OVERRUN_MS]
     garbageTime = 100 * garbage.size / module.size
 
     #print('Statistics=%.3f, p=%.5f' % (stat, p))
@@ -90,14 +159,15 @@ def __PlotHistogram(module, axis, title):
     axis.legend([txt])
 
 
-df = pd.read_csv(
-    r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_013534.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_013024.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_012513.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_012152.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_011927.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_011621.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_011206.csv")
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
 
+    parser = argparse.ArgumentParser(description='Robot sensor and loop time analysis')
+    parser.add_argument("telemetryfile")
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
 
-Test(df)
+    Test(dlr.ReadDataLog(telemetryFile))
@@ -0,0 +1,162 @@
+import numpy as np
+import SignalAlignment as sa
+
+""" The worst-window statistics. The first word is how the windows are ranked, the second is the statistic of each
+window, e.g. `max mean` is the highest window average and `max min` is the highest level held for a whole window."""
+WINDOW_STATISTICS = ('max mean', 'min mean', 'max min', 'min max', 'max max', 'min min')
+
+
+def WindowStarts(timestamps: np.ndarray, window: float):
+    """ Get the index of the first sample in the trailing `window` seconds ending at each sample."""
+    return np.searchsorted(timestamps, timestamps - window, side='left')
+
+
+def RollingMean(timestamps: np.ndarray, values: np.ndarray, window: float):
+    """ Get the mean of the samples in the trailing `window` seconds ending at each sample, in O(n) from a cumulative
+    sum of the values.
+
+    Args:
+        timestamps: Numpy float array of sorted timestamps
+        values: Numpy float array of values, without NaNs (see `GetSignal`)
+        window: the window length in seconds
+
+    Returns:
+        means: Numpy float array of the window mean ending at each sample
+
+    Raises:
+        None
+
+    """
+
+    starts = WindowStarts(timestamps, window)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    stops = np.arange(1, len(values) + 1)
+    return (sums[stops] - sums[starts]) / (stops - starts)
+
+
+def RollingMax(timestamps: np.ndarray, values: np.ndarray, window: float):
+    """ Get the max of the samples in the trailing `window` seconds ending at each sample.
+
+    The windows hold a varying number of samples, so they are answered from doubling range tables: table `j` holds
+    the max of every run of `2**j` samples, and a window of `n` samples is the max of the two (overlapping) runs of
+    the largest `2**j <= n` at its ends. Only one table is kept at a time and each is built from the last with one
+    vectorized `maximum`, so it takes O(n log w) time and O(n) memory for windows of `w` samples.
+
+    Args:
+        timestamps: Numpy float array of sorted timestamps
+        values: Numpy float array of values, without NaNs (see `GetSignal`)
+        window: the window length in seconds
+
+    Returns:
+        maxes: Numpy float array of the window max ending at each sample
+
+    Raises:
+        None
+
+    """
+
+    stops = np.arange(len(values))
+    starts = WindowStarts(timestamps, window)
+    levels = np.floor(np.log2(stops - starts + 1)).astype(np.int64)
+
+    maxes = np.empty(len(values))
+    table = np.asarray(values, dtype=np.float64)
+    for level in range(levels.max() + 1 if len(values) else 0):
+        if level > 0:
+            half = 1 << (level - 1)
+            table = np.maximum(table[:-half], table[half:])
+        query = np.flatnonzero(levels == level)
+        maxes[query] = np.maximum(table[starts[query]], table[stops[query] - (1 << level) + 1])
+
+    return maxes
+
+
+def RollingMin(timestamps: np.ndarray, values: np.ndarray, window: float):
+    """ Get the min of the samples in the trailing `window` seconds ending at each sample (see `RollingMax`)."""
+    return -RollingMax(timestamps, -np.asarray(values, dtype=np.float64), window)
+
+
+def WorstWindow(timestamps: np.ndarray, values: np.ndarray, window: float, statistic: str = 'max mean'):
+    """ Find the worst `window` second window of a signal.
+
+    Only the windows which fit in the log are ranked, so a short burst at the start of the log isn't averaged over a
+    partial window. A log shorter than the window is ranked as a single window.
+
+    Args:
+        timestamps: Numpy float array of sorted timestamps
+        values: Numpy float array of values, without NaNs (see `GetSignal`)
+        window: the window length in seconds
+        statistic: one of `WINDOW_STATISTICS`
+
+    Returns:
+        value: the statistic of the worst window, NaN if there are no samples
+        endTime: the timestamp at the end of the worst window, NaN if there are no samples
+
+    Raises:
+        ValueError: if the statistic isn't supported
+
+    """
+
+    if statistic not in WINDOW_STATISTICS:
+        raise ValueError(f"expected one of {WINDOW_STATISTICS} for the statistic")
+    if len(values) == 0:
+        return np.nan, np.nan
+
+    rank, reduce = statistic.split()
+    rolling = {'mean': RollingMean, 'max': RollingMax, 'min': RollingMin}[reduce](timestamps, values, window)
+
+    full = np.flatnonzero(timestamps - timestamps[0] >= window)
+    candidates = full if full.size else np.array([len(values) - 1])
+    best = candidates[np.argmax(rolling[candidates]) if rank == 'max' else np.argmin(rolling[candidates])]
+    return float(rolling[best]), float(timestamps[best])
+
+
+def WorstWindows(source, keys: list, window: float, statistic: str = 'max mean'):
+    """ Find the worst window of each numeric key.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        keys: the telemetry keys
+        window: the window length in seconds
+        statistic: one of `WINDOW_STATISTICS`
+
+    Returns:
+        worstWindows: Dictionary of key to a (value, endTime) tuple, the keys without numeric samples are skipped
+
+    Raises:
+        KeyError: if a key isn't in the telemetry
+        ValueError: if the statistic isn't supported
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, keys)
+    worstWindows = {}
+    for key in keys:
+        timestamps, values = sa.GetSignal(keyIndex, key)
+        if len(values):
+            worstWindows[key] = WorstWindow(timestamps, values, window, statistic)
+    return worstWindows
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import DataLogReader as dlr
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Find the worst window of every numeric key of a log')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("--window", type=float, default=1.0, help='the window length in seconds')
+    parser.add_argument("--statistic", choices=WINDOW_STATISTICS, default='max mean')
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    keyIndex = sa.BuildKeyIndex(dlr.ReadDataLog(telemetryFile))
+    start = time.perf_counter()
+    worstWindows = WorstWindows(keyIndex, list(keyIndex.keys()), args.window, args.statistic)
+    elapsed = time.perf_counter() - start
+    for key, (value, endTime) in worstWindows.items():
+        print(f'{key:<50} {value:12.4f} ending at {endTime:8.3f} s')
+    print(f'{len(worstWindows)} keys in {1000 * elapsed:.1f} ms')
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import SignalAlignment as sa
+
+""" Keys whose number of runs is at most this fraction of their samples are stored run-length encoded."""
+MAX_RUN_FRACTION = 0.05
+
+
+class RunLengthSignal:
+    """A slowly changing or boolean signal stored as runs of equal values.
+
+    Keys like `RoboRio Browned Out`, `FMS Mode`, the `Is Homed` flags and the cumulative
+    CAN counters are logged at the full loop rate but almost never change. Only the
+    timestamp and value of each change point are kept, so the queries cost O(runs)
+    instead of O(samples).
+
+    Attributes:
+        runStarts (:obj:`np.ndarray`): the timestamp of the first sample of each run
+        runValues (:obj:`np.ndarray`): the raw value of each run
+        runCounts (:obj:`np.ndarray`): the number of samples in each run
+        lastTimestamp (float): the timestamp of the last sample
+    """
+
+    def __init__(self, runStarts, runValues, runCounts, lastTimestamp):
+        self.runStarts = runStarts
+        self.runValues = runValues
+        self.runCounts = runCounts
+        self.lastTimestamp = lastTimestamp
+
+    @classmethod
+    def FromSamples(cls, timestamps, values):
+        """Encode time sorted samples (e.g. from `BuildKeyIndex`) into runs."""
+        if len(timestamps) == 0:
+            return cls(np.empty(0), np.empty(0, dtype=object), np.empty(0, dtype=np.int64), np.nan)
+        changes = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+        runCounts = np.diff(np.concatenate((changes, [len(values)])))
+        return cls(timestamps[changes], values[changes], runCounts, timestamps[-1])
+
+    def __len__(self):
+        return len(self.runStarts)
+
+    @property
+    def sampleCount(self):
+        return int(self.runCounts.sum())
+
+    def LastValue(self):
+        """Get the value of the last sample, None if there are no samples."""
+        return self.runValues[-1] if len(self) else None
+
+    def ValueAt(self, timestamp):
+        """Get the value held at a timestamp (or an array of timestamps), None before the first sample."""
+        idx = np.searchsorted(self.runStarts, timestamp, side='right') - 1
+        if np.ndim(idx) == 0:
+            return self.runValues[idx] if idx >= 0 else None
+        return np.where(idx >= 0, self.runValues[np.maximum(idx, 0)], None)
+
+    def Transitions(self):
+        """Get the change points after the first run.
+
+        Returns:
+            timestamps (:obj:`np.ndarray`): the timestamp of each transition
+            fromValues (:obj:`np.ndarray`): the value before each transition
+            toValues (:obj:`np.ndarray`): the value after each transition
+        """
+        return self.runStarts[1:], self.runValues[:-1], self.runValues[1:]
+
+    def Runs(self, value=None):
+        """Get the (starts, stops) of every run, or only the runs of a value. The last run stops at the last sample."""
+        stops = np.concatenate((self.runStarts[1:], [self.lastTimestamp]))
+        if value is None:
+            return self.runStarts, stops
+        match = self.runValues == value
+        return self.runStarts[match], stops[match]
+
+
+def GetRunLengthSignal(source, key: str, runLengthIndex: dict = None):
+    """ Get a key of the telemetry as a run-length encoded signal.
+
+    A key which is already in the run-length index is returned as is, in O(1). Otherwise only the samples of the key
+    are encoded, which with a key index costs O(samples) of that key rather than a pass over the log.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        key: the telemetry key
+        runLengthIndex: optional run-length index from `DetectRunLengthKeys` (e.g. `LoadedLog.runLengthIndex`)
+
+    Returns:
+        signal: the `RunLengthSignal`, None if the key isn't in the telemetry
+
+    Raises:
+        None
+
+    """
+
+    if runLengthIndex is not None and key in runLengthIndex:
+        return runLengthIndex[key]
+    keyIndex = source if isinstance(source, dict) else sa.BuildKeyIndex(source, [key])
+    if key not in keyIndex:
+        return None
+    return RunLengthSignal.FromSamples(*keyIndex[key])
+
+
+def DetectRunLengthKeys(keyIndex: dict, maxRunFraction: float = MAX_RUN_FRACTION, minSamples: int = 100):
+    """ Find the slowly changing keys of a log and run-length encode them.
+
+    Args:
+        keyIndex: the key index from `BuildKeyIndex`
+        maxRunFraction: the maximum number of runs, as a fraction of the samples, for a key to be encoded
+        minSamples: keys with fewer samples than this aren't worth encoding
+
+    Returns:
+        runLengthIndex: Dictionary of key to `RunLengthSignal` of the slowly changing keys
+
+    Raises:
+        None
+
+    """
+
+    runLengthIndex = {}
+    for key, (timestamps, values) in keyIndex.items():
+        if len(values) < minSamples:
+            continue
+        runs = 1 + np.count_nonzero(values[1:] != values[:-1])
+        if runs <= maxRunFraction * len(values):
+            runLengthIndex[key] = RunLengthSignal.FromSamples(timestamps, values)
+
+    return runLengthIndex
+
+
+def RunLengthSummary(runLengthIndex: dict):
+    """ Summarize the run-length encoded keys (samples, runs and last value of each key) as a dataframe."""
+    return pd.DataFrame([
+        {'Key': key, 'Samples': signal.sampleCount, 'Runs': len(signal), 'Last Value': signal.LastValue()}
+        for key, signal in runLengthIndex.items()
+    ])
+
+
+if __name__ == "__main__":
+    import argparse
+    import DataLogReader as dlr
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='List the slowly changing keys of a log')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("--max-run-fraction", type=float, default=MAX_RUN_FRACTION)
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    keyIndex = sa.BuildKeyIndex(dlr.ReadDataLog(telemetryFile))
+    print(RunLengthSummary(DetectRunLengthKeys(keyIndex, args.max_run_fraction)).to_string(index=False))
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from pathlib import Path
+import DataLogReader as dlr
+import SignalAlignment as sa
+
+""" The key with the robot's wall clock time, logged every few seconds as e.g. `2022-11-15 19:12:10.779431`."""
+SYSTEM_TIME_KEY = 'systemTime'
+
+""" The date and time in the log names, e.g. `FRC_20221116_011206`."""
+LOG_NAME_FORMAT = 'FRC_%Y%m%d_%H%M%S'
+
+""" The sources of the wall clock start time of a log (see `GetLogStartTime`)."""
+TIME_SOURCES = ('systemTime', 'filename')
+
+
+def GetLogStartTime(keyIndex: dict, telemetryFile: Path, timeSource: str = 'systemTime'):
+    """ Get the wall clock time of timestamp 0 of a log, in seconds since the epoch.
+
+    With `systemTime` it is the median of the logged wall clock times less their timestamps, which is robust to a
+    sample logged late. With `filename` it is the date and time in the log name, which is only accurate to a few
+    seconds. The robot clock and the log names can be in different time zones, so the logs of one session must all
+    use the same source.
+
+    Args:
+        keyIndex: the key index from `BuildKeyIndex`
+        telemetryFile: Path to the robot telemetry file
+        timeSource: one of `TIME_SOURCES`
+
+    Returns:
+        startTime: the wall clock time of timestamp 0, None if the log doesn't have it
+
+    Raises:
+        ValueError: if the time source isn't supported
+
+    """
+
+    if timeSource not in TIME_SOURCES:
+        raise ValueError(f"expected one of {TIME_SOURCES} for the time source")
+
+    if timeSource == 'filename':
+        try:
+            startTime = datetime.strptime(dlr.GetLogName(telemetryFile), LOG_NAME_FORMAT)
+        except ValueError:
+            return None
+        return startTime.replace(tzinfo=timezone.utc).timestamp()
+
+    if SYSTEM_TIME_KEY not in keyIndex:
+        return None
+    timestamps, values = keyIndex[SYSTEM_TIME_KEY]
+    wallTimes = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='ISO8601')
+    valid = wallTimes.notna().to_numpy()
+    if not valid.any():
+        return None
+    seconds = (wallTimes[valid] - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+    return float(np.median(seconds - timestamps[valid]))
+
+
+def MergeKeyIndexes(keyIndexes: list, offsets: list):
+    """ K-way merge the key indexes of several logs into one key index, shifting each log by its offset.
+
+    The samples of each key are already time sorted in every log, so when the shifted logs follow each other the
+    arrays are just joined, and when they overlap a stable sort merges the sorted runs (timsort merges `k` runs in
+    O(n log k)). Either way, no sample is touched more than a few times.
+
+    Args:
+        keyIndexes: list of key indexes from `BuildKeyIndex`
+        offsets: the offset in seconds added to the timestamps of each log
+
+    Returns:
+        keyIndex: the merged key index
+
+    Raises:
+        None
+
+    """
+
+    keys = list(dict.fromkeys(key for keyIndex in keyIndexes for key in keyIndex))
+    merged = {}
+    for key in keys:
+        runs = [(keyIndex[key][0] + offset, keyIndex[key][1]) for keyIndex, offset in zip(keyIndexes, offsets)
+                if key in keyIndex and len(keyIndex[key][0])]
+        if not runs:
+            continue
+        timestamps = np.concatenate([t for t, _ in runs])
+        values = np.concatenate([v for _, v in runs])
+        if any(previous[0][-1] > following[0][0] for previous, following in zip(runs[:-1], runs[1:])):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+        merged[key] = (timestamps, values)
+
+    return merged
+
+
+def StitchDataLogs(telemetryFiles: list, timeSource: str = None):
+    """ Stitch the logs of one session into a single key index on a common timeline.
+
+    Each log is shifted by the time from the start of the first log to its own start, so the first log keeps its
+    timestamps and the time between the logs is preserved. The logs are read one at a time and only their key
+    indexes are kept, the cost is linear in the total number of rows. A `SignalAlignment.SESSION_LOG_KEY` sample at
+    the shifted time 0 of each log marks where it starts (see `SignalAlignment.GetSegmentStarts`), the logs are
+    assumed not to overlap.
+
+    Args:
+        telemetryFiles: list of Paths to the robot telemetry files
+        timeSource: one of `TIME_SOURCES`, by default `systemTime` if every log has it and `filename` otherwise
+
+    Returns:
+        keyIndex: the stitched key index
+        logs: Pandas dataframe with the `Log`, `Start Time` (wall clock), `Offset (s)` and `Samples` of each log,
+            sorted by start time
+
+    Raises:
+        ValueError: if the time source isn't supported, or the start time of a log can't be found
+
+    """
+
+    keyIndexes = [sa.BuildKeyIndex(dlr.ReadDataLog(telemetryFile)) for telemetryFile in telemetryFiles]
+    if timeSource is None:
+        timeSource = 'systemTime' if all(SYSTEM_TIME_KEY in keyIndex for keyIndex in keyIndexes) else 'filename'
+
+    startTimes = [GetLogStartTime(keyIndex, telemetryFile, timeSource)
+                  for keyIndex, telemetryFile in zip(keyIndexes, telemetryFiles)]
+    missing = [dlr.GetLogName(f) for f, startTime in zip(telemetryFiles, startTimes) if startTime is None]
+    if missing:
+        raise ValueError(f"missing the {timeSource} start time of {missing}")
+
+    # Merge the logs in the order they started, so the joined runs are already in time order
+    order = np.argsort(startTimes, kind='stable')
+    names = [dlr.GetLogName(telemetryFiles[i]) for i in order]
+    offsets = [startTimes[i] - startTimes[order[0]] for i in order]
+    keyIndexes = [keyIndexes[i] for i in order]
+    sessionLog = {sa.SESSION_LOG_KEY: (np.array(offsets, dtype=np.float64), np.array(names, dtype=object))}
+
+    keyIndex = MergeKeyIndexes(keyIndexes + [sessionLog], offsets + [0.0])
+    logs = pd.DataFrame({
+        'Log': names,
+        'Start Time': pd.to_datetime([startTimes[i] for i in order], unit='s').round('ms'),
+        'Offset (s)': offsets,
+        'Samples': [sum(len(t) for t, _ in logIndex.values()) for logIndex in keyIndexes],
+    })
+
+    return keyIndex, logs
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import DataLogExtract as dle
+
+    parser = argparse.ArgumentParser(description='Stitch the logs of a session into one timeline')
+    parser.add_argument("telemetry", nargs='+', help='telemetry files or directories of telemetry files')
+    parser.add_argument("--time-source", choices=TIME_SOURCES, default=None)
+    parser.add_argument("--output", default=None,
+                        help='write the stitched log to a file, compressed if it ends in .gz, .xz or .zst')
+    args = parser.parse_args()
+
+    telemetryFiles = []
+    for path in map(Path, args.telemetry):
+        if path.is_dir():
+            telemetryFiles.extend(dlr.FindDataLogs(path))
+        elif path.is_file():
+            telemetryFiles.append(path)
+        else:
+            raise OSError(2, 'File not found', path)
+
+    start = time.perf_counter()
+    keyIndex, logs = StitchDataLogs(telemetryFiles, args.time_source)
+    elapsed = time.perf_counter() - start
+    print(logs.to_string(index=False))
+    print(f'{len(keyIndex)} keys, {sum(len(t) for t, _ in keyIndex.values())} samples stitched in {elapsed:.2f} s')
+    if args.output is not None:
+        dle.WriteDataLog(dle.ExtractDataLog(keyIndex, ['*']), Path(args.output))
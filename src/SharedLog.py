@@ -0,0 +1,280 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory, util
+import SignalAlignment as sa
+
+""" Separates the raw values in the optional shared string buffer. WPILib CSV values never contain it."""
+VALUE_SEPARATOR = '\x00'
+
+# The logs attached by this process, by shared memory block name, so each worker attaches once and not once per task
+_ATTACHED = {}
+
+
+class SharedLog:
+    """A log's typed column arrays in a single shared memory block, for handing a log to worker processes.
+
+    The rows are sorted by (key, timestamp) like `BuildKeyIndex`, so each key is a contiguous slice. The block holds
+
+    * the timestamps (float64)
+    * the values (float64, converted like `ToNumeric` so booleans are 1.0/0.0 and anything non-numeric is NaN)
+    * the row bounds of each key (int64)
+    * the key names, UTF-8 encoded and separated by newlines
+    * optionally the raw values, UTF-8 encoded and separated by `VALUE_SEPARATOR`, with the byte offset of each one
+      (int64), for the few consumers which need the strings (e.g. `FMS Mode`)
+
+    Publishing copies the log into the block once. Workers attach with the small picklable `handle` and get zero-copy
+    numpy views of the timestamps and values of a key, so a task costs no serialization of the log, no per-task
+    conversion of the values and the workers don't each hold a copy of it.
+
+    The publishing process owns the block and unlinks it when the log is closed, use it as a context manager. The
+    worker processes of `MapSharedLog` close their attachments when they exit.
+
+    Attributes:
+        keys (list): the telemetry keys, in the order of their slices
+        timestamps (:obj:`np.ndarray`): the timestamps of every row
+        values (:obj:`np.ndarray`): the numeric value of every row
+        keyBounds (:obj:`np.ndarray`): the rows of key `i` are `keyBounds[i]:keyBounds[i + 1]`
+        hasStrings (bool): the raw values were published too
+    """
+
+    def __init__(self, shm, layout, owner=False):
+        self._shm = shm
+        self._layout = layout
+        self._owner = owner
+        arrays = {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                  for name, (offset, dtype, shape) in layout.items()}
+        self.timestamps = arrays['timestamps']
+        self.values = arrays['values']
+        self.keyBounds = arrays['keyBounds']
+        self.hasStrings = 'strings' in arrays
+        self._stringOffsets = arrays.get('stringOffsets')
+        self._strings = arrays.get('strings')
+        self.keys = bytes(arrays['keys']).decode('utf-8').split('\n') if len(self.keyBounds) > 1 else []
+        self._keySlices = {key: i for i, key in enumerate(self.keys)}
+
+    @classmethod
+    def Publish(cls, robotTelemetry: pd.DataFrame, strings: bool = False):
+        """Copy the [Timestamp,Name,Value] telemetry into a new shared memory block owned by this process.
+
+        Args:
+            robotTelemetry: Pandas dataframe of robot telemetry
+            strings: also publish the raw values, for `GetStrings` and `GetTelemetry`
+
+        Returns:
+            log: the published `SharedLog`
+
+        Raises:
+            None
+        """
+        codes, names = pd.factorize(robotTelemetry['Name'])
+        timestamps = robotTelemetry['Timestamp'].to_numpy(dtype=np.float64)
+        rawValues = robotTelemetry['Value'].to_numpy(dtype=object)
+
+        valid = codes >= 0
+        codes, timestamps, rawValues = codes[valid], timestamps[valid], rawValues[valid]
+        order = np.lexsort((timestamps, codes))
+        codes, timestamps, rawValues = codes[order], timestamps[order], rawValues[order]
+        keyBounds = np.searchsorted(codes, np.arange(len(names) + 1), side='left').astype(np.int64)
+
+        # Convert each distinct value once, logs repeat the same few values a lot (a missing value has the code -1)
+        valueCodes, distinctValues = pd.factorize(rawValues)
+        values = np.append(sa.ToNumeric(distinctValues), np.nan)[valueCodes]
+
+        arrays = {
+            'timestamps': timestamps,
+            'values': values,
+            'keyBounds': keyBounds,
+            'keys': np.frombuffer('\n'.join(names).encode('utf-8'), dtype=np.uint8),
+        }
+        if strings:
+            arrays.update(_EncodeStrings(pd.Series(rawValues, dtype=object).fillna('').to_numpy(dtype=object)))
+
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += -(-array.nbytes // 8) * 8
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            offset, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+        return cls(shm, layout, owner=True)
+
+    @classmethod
+    def Attach(cls, handle):
+        """Attach to a log published by another process, from its `handle`."""
+        name, layout = handle
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    @property
+    def handle(self):
+        """The picklable (block name, layout) to attach to the log with."""
+        return self._shm.name, self._layout
+
+    def GetKey(self, key: str):
+        """Get the (timestamps, values) of a key like `BuildKeyIndex`, with the numeric values. Both are zero-copy
+        views of the shared block, so `GetSignal` and the other key index functions can use them directly.
+
+        Raises:
+            KeyError: if the key isn't in the telemetry
+        """
+        start, stop = self._KeyBounds(key)
+        return self.timestamps[start:stop], self.values[start:stop]
+
+    def GetStrings(self, key: str):
+        """Get the raw values of a key, decoded from the shared string buffer.
+
+        Raises:
+            KeyError: if the key isn't in the telemetry
+            ValueError: if the log was published without its strings
+        """
+        if not self.hasStrings:
+            raise ValueError("the log was published without its strings")
+        start, stop = self._KeyBounds(key)
+        if start == stop:
+            return np.empty(0, dtype=object)
+        raw = self._strings[self._stringOffsets[start]:self._stringOffsets[stop] - 1]
+        values = np.array(bytes(raw).decode('utf-8').split(VALUE_SEPARATOR), dtype=object)
+        values[values == ''] = np.nan
+        return values
+
+    def GetKeyIndex(self, keys: list = None, strings: bool = False):
+        """Get a key index like `BuildKeyIndex` of the keys (by default every key), skipping missing keys. The values
+        are the numeric views, or the raw values if `strings`."""
+        keys = self.keys if keys is None else [key for key in keys if key in self._keySlices]
+        if strings:
+            return {key: (self.GetKey(key)[0], self.GetStrings(key)) for key in keys}
+        return {key: self.GetKey(key) for key in keys}
+
+    def GetTelemetry(self, keys: list = None):
+        """Rebuild a [Timestamp,Name,Value] dataframe of the keys (by default every key) from the raw values.
+
+        Raises:
+            ValueError: if the log was published without its strings
+        """
+        keyIndex = self.GetKeyIndex(keys, strings=True)
+        if not keyIndex:
+            return pd.DataFrame({'Timestamp': np.empty(0), 'Name': np.empty(0, dtype=object),
+                                 'Value': np.empty(0, dtype=object)})
+        return pd.DataFrame({
+            'Timestamp': np.concatenate([t for t, _ in keyIndex.values()]),
+            'Name': np.repeat(np.array(list(keyIndex.keys()), dtype=object), [len(t) for t, _ in keyIndex.values()]),
+            'Value': np.concatenate([v for _, v in keyIndex.values()]),
+        })
+
+    def _KeyBounds(self, key):
+        if key not in self._keySlices:
+            raise KeyError(f"missing telemetry key: {key}")
+        i = self._keySlices[key]
+        return self.keyBounds[i], self.keyBounds[i + 1]
+
+    def close(self):
+        """Release this process's views of the block and unlink it if this process published it."""
+        self.timestamps = self.values = self.keyBounds = self._stringOffsets = self._strings = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _EncodeStrings(values):
+    # Encode the values as one buffer, the offsets come from the string lengths when the log is all ASCII
+    valueBytes = VALUE_SEPARATOR.join(values).encode('utf-8')
+    lengths = pd.Series(values, dtype=object).str.len().to_numpy(dtype=np.int64)
+    if len(valueBytes) != lengths.sum() + max(len(values) - 1, 0):
+        lengths = np.fromiter((len(v.encode('utf-8')) for v in values), dtype=np.int64, count=len(values))
+    stringOffsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths + 1, out=stringOffsets[1:])
+    return {'stringOffsets': stringOffsets, 'strings': np.frombuffer(valueBytes, dtype=np.uint8)}
+
+
+def AttachLog(handle):
+    """ Attach to a published log once per process, later calls with the same handle return the same log."""
+    name = handle[0]
+    if name not in _ATTACHED:
+        _ATTACHED[name] = SharedLog.Attach(handle)
+    return _ATTACHED[name]
+
+
+def CloseAttachedLogs():
+    """ Close every log attached by this process, e.g. when a worker process exits."""
+    while _ATTACHED:
+        _ATTACHED.popitem()[1].close()
+
+
+def _InitWorker():
+    # Worker processes exit without running atexit handlers, the multiprocessing finalizers do run
+    util.Finalize(None, CloseAttachedLogs, exitpriority=10)
+
+
+def _RunTask(handle, func, item):
+    return func(AttachLog(handle), item)
+
+
+def MapSharedLog(robotTelemetry, func, items, maxWorkers: int = None):
+    """ Run `func(sharedLog, item)` for each item in worker processes which share one copy of the log.
+
+    The workers attach to the log on their first task and close it when the pool shuts down.
+
+    Args:
+        robotTelemetry: Pandas dataframe of robot telemetry, or a `SharedLog` which is already published
+        func: a picklable (module level) function of a `SharedLog` and an item
+        items: the items to map over, e.g. telemetry keys or swerve module names
+        maxWorkers: the maximum number of worker processes
+
+    Returns:
+        results: list of the result for each item, in order
+
+    Raises:
+        None
+
+    """
+
+    if isinstance(robotTelemetry, SharedLog):
+        with ProcessPoolExecutor(max_workers=maxWorkers, initializer=_InitWorker) as executor:
+            return list(executor.map(_RunTask, repeat(robotTelemetry.handle), repeat(func), items))
+
+    with SharedLog.Publish(robotTelemetry) as log:
+        return MapSharedLog(log, func, items, maxWorkers)
+
+
+def _KeyStats(log, key):
+    _, values = log.GetKey(key)
+    return key, len(values), np.nanmax(values) if not np.isnan(values).all() else np.nan
+
+
+if __name__ == "__main__":
+    import argparse
+    import pickle
+    import time
+    import DataLogReader as dlr
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Compare pickling a log to each task with the shared memory handoff')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    robotTelemetry = dlr.ReadDataLog(telemetryFile)
+    start = time.perf_counter()
+    pickledSize = len(pickle.dumps(robotTelemetry))
+    print(f'pickling the dataframe: {pickledSize / 1e6:.1f} MB per task, {1000 * (time.perf_counter() - start):.1f} ms')
+
+    start = time.perf_counter()
+    with SharedLog.Publish(robotTelemetry) as log:
+        published = time.perf_counter()
+        results = MapSharedLog(log, _KeyStats, log.keys, args.jobs)
+        print(f'shared handoff: {len(pickle.dumps(log.handle))} bytes per task, '
+              f'published in {1000 * (published - start):.1f} ms, {len(results)} keys in '
+              f'{1000 * (time.perf_counter() - published):.1f} ms')
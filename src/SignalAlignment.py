@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+
+ALIGNMENT_METHODS = ('hold', 'linear', 'nearest')
+
+""" A string key of a stitched session (see `SessionStitch.StitchDataLogs`) with the name of each log, sampled at the
+time the log starts. The logs split the session into segments, and the analyses which look at consecutive samples or
+intervals use them so nothing is joined across the gap between two logs."""
+SESSION_LOG_KEY = 'Session Log'
+
+
+def BuildKeyIndex(robotTelemetry: pd.DataFrame, keys: list = None):
+    """ Split the telemetry into time sorted arrays for each key in a single pass.
+
+    This replaces filtering the whole dataframe on `Name` once per key. The rows are sorted by (key, timestamp) once
+    and the index holds views into the sorted arrays.
+
+    Args:
+        robotTelemetry: Pandas dataframe of robot telemetry
+        keys: Optional list of keys to index, by default every key is indexed
+
+    Returns:
+        keyIndex: Dictionary of key to a (timestamps, values) tuple of numpy arrays, the values are the raw strings
+
+    Raises:
+        None
+
+    """
+
+    if keys is not None:
+        robotTelemetry = robotTelemetry.loc[robotTelemetry['Name'].isin(keys)]
+
+    codes, names = pd.factorize(robotTelemetry['Name'])
+    timestamps = robotTelemetry['Timestamp'].to_numpy(dtype=np.float64)
+    values = robotTelemetry['Value'].to_numpy(dtype=object)
+
+    order = np.lexsort((timestamps, codes))
+    codes = codes[order]
+    timestamps = timestamps[order]
+    values = values[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [codes.size]))
+
+    keyIndex = {}
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if start == stop or codes[start] < 0:
+            continue
+        keyIndex[names[codes[start]]] = (timestamps[start:stop], values[start:stop])
+
+    return keyIndex
+
+
+def ToNumeric(values: np.ndarray):
+    """ Convert raw `Value` strings to floats. Booleans map to 1.0/0.0 and anything non-numeric becomes NaN. Values
+    which are already floats (e.g. from a `SharedLog`) are returned as they are.
+
+    Args:
+        values: Numpy array of raw values
+
+    Returns:
+        values: Numpy float array
+
+    Raises:
+        None
+
+    """
+
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        return values.astype(np.float64, copy=False)
+    values = np.asarray(values, dtype=object)
+    values = np.where(values == 'true', '1', np.where(values == 'false', '0', values))
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def GetSignal(source, key: str):
+    """ Get the numeric samples of a key as time sorted arrays.
+
+    Samples which aren't numeric are dropped and when several samples share a timestamp the last one is kept.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        key: the telemetry key
+
+    Returns:
+        timestamps: Numpy float array of sorted timestamps
+        values: Numpy float array of values
+
+    Raises:
+        KeyError: if the key isn't in the telemetry
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else BuildKeyIndex(source, [key])
+    if key not in keyIndex:
+        raise KeyError(f"missing telemetry key: {key}")
+    timestamps, values = keyIndex[key]
+    values = ToNumeric(values)
+
+    keep = ~np.isnan(values)
+    keep[:-1] &= timestamps[1:] != timestamps[:-1]
+    return timestamps[keep], values[keep]
+
+
+def GetSegmentStarts(source):
+    """ Get the start time of each log of a stitched session, sorted, from its `SESSION_LOG_KEY` samples.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+
+    Returns:
+        segmentStarts: Numpy float array of the start of each segment, `[0.0]` (one segment) for a single log
+
+    Raises:
+        None
+
+    """
+
+    if isinstance(source, dict):
+        segmentStarts = source[SESSION_LOG_KEY][0] if SESSION_LOG_KEY in source else np.empty(0)
+    else:
+        segmentStarts = np.sort(source.loc[source['Name'] == SESSION_LOG_KEY, 'Timestamp'].to_numpy(dtype=np.float64))
+    return np.asarray(segmentStarts, dtype=np.float64) if len(segmentStarts) else np.zeros(1)
+
+
+def SegmentIndex(segmentStarts: np.ndarray, timestamps: np.ndarray):
+    """ Get the segment of each timestamp, the samples before the first segment start belong to the first segment."""
+    return np.maximum(np.searchsorted(segmentStarts, timestamps, side='right') - 1, 0)
+
+
+def GetSegmentEnds(source, segmentStarts: np.ndarray):
+    """ Get the time of the last sample (of any key) in each segment.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        segmentStarts: Numpy float array of the segment starts from `GetSegmentStarts`
+
+    Returns:
+        segmentEnds: Numpy float array of the end of each segment, its start if it doesn't have any samples
+
+    Raises:
+        None
+
+    """
+
+    if isinstance(source, dict):
+        # Only the last sample of each key before each following segment start can end a segment
+        candidates = [timestamps[np.append(np.searchsorted(timestamps, segmentStarts[1:], side='left') - 1,
+                                           len(timestamps) - 1)]
+                      for timestamps, _ in source.values() if len(timestamps)]
+        timestamps = np.concatenate(candidates) if candidates else np.empty(0)
+    else:
+        timestamps = source['Timestamp'].to_numpy(dtype=np.float64)
+
+    # fmax skips the NaN timestamps like `Series.max`
+    segmentEnds = np.full(len(segmentStarts), -np.inf)
+    if len(segmentStarts) == 1:
+        segmentEnds[0] = np.fmax.reduce(timestamps, initial=-np.inf)
+    else:
+        np.fmax.at(segmentEnds, SegmentIndex(segmentStarts, timestamps), timestamps)
+    return np.where(np.isfinite(segmentEnds), segmentEnds, segmentStarts)
+
+
+def ResampleSignal(timestamps: np.ndarray, values: np.ndarray, timeBase: np.ndarray, method: str = 'hold',
+                   tolerance: float = None):
+    """ Resample a time sorted signal onto another time base.
+
+    Args:
+        timestamps: Numpy float array of sorted sample timestamps
+        values: Numpy float array of sample values
+        timeBase: Numpy float array of sorted timestamps to resample onto
+        method: 'hold' (zero-order hold), 'linear' (linear interpolation) or 'nearest'
+        tolerance: Optional maximum distance (in seconds) to the sample used, further samples give NaN
+
+    Returns:
+        resampled: Numpy float array of values on the time base, NaN where there is no sample
+
+    Raises:
+        ValueError: if the method isn't supported
+
+    """
+
+    if method not in ALIGNMENT_METHODS:
+        raise ValueError(f"expected one of {ALIGNMENT_METHODS} for method")
+    resampled = np.full(timeBase.shape, np.nan)
+    if timestamps.size == 0:
+        return resampled
+
+    if method == 'linear':
+        resampled = np.interp(timeBase, timestamps, values, left=np.nan, right=np.nan)
+        if tolerance is not None:
+            right = np.clip(np.searchsorted(timestamps, timeBase), 0, timestamps.size - 1)
+            left = np.clip(right - 1, 0, timestamps.size - 1)
+            gap = np.minimum(np.abs(timeBase - timestamps[left]), np.abs(timestamps[right] - timeBase))
+            resampled[gap > tolerance] = np.nan
+        return resampled
+
+    if method == 'hold':
+        idx = np.searchsorted(timestamps, timeBase, side='right') - 1
+        valid = idx >= 0
+    else:
+        right = np.clip(np.searchsorted(timestamps, timeBase), 0, timestamps.size - 1)
+        left = np.clip(right - 1, 0, timestamps.size - 1)
+        idx = np.where(np.abs(timeBase - timestamps[left]) <= np.abs(timestamps[right] - timeBase), left, right)
+        valid = np.ones(timeBase.shape, dtype=bool)
+
+    idx = np.clip(idx, 0, timestamps.size - 1)
+    if tolerance is not None:
+        valid &= np.abs(timeBase - timestamps[idx]) <= tolerance
+    resampled[valid] = values[idx[valid]]
+
+    return resampled
+
+
+def AlignSignals(source, keys: list, timeBase: np.ndarray = None, method: str = 'hold', tolerance: float = None,
+                 period: float = None):
+    """ Put several asynchronously sampled keys onto a common time base.
+
+    This replaces the outer merges on `Timestamp`, which leave a NaN in every column that wasn't sampled at exactly
+    that timestamp.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        keys: List of telemetry keys to align
+        timeBase: Optional sorted timestamps to align onto
+        method: 'hold' (zero-order hold), 'linear' (linear interpolation) or 'nearest'
+        tolerance: Optional maximum distance (in seconds) to the sample used, further samples give NaN
+        period: Optional sample period (in seconds) of a uniform time base over the span all of the keys share. By
+            default (and when `timeBase` isn't given) the union of the sample timestamps is used.
+
+    Returns:
+        alignedDf: Pandas dataframe with a `Timestamp` column and a column per key, without any rows if none of the
+            keys has numeric samples
+
+    Raises:
+        KeyError: if a key isn't in the telemetry
+        ValueError: if the method isn't supported
+
+    """
+
+    keyIndex = source if isinstance(source, dict) else BuildKeyIndex(source, keys)
+    signals = {key: GetSignal(keyIndex, key) for key in keys}
+
+    if timeBase is None:
+        sampled = [timestamps for timestamps, _ in signals.values() if timestamps.size]
+        if period is not None and not sampled:
+            # None of the keys has numeric samples, so there is no span to sample
+            timeBase = np.empty(0)
+        elif period is not None:
+            start = max(timestamps[0] for timestamps in sampled)
+            stop = min(timestamps[-1] for timestamps in sampled)
+            timeBase = start + period * np.arange(max(int(np.floor((stop - start) / period)) + 1, 0))
+        else:
+            timeBase = np.unique(np.concatenate([timestamps for timestamps, _ in signals.values()]))
+    timeBase = np.asarray(timeBase, dtype=np.float64)
+
+    alignedDf = pd.DataFrame({'Timestamp': timeBase})
+    for key, (timestamps, values) in signals.items():
+        alignedDf[key] = ResampleSignal(timestamps, values, timeBase, method, tolerance)
+
+    return alignedDf
+
+
+def CorrelateSignals(source, keyA: str, keyB: str, method: str = 'hold', tolerance: float = None):
+    """ Compute the Pearson correlation of two keys over the whole log.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        keyA: the first telemetry key
+        keyB: the second telemetry key
+        method: the alignment method, see `AlignSignals`
+        tolerance: the alignment tolerance, see `AlignSignals`
+
+    Returns:
+        r: the Pearson correlation coefficient, NaN if there are less than 2 aligned samples
+        count: the number of aligned samples used
+
+    Raises:
+        KeyError: if a key isn't in the telemetry
+
+    """
+
+    alignedDf = AlignSignals(source, [keyA, keyB], method=method, tolerance=tolerance).dropna()
+    if len(alignedDf) < 2:
+        return np.nan, len(alignedDf)
+    return np.corrcoef(alignedDf[keyA], alignedDf[keyB])[0, 1], len(alignedDf)
+
+
+if __name__ == "__main__":
+    import argparse
+    import DataLogReader as dlr
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Correlate telemetry keys over a whole log')
+    parser.add_argument("telemetryfile")
+    parser.add_argument("keys", nargs='+')
+    parser.add_argument("--method", choices=ALIGNMENT_METHODS, default='hold')
+    parser.add_argument("--tolerance", type=float, default=None)
+    args = parser.parse_args()
+    telemetryFile = Path(args.telemetryfile)
+    if not telemetryFile.is_file():
+        raise OSError(2, 'File not found', telemetryFile)
+
+    alignedDf = AlignSignals(dlr.ReadDataLog(telemetryFile), args.keys, method=args.method, tolerance=args.tolerance)
+    print(alignedDf.drop('Timestamp', axis=1).corr())
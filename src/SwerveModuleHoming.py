@@ -1,33 +1,66 @@
 #import math
+import json
 import DataLogHelpers as dlh
+import DataLogReader as dlr
+import SignalAlignment as sa
 import pandas as pd
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+from pathlib import Path
 from scipy.stats import shapiro
 #from matplotlib.ticker import (MultipleLocator, AutoMinorLocator)
 
+""" The `BASE_KEYS` and `TELEMETRY_KEYS` members need to match the key's from the actual robot code. In other words,
+if the code changes these need to also change. TODO: is there a better way to manage this?? Perhaps link and scrape the
+actual robot code."""
+BASE_KEYS = ['FL', 'FR', 'RL', 'RR']
 
-def PlotSwerveModuleHoming(df):
-    """Process the telemetry for swerve module homing analysis.
+MODULE_NAMES = {
+    'FL': 'Front-Left',
+    'FR': 'Front-Right',
+    'RL': 'Rear-Left',
+    'RR': 'Rear-Right',
+}
 
-    This function will take the input pandas dataframe (constructed from the WPILib
-    Data Log Tool) and filter out all of the telemetry unrelated to the swerve
-    module homing routine.
+TELEMETRY_KEYS = {
+    'Is Homed': 'boolean',
+    'Turn Abs Enc (rad)': 'float',
+    'Turn Position Setpoint (rad)': 'float',
+    'Turn Position Error (rad)': 'float',
+    'Turn Velocity Setpoint (rad/s)': 'float',
+    'Turn Velocity Error (rad/s)': 'float',
+    'Turn Feed-forward Output (V)': 'float',
+    'Turn PID Output (V)': 'float',
+    # 'Turn Rel Enc (rad)': 'float',
+    # 'Drive Rel Enc (mps)': 'float',
+}
+
+ERROR_KEYS = ['Turn Position Error (rad)', 'Turn Velocity Error (rad/s)']
+OUTPUT_KEYS = ['Turn PID Output (V)', 'Turn Feed-forward Output (V)']
+ERROR_PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+
+def GetSwerveModuleHomingData(df):
+    """Filter the telemetry down to the samples where each swerve module is actively homing.
 
-    The `baseKeys` and `telemetryKeys` members need to match the key's from the actual
-    robot code. In other words, if the code changes these need to also change. TODO: is
-    there a better way to manage this?? Perhaps link and scrape the actual robot code.
+    All four modules are split out of the telemetry in a single pass and pivoted into one wide dataframe per module
+    (a column per telemetry key).
 
     The non-homing data is filtered out using the `Is Homed` and `Turn Position Setpoint
     (rad)` keys. It is assumed that the `Is Homed` key value is initialized to false. The
     `Turn Position Setpoint (rad)` key value of 0 is filtered out. This will only become
     an issue if true absolute postion of the sensor is 0.0 radians.
 
+    In a stitched session each log is filtered on its own, since the modules home again after every restart (see
+    `SignalAlignment.GetSegmentStarts`).
+
     Args:
         df (:obj:`pd.DataFrame`): Pandas dataframe
 
     Returns:
-        none
+        filteredDfs (dict): module base key to a dataframe of the homing samples
+        homingWindows (dict): module base key to a list of (start, stop) timestamps of each homing attempt
 
     Raises:
         TypeError: if the input isn't a pandas dataframe
@@ -36,99 +69,290 @@ def PlotSwerveModuleHoming(df):
 
     dlh.VerifyInput(df)
 
-    baseKeys = ['FL', 'FR', 'RL', 'RR']
-
-    telemetryKeys = {
-        'Is Homed': 'boolean',
-        'Turn Abs Enc (rad)': 'float',
-        'Turn Position Setpoint (rad)': 'float',
-        'Turn Position Error (rad)': 'float',
-        'Turn Velocity Setpoint (rad/s)': 'float',
-        'Turn Velocity Error (rad/s)': 'float',
-        'Turn Feed-forward Output (V)': 'float',
-        'Turn PID Output (V)': 'float',
-        # 'Turn Rel Enc (rad)': 'float',
-        # 'Drive Rel Enc (mps)': 'float',
-    }
-
-    dfs = {}
+    moduleKeys = {baseKey+' '+telemetryKey: (baseKey, telemetryKey)
+                  for baseKey in BASE_KEYS for telemetryKey in TELEMETRY_KEYS}
+    moduleDf = df.loc[df['Name'].isin(moduleKeys.keys())]
+    moduleDf = pd.DataFrame({
+        'Module': moduleDf['Name'].map({name: keys[0] for name, keys in moduleKeys.items()}),
+        'Telemetry': moduleDf['Name'].map({name: keys[1] for name, keys in moduleKeys.items()}),
+        'Timestamp': moduleDf['Timestamp'],
+        'Value': sa.ToNumeric(moduleDf['Value'].to_numpy()),
+    })
+    wideDf = moduleDf.groupby(['Module', 'Timestamp', 'Telemetry'])['Value'].last().unstack('Telemetry')
+    segmentStarts = sa.GetSegmentStarts(df)
+
     filteredDfs = {}
-    for baseKey in baseKeys:
-        dfs[baseKey] = pd.DataFrame(columns=["Timestamp"])
-
-        # Get all of the columns of the telemetry keys
-        for telemetryKey, telemetryType in telemetryKeys.items():
-            if telemetryType == 'float':
-                dfs[baseKey] = pd.merge(dfs[baseKey], dlh.GetFloatColumn(
-                    df, baseKey, telemetryKey), how="outer", on=["Timestamp"])
-            elif telemetryType == 'boolean':
-                dfs[baseKey] = pd.merge(dfs[baseKey], dlh.GetBooleanColumn(
-                    df, baseKey, telemetryKey), how="outer", on=["Timestamp"])
-
-        # Remove timestamp ranges where the module isn't actively homing
-        filteredDfs[baseKey] = pd.DataFrame()
-        diff = dfs[baseKey]['Is Homed'].diff()
-        diff = diff[abs(diff) == 1.0]
-        for diffIdx, dfsIdx in enumerate(diff.index):
-            if diff.iloc[diffIdx] == 1.0:
-                endTimestamp = dfs[baseKey].iloc[dfsIdx]["Timestamp"]
-                if filteredDfs[baseKey].empty:
-                    startTimestamp = dfs[baseKey].loc[
-                        (dfs[baseKey]['Timestamp'] < endTimestamp) &
-                        (dfs[baseKey]['Turn Position Setpoint (rad)'] == 0.0)
-                    ].tail(1)["Timestamp"].item()
-                    filteredDfs[baseKey] = dfs[baseKey].loc[
-                        (dfs[baseKey]['Timestamp'] >= startTimestamp) &
-                        (dfs[baseKey]['Timestamp'] < endTimestamp)
-                    ]
-                else:
-                    filteredDfs[baseKey] = pd.concat([
-                        filteredDfs[baseKey],
-                        dfs[baseKey].loc[
-                            (dfs[baseKey]['Timestamp'] >= startTimestamp) &
-                            (dfs[baseKey]['Timestamp'] < endTimestamp)
-                        ]
-                    ])
-            elif diff.iloc[diffIdx] == -1.0:
-                startTimestamp = dfs[baseKey].iloc[dfsIdx]["Timestamp"]
+    homingWindows = {}
+    for baseKey in BASE_KEYS:
+        if baseKey not in wideDf.index.get_level_values('Module'):
+            raise KeyError(f"missing telemetry for swerve module: {baseKey}")
+        dfs = wideDf.loc[baseKey].reindex(columns=list(TELEMETRY_KEYS.keys())).reset_index()
+        dfs.columns.name = None
+        segments = sa.SegmentIndex(segmentStarts, dfs['Timestamp'].to_numpy())
+        results = [_FilterHomingSamples(segmentDf.reset_index(drop=True)) for _, segmentDf in dfs.groupby(segments)]
+        filteredDfs[baseKey] = pd.concat([filteredDf for filteredDf, _ in results], ignore_index=True)
+        homingWindows[baseKey] = [window for _, windows in results for window in windows]
+
+    return filteredDfs, homingWindows
+
+
+def ComputeSwerveModuleHomingStats(df, homingData=None):
+    """Compute the homing statistics of all four swerve modules without any plotting.
+
+    For each module this reports the homing duration, the position and velocity error percentiles and normality
+    (Shapiro-Wilk), and a summary of the PID and feed-forward outputs.
+
+    Args:
+        df (:obj:`pd.DataFrame`): Pandas dataframe
+        homingData (tuple): optional result of `GetSwerveModuleHomingData` to reuse
+
+    Returns:
+        stats (dict): module base key to a dictionary of statistics
+
+    Raises:
+        TypeError: if the input isn't a pandas dataframe
+        AttributeError: if the dataframe columns aren't [Timestamp,Name,Value]
+    """
+
+    filteredDfs, homingWindows = GetSwerveModuleHomingData(df) if homingData is None else homingData
+    segmentStarts = sa.GetSegmentStarts(df)
+
+    stats = {}
+    for baseKey in BASE_KEYS:
+        moduleDf = filteredDfs[baseKey]
+        windows = homingWindows[baseKey]
+        # An attempt which never completes lasts until the last homing sample of its log
+        timestamps = moduleDf['Timestamp'].to_numpy()
+        segments = sa.SegmentIndex(segmentStarts, timestamps)
+        stops = [stop if stop is not None else timestamps[segments == sa.SegmentIndex(segmentStarts, start)].max()
+                 for start, stop in windows]
+        moduleStats = {
+            'Module': MODULE_NAMES[baseKey],
+            'Homing Attempts': len(windows),
+            'Homed': bool(windows) and windows[-1][1] is not None,
+            'Homing Duration (s)': float(sum(stop - start for (start, _), stop in zip(windows, stops))),
+            'Samples': len(moduleDf),
+        }
+
+        for key in ERROR_KEYS:
+            errors = moduleDf[key].dropna().to_numpy()
+            moduleStats[key] = _ErrorStats(errors)
+        for key in OUTPUT_KEYS:
+            outputs = moduleDf[key].dropna().to_numpy()
+            moduleStats[key] = {
+                'Mean': _Float(np.mean(outputs)) if outputs.size else None,
+                'Std': _Float(np.std(outputs)) if outputs.size else None,
+                'Min': _Float(np.min(outputs)) if outputs.size else None,
+                'Max': _Float(np.max(outputs)) if outputs.size else None,
+                'RMS': _Float(np.sqrt(np.mean(outputs**2))) if outputs.size else None,
+            }
+        stats[baseKey] = moduleStats
+
+    return stats
+
+
+def WriteSwerveModuleHomingStats(stats, outputDir, logName=''):
+    """Write the swerve module homing statistics to JSON and CSV files.
+
+    The JSON file keeps the nested statistics. The CSV file has one row per module with the nested statistics
+    flattened into `<key> <statistic>` columns.
+
+    Args:
+        stats (dict): the statistics returned by `ComputeSwerveModuleHomingStats`
+        outputDir (:obj:`Path`): directory to write `homing_stats.json` and `homing_stats.csv` to
+        logName (str): optional log name added as the `Log` column of the CSV
+
+    Returns:
+        statsDf (:obj:`pd.DataFrame`): the flattened statistics
+
+    Raises:
+        None
+    """
+
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+    with open(outputDir / 'homing_stats.json', 'w') as f:
+        json.dump(stats, f, indent=2)
+
+    statsDf = FlattenSwerveModuleHomingStats(stats, logName)
+    statsDf.to_csv(outputDir / 'homing_stats.csv', index=False)
+
+    return statsDf
+
+
+def FlattenSwerveModuleHomingStats(stats, logName=''):
+    """Flatten the swerve module homing statistics into one row per module.
+
+    Args:
+        stats (dict): the statistics returned by `ComputeSwerveModuleHomingStats`
+        logName (str): optional log name added as the `Log` column
+
+    Returns:
+        statsDf (:obj:`pd.DataFrame`): the flattened statistics
+
+    Raises:
+        None
+    """
+
+    rows = []
+    for baseKey, moduleStats in stats.items():
+        row = {'Log': logName, 'Base Key': baseKey}
+        for name, value in moduleStats.items():
+            if isinstance(value, dict):
+                row.update({f'{name} {statName}': statValue for statName, statValue in value.items()})
             else:
-                raise ValueError("Expected 1.0 or -1.0 for Is Homed")
+                row[name] = value
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def PlotSwerveModuleHoming(df, outputDir=None, homingData=None):
+    """Process the telemetry for swerve module homing analysis.
+
+    This function will take the input pandas dataframe (constructed from the WPILib
+    Data Log Tool) and filter out all of the telemetry unrelated to the swerve
+    module homing routine (see `GetSwerveModuleHomingData`).
+
+    Args:
+        df (:obj:`pd.DataFrame`): Pandas dataframe
+        outputDir (:obj:`Path`): optional directory to save the plots to instead of showing them
+        homingData (tuple): optional result of `GetSwerveModuleHomingData` to reuse
+
+    Returns:
+        none
 
-        # Handle the case where the module never completes homing
-        if filteredDfs[baseKey].empty:
-            startTimestamp = dfs[baseKey].loc[
-                (dfs[baseKey]['Timestamp'] < endTimestamp) &
-                (dfs[baseKey]['Turn Position Setpoint (rad)'] == 0.0)
-            ].tail(1)["Timestamp"].item()
-            filteredDfs[baseKey] = dfs[baseKey].loc[
-                (dfs[baseKey]['Timestamp'] >= startTimestamp)
-            ]
+    Raises:
+        TypeError: if the input isn't a pandas dataframe
+        AttributeError: if the dataframe columns aren't [Timestamp,Name,Value]
+    """
 
-        # Drop any remaining unwanted columns
-        filteredDfs[baseKey] = filteredDfs[baseKey].drop(['Is Homed'], axis=1)
+    filteredDfs, _ = GetSwerveModuleHomingData(df) if homingData is None else homingData
 
     # Plot the data
-    fig1, axes1 = plt.subplot_mosaic("AA;BC")
-    fig2, axes2 = plt.subplot_mosaic("AA;BC")
-    fig3, axes3 = plt.subplot_mosaic("AA;BC")
-    fig4, axes4 = plt.subplot_mosaic("AA;BC")
-    axes = [axes1, axes2, axes3, axes4]
+    figs = {}
+    for baseKey in BASE_KEYS:
+        fig = plt.figure()
+        DrawSwerveModuleHoming(fig, filteredDfs[baseKey], baseKey)
+        figs[baseKey] = fig
+
+    if outputDir is None:
+        plt.show()
+        return
+
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+    for baseKey, fig in figs.items():
+        fig.savefig(outputDir / f'{MODULE_NAMES[baseKey]} Swerve Module.png', bbox_inches='tight')
+        plt.close(fig)
+
+
+def DrawSwerveModuleHoming(figure, moduleDf, baseKey):
+    """Draw the homing signals and error histograms of one swerve module onto a figure.
 
-    fig1.suptitle('Front-Left Swerve Module', fontsize=18)
-    fig2.suptitle('Front-Right Swerve Module', fontsize=18)
-    fig3.suptitle('Rear-Left Swerve Module', fontsize=18)
-    fig4.suptitle('Rear-Right Swerve Module', fontsize=18)
-    plt.rc('legend', fontsize=6)
+    Nothing is shown, so the figure can be a pyplot figure or one embedded in a GUI (e.g. on a `FigureCanvasTkAgg`).
 
-    for idx, baseKey in enumerate(baseKeys):
-        __PlotSignals(filteredDfs[baseKey], axes[idx]["A"], 'Homing Signals')
-        __PlotHistograms(filteredDfs[baseKey]['Turn Position Error (rad)'],
-                         axes[idx]["B"], 'Position Error Histograms')
-        __PlotHistograms(filteredDfs[baseKey]['Turn Velocity Error (rad/s)'],
-                         axes[idx]["C"], 'Velocity Error Histograms')
+    Args:
+        figure (:obj:`Figure`): the matplotlib figure to draw on
+        moduleDf (:obj:`pd.DataFrame`): the homing samples of the module from `GetSwerveModuleHomingData`
+        baseKey (str): the module base key
+
+    Returns:
+        none
+
+    Raises:
+        None
+    """
+
+    with matplotlib.rc_context({'legend.fontsize': 6}):
+        axes = figure.subplot_mosaic("AA;BC")
+        figure.suptitle(f'{MODULE_NAMES[baseKey]} Swerve Module', fontsize=18)
+        moduleDf = moduleDf.drop(['Is Homed'], axis=1)
+        __PlotSignals(moduleDf, axes["A"], 'Homing Signals')
+        __PlotHistograms(moduleDf['Turn Position Error (rad)'],
+                         axes["B"], 'Position Error Histograms')
+        __PlotHistograms(moduleDf['Turn Velocity Error (rad/s)'],
+                         axes["C"], 'Velocity Error Histograms')
+        figure.tight_layout()
+
+
+def _FilterHomingSamples(dfs):
+    # Remove timestamp ranges where the module isn't actively homing
+    filteredDf = pd.DataFrame()
+    windows = []
+    startTimestamp = None
+    # The keys are sampled at different timestamps, so hold the last `Is Homed` value across the other samples
+    diff = dfs['Is Homed'].ffill().diff()
+    diff = diff[abs(diff) == 1.0]
+    for diffIdx, dfsIdx in enumerate(diff.index):
+        if diff.iloc[diffIdx] == 1.0:
+            endTimestamp = dfs.iloc[dfsIdx]["Timestamp"]
+            if filteredDf.empty:
+                startTimestamp = _LastZeroSetpointTimestamp(dfs, endTimestamp)
+                filteredDf = dfs.loc[
+                    (dfs['Timestamp'] >= startTimestamp) &
+                    (dfs['Timestamp'] < endTimestamp)
+                ]
+            elif startTimestamp is not None:
+                filteredDf = pd.concat([
+                    filteredDf,
+                    dfs.loc[
+                        (dfs['Timestamp'] >= startTimestamp) &
+                        (dfs['Timestamp'] < endTimestamp)
+                    ]
+                ])
+            if startTimestamp is not None:
+                windows.append((startTimestamp, endTimestamp))
+            startTimestamp = None
+        elif diff.iloc[diffIdx] == -1.0:
+            startTimestamp = dfs.iloc[dfsIdx]["Timestamp"]
+        else:
+            raise ValueError("Expected 1.0 or -1.0 for Is Homed")
+
+    # Handle the case where the module never completes homing
+    if filteredDf.empty:
+        startTimestamp = _LastZeroSetpointTimestamp(dfs, np.inf)
+        filteredDf = dfs.loc[
+            (dfs['Timestamp'] >= startTimestamp)
+        ]
+        windows = [(startTimestamp, None)]
 
-    plt.tight_layout()
-    plt.show()
+    return filteredDf, windows
+
+
+def _LastZeroSetpointTimestamp(dfs, endTimestamp):
+    zeroSetpoint = dfs.loc[
+        (dfs['Timestamp'] < endTimestamp) &
+        (dfs['Turn Position Setpoint (rad)'] == 0.0)
+    ]
+    if zeroSetpoint.empty:
+        return dfs['Timestamp'].min()
+    return zeroSetpoint.tail(1)["Timestamp"].item()
+
+
+def _ErrorStats(errors):
+    errorStats = {f'P{percentile}': None for percentile in ERROR_PERCENTILES}
+    errorStats.update({'Mean': None, 'Std': None, 'Max Abs': None, 'Shapiro P': None, 'Gaussian': None})
+    if errors.size == 0:
+        return errorStats
+
+    for percentile, value in zip(ERROR_PERCENTILES, np.percentile(errors, ERROR_PERCENTILES)):
+        errorStats[f'P{percentile}'] = _Float(value)
+    errorStats['Mean'] = _Float(np.mean(errors))
+    errorStats['Std'] = _Float(np.std(errors))
+    errorStats['Max Abs'] = _Float(np.max(np.abs(errors)))
+    if errors.size >= 3 and np.ptp(errors) > 0.0:
+        stat, p = shapiro(errors)
+        alpha = 0.05  # 95% confidence
+        errorStats['Shapiro P'] = _Float(p)
+        errorStats['Gaussian'] = bool(p > alpha)
+
+    return errorStats
+
+
+def _Float(value):
+    value = float(value)
+    return None if np.isnan(value) else value
 
 
 def __PlotSignals(module, axis, title):
@@ -160,14 +384,49 @@ def __PlotHistograms(module, axis, title):
     axis.legend([txt])
 
 
-df = pd.read_csv(
-    r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_013534.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_013024.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_012513.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_012152.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_011927.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_011621.csv")
-# r"C:\Users\ejmcc\Documents\GIT Projects\Data-Log-Analysis\logs\FRC_20221116_011206.csv")
+def _AnalyzeLog(telemetryFile, outputDir, plots):
+    df = dlr.ReadDataLog(telemetryFile)
+    logOutputDir = outputDir / dlr.GetLogName(telemetryFile)
+    try:
+        homingData = GetSwerveModuleHomingData(df)
+    except KeyError as e:
+        print(f'{telemetryFile.name}: skipped, {e}')
+        return None
+    stats = ComputeSwerveModuleHomingStats(df, homingData)
+    statsDf = WriteSwerveModuleHomingStats(stats, logOutputDir, telemetryFile.name)
+    if plots:
+        plt.switch_backend('Agg')
+        PlotSwerveModuleHoming(df, logOutputDir, homingData)
+    return statsDf
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description='Headless swerve module homing analysis')
+    parser.add_argument("telemetry", nargs='+', help='telemetry files or directories of telemetry files')
+    parser.add_argument("--output", default=str(Path(__file__).resolve().parents[1] / 'output'))
+    parser.add_argument("--plots", action='store_true', help='save the homing plots for each log')
+    parser.add_argument("--jobs", type=int, default=1, help='number of logs to analyze in parallel')
+    args = parser.parse_args()
+
+    telemetryFiles = []
+    for telemetry in map(Path, args.telemetry):
+        if telemetry.is_dir():
+            telemetryFiles.extend(dlr.FindDataLogs(telemetry))
+        elif telemetry.is_file():
+            telemetryFiles.append(telemetry)
+        else:
+            raise OSError(2, 'File not found', telemetry)
 
+    outputDir = Path(args.output)
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        statsDfs = list(executor.map(_AnalyzeLog, telemetryFiles,
+                                     [outputDir] * len(telemetryFiles), [args.plots] * len(telemetryFiles)))
+    statsDfs = [statsDf for statsDf in statsDfs if statsDf is not None]
 
-PlotSwerveModuleHoming(df)
+    if statsDfs:
+        outputDir.mkdir(parents=True, exist_ok=True)
+        pd.concat(statsDfs, ignore_index=True).to_csv(outputDir / 'homing_stats.csv', index=False)
+        print(f'Wrote the homing statistics of {len(statsDfs)} log(s) to {outputDir}')
@@ -0,0 +1,147 @@
+import json
+import numpy as np
+import SignalAlignment as sa
+import SwerveModuleHoming as smh
+from pathlib import Path
+from scipy.signal import welch
+
+""" The turn control loop channels of each module which are checked for oscillation."""
+OSCILLATION_KEYS = ['Turn Position Error (rad)', 'Turn Velocity Error (rad/s)', 'Turn PID Output (V)']
+
+""" The channels are resampled onto a uniform grid at the robot loop period (in seconds)."""
+SAMPLE_PERIOD = 0.02
+
+""" The length (in seconds) of each Welch segment, which sets the frequency resolution of the spectra."""
+SEGMENT_TIME = 5.12
+
+""" The frequency band (in Hz) where sustained oscillation of a turn loop shows up. Slower content is the steering
+commands themselves, faster content is aliased by the 50 Hz logging."""
+OSCILLATION_BAND = (1.0, 20.0)
+
+
+def GetSwerveSpectra(source, startTime=None, stopTime=None, period=SAMPLE_PERIOD, segmentTime=SEGMENT_TIME):
+    """Compute the Welch power spectra of the turn loop channels of all four swerve modules.
+
+    The channels are resampled onto one uniform grid and stacked into a (channels, samples) array, so the spectra of
+    every channel are computed in a single batched call.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        startTime (float): optional start of the time range to analyze
+        stopTime (float): optional end of the time range to analyze
+        period (float): the resampling period in seconds
+        segmentTime (float): the length of each Welch segment in seconds
+
+    Returns:
+        keys (list): the (module base key, channel) of each row of the spectra
+        frequencies (:obj:`np.ndarray`): the frequencies of the spectra in Hz
+        spectra (:obj:`np.ndarray`): the (channels, frequencies) power spectral densities
+
+    Raises:
+        KeyError: if a swerve channel isn't in the telemetry
+        ValueError: if the time range is shorter than one Welch segment
+    """
+
+    keys = [(base, channel) for base in smh.BASE_KEYS for channel in OSCILLATION_KEYS]
+    aligned = sa.AlignSignals(source, [f'{base} {channel}' for base, channel in keys], method='linear', period=period)
+    if startTime is not None:
+        aligned = aligned[aligned['Timestamp'] >= startTime]
+    if stopTime is not None:
+        aligned = aligned[aligned['Timestamp'] <= stopTime]
+
+    samples = aligned.drop(columns='Timestamp').to_numpy(dtype=np.float64).T
+    nperseg = int(round(segmentTime / period))
+    if samples.shape[1] < nperseg:
+        raise ValueError(f"expected at least {segmentTime} s of swerve telemetry, got {samples.shape[1] * period} s")
+
+    frequencies, spectra = welch(samples, fs=1.0 / period, nperseg=nperseg, detrend='linear', axis=-1)
+    return keys, frequencies, spectra
+
+
+def ComputeSwerveOscillationStats(source, startTime=None, stopTime=None, band=OSCILLATION_BAND):
+    """Find the dominant oscillation of each turn loop channel of each swerve module.
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        startTime (float): optional start of the time range to analyze
+        stopTime (float): optional end of the time range to analyze
+        band (tuple): the (low, high) frequency band in Hz to look for oscillation in
+
+    Returns:
+        stats (dict): module base key to channel to the `Dominant Frequency (Hz)`, its `Peak PSD`, the `Band Energy`
+            (the variance in the band), the `Total Energy` (the variance of the detrended channel) and the
+            `Band Fraction` of the energy in the band. The dominant frequency is None for a channel with no energy
+            in the band
+
+    Raises:
+        KeyError: if a swerve channel isn't in the telemetry
+        ValueError: if the time range is shorter than one Welch segment
+    """
+
+    keys, frequencies, spectra = GetSwerveSpectra(source, startTime, stopTime)
+
+    # Integrate and search the band for every channel at once
+    binWidth = frequencies[1] - frequencies[0]
+    inBand = (frequencies >= band[0]) & (frequencies <= band[1])
+    bandSpectra = spectra[:, inBand]
+    peaks = np.argmax(bandSpectra, axis=1)
+    bandEnergy = bandSpectra.sum(axis=1) * binWidth
+    totalEnergy = spectra.sum(axis=1) * binWidth
+    bandFraction = np.divide(bandEnergy, totalEnergy, out=np.zeros_like(bandEnergy), where=totalEnergy > 0)
+
+    stats = {base: {} for base in smh.BASE_KEYS}
+    for i, (base, channel) in enumerate(keys):
+        stats[base][channel] = {
+            'Dominant Frequency (Hz)': float(frequencies[inBand][peaks[i]]) if bandEnergy[i] > 0 else None,
+            'Peak PSD': float(bandSpectra[i, peaks[i]]),
+            'Band Energy': float(bandEnergy[i]),
+            'Total Energy': float(totalEnergy[i]),
+            'Band Fraction': float(bandFraction[i]),
+        }
+
+    return stats
+
+
+def WriteSwerveOscillationStats(stats, outputDir):
+    """Write the oscillation stats of a log to `oscillation_stats.json` in the output directory."""
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+    with open(outputDir / 'oscillation_stats.json', 'w') as f:
+        json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    import DataLogReader as dlr
+
+    parser = argparse.ArgumentParser(description='Find sustained oscillation of the swerve turn loops')
+    parser.add_argument("telemetry", nargs='+', help='telemetry files or directories of telemetry files')
+    parser.add_argument("--start", type=float, default=None)
+    parser.add_argument("--stop", type=float, default=None)
+    parser.add_argument("--output", default=None, help='write oscillation_stats.json for each log under this directory')
+    args = parser.parse_args()
+
+    telemetryFiles = []
+    for path in map(Path, args.telemetry):
+        if path.is_dir():
+            telemetryFiles.extend(dlr.FindDataLogs(path))
+        elif path.is_file():
+            telemetryFiles.append(path)
+        else:
+            raise OSError(2, 'File not found', path)
+
+    for telemetryFile in telemetryFiles:
+        try:
+            keyIndex = sa.BuildKeyIndex(dlr.ReadDataLog(telemetryFile))
+            stats = ComputeSwerveOscillationStats(keyIndex, args.start, args.stop)
+        except (KeyError, ValueError) as e:
+            print(f'{telemetryFile.name}: skipped, {e}')
+            continue
+        if args.output is not None:
+            WriteSwerveOscillationStats(stats, Path(args.output) / dlr.GetLogName(telemetryFile))
+        print(telemetryFile.name)
+        for base, channels in stats.items():
+            for channel, channelStats in channels.items():
+                frequency = channelStats['Dominant Frequency (Hz)']
+                frequency = '    -' if frequency is None else f'{frequency:5.2f}'
+                print(f'  {base} {channel:<30} {frequency} Hz  band fraction {channelStats["Band Fraction"]:.2f}')
@@ -0,0 +1,106 @@
+import copy
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import TelemetryKeys as tk
+
+""" The risk directions, `above` is high risk above the thresholds and `below` is high risk below them."""
+RISK_DIRECTIONS = ('above', 'below')
+
+
+def ThresholdTable(thresholds: dict):
+    """ Build the threshold table from a dictionary of metric name to its thresholds (see `METRIC_THRESHOLDS`).
+
+    Args:
+        thresholds: Dictionary of metric name to its `lowRisk`, `highRisk`, `direction` and `format`
+
+    Returns:
+        thresholdTable: Pandas dataframe indexed by metric name with the `lowRisk`, `highRisk`, `direction` and
+            `format` columns, a missing threshold is NaN and never reached
+
+    Raises:
+        ValueError: if a direction isn't one of `RISK_DIRECTIONS`
+
+    """
+
+    thresholdTable = pd.DataFrame.from_dict(thresholds, orient='index',
+                                            columns=['lowRisk', 'highRisk', 'direction', 'format'])
+    thresholdTable[['lowRisk', 'highRisk']] = thresholdTable[['lowRisk', 'highRisk']].astype(np.float64)
+    thresholdTable['direction'] = thresholdTable['direction'].fillna('above')
+    thresholdTable['format'] = thresholdTable['format'].fillna('.2f')
+    invalid = ~thresholdTable['direction'].isin(RISK_DIRECTIONS)
+    if invalid.any():
+        raise ValueError(f"expected one of {RISK_DIRECTIONS} for the direction of {thresholdTable.index[invalid][0]}")
+    return thresholdTable
+
+
+def LoadMetricThresholds(configFile: Path = None, thresholds: dict = tk.METRIC_THRESHOLDS):
+    """ Load the threshold table, overriding the default thresholds with those of a JSON config file.
+
+    The config file is a JSON object of metric name to the thresholds to override, e.g.
+    `{"CAN Utilization": {"lowRisk": 0.5}}`. Only the given fields change, and new metric names are added.
+
+    Args:
+        configFile: optional Path to the JSON config file
+        thresholds: the default thresholds
+
+    Returns:
+        thresholdTable: the threshold table (see `ThresholdTable`)
+
+    Raises:
+        ValueError: if a direction isn't one of `RISK_DIRECTIONS`
+
+    """
+
+    thresholds = copy.deepcopy(thresholds)
+    if configFile is not None:
+        with open(configFile) as f:
+            for name, overrides in json.load(f).items():
+                thresholds[name] = {**thresholds.get(name, {}), **overrides}
+    return ThresholdTable(thresholds)
+
+
+def ClassifyMetrics(metricValues: pd.DataFrame, thresholdTable: pd.DataFrame):
+    """ Classify raw metric values against the threshold table in one vectorized pass.
+
+    The values of a `below` metric are negated along with its thresholds, so every metric is compared as high risk
+    above its thresholds. A missing value (NaN) is `metric_not_implemented` and a metric without thresholds is always
+    `metric_ok`.
+
+    Args:
+        metricValues: Pandas dataframe of raw values with a column per metric, e.g. a row per log
+        thresholdTable: the threshold table (see `ThresholdTable`)
+
+    Returns:
+        cellEncodings: Pandas dataframe of the cell encoding of every value, with the same index and columns
+
+    Raises:
+        None
+
+    """
+
+    table = thresholdTable.reindex(metricValues.columns)
+    sign = np.where(table['direction'] == 'below', -1.0, 1.0)
+    values = metricValues.to_numpy(dtype=np.float64) * sign
+    lowRisk = table['lowRisk'].to_numpy(dtype=np.float64) * sign
+    highRisk = table['highRisk'].to_numpy(dtype=np.float64) * sign
+
+    cellEncodings = np.select([np.isnan(values), values > highRisk, values > lowRisk],
+                              ['metric_not_implemented', 'metric_high_risk', 'metric_low_risk'], 'metric_ok')
+    return pd.DataFrame(cellEncodings, index=metricValues.index, columns=metricValues.columns)
+
+
+def DeviceEncodings(cellEncodings: pd.DataFrame):
+    """ Get the device encoding of each row of cell encodings, the worst risk of its metrics."""
+    highRisk = (cellEncodings == 'metric_high_risk').any(axis=1).to_numpy()
+    lowRisk = (cellEncodings == 'metric_low_risk').any(axis=1).to_numpy()
+    return np.select([highRisk, lowRisk], ['device_high_risk', 'device_low_risk'], 'device_ok')
+
+
+def FormatMetric(name: str, value, thresholdTable: pd.DataFrame):
+    """ Format a raw metric value as its stoplight label, e.g. `CAN Utilization: 0.44`."""
+    if value is None or np.isnan(value):
+        return f'{name}: N/A'
+    spec = thresholdTable.at[name, 'format'] if name in thresholdTable.index else '.2f'
+    return f'{name}: {value:{spec}}'
@@ -0,0 +1,34 @@
+import fnmatch
+import AnomalyScan as an
+import numpy as np
+
+""" The anomaly scan statistics which are classified for the other signals column (see `METRIC_THRESHOLDS`)."""
+ANOMALY_STATISTICS = ('Spike Count', 'Stuck Fraction', 'NaN Count', 'Gap Ratio')
+
+
+def ProcessOtherSignals(keyIndex: dict, excludeKeys: list = (), constantKeys: list = ()):
+    ''' Process every numeric key which doesn't have its own stoplight metrics.
+
+    All of the keys are scanned together in one grouped pass over the key index (see `AnomalyScan.ScanAnomalies`),
+    so a failing sensor shows up without a `pFunc` for its key.
+
+    Args:
+        keyIndex: the key index from `BuildKeyIndex`
+        excludeKeys: the keys which already have stoplight metrics
+        constantKeys: globs of the keys which are expected to be constant, their `Stuck Fraction` is None
+
+    Returns:
+        metrics: Dictionary of key to a dictionary of its `ANOMALY_STATISTICS`, a statistic which can't be computed
+            is None
+
+    Raises:
+        None
+
+    '''
+    stats = an.ScanAnomalies(keyIndex, [key for key in keyIndex if key not in excludeKeys])
+    stats = stats[list(ANOMALY_STATISTICS)].copy()
+    constant = [key for key in stats.index if any(fnmatch.fnmatchcase(key, pattern) for pattern in constantKeys)]
+    stats.loc[constant, 'Stuck Fraction'] = np.nan
+
+    return {key: {name: None if np.isnan(value) else float(value) for name, value in row.items()}
+            for key, row in stats.iterrows()}
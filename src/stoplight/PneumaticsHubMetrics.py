@@ -1,10 +1,12 @@
+import DataLogHelpers as dlh
 import pandas as pd
 import matplotlib.pyplot as plt
+from pathlib import Path
 from typing import Callable
 pd.options.mode.chained_assignment = None
 
 
-def ProcessPressure(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessPressure(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the pneumatics hub pressure telemetry data.
 
     Spec the pressure when the robot is first enabled. This will check that the pneumatics were charged up in the pit
@@ -15,71 +17,63 @@ def ProcessPressure(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
 
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    pressure = robotTelemetry[robotTelemetry['Name'] == key]
-    if pressure.empty:
-        return 'Starting Pressure: 0.0', 'metric_not_implemented'
-    pressure[key] = cFunc(pressure['Value'])
-
-    metric = pressure[key].iloc[0]
-    metricEncoding = 'metric_ok'
-    if metric < 80.0:
-        metricEncoding = 'metric_high_risk'
-    elif metric < 100.0:
-        metricEncoding = 'metric_low_risk'
+    if key not in keyIndex:
+        return {'Starting Pressure': None}
+    timestamps, values = keyIndex[key]
+    pressure = pd.DataFrame({'Timestamp': timestamps, key: cFunc(pd.Series(values))})
 
     # Create and save plots
-    fig, ax = plt.subplot_mosaic("A")
-    fig.suptitle('Pressure Analysis', fontsize=16)
-    pressure.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
-    plt.savefig(r'..\..\output\Pressure.png', bbox_inches='tight')
+    with dlh.PYPLOT_LOCK:
+        fig, ax = plt.subplot_mosaic("A")
+        fig.suptitle('Pressure Analysis', fontsize=16)
+        pressure.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
+        fig.savefig(outputDir / 'Pressure.png', bbox_inches='tight')
+        plt.close(fig)
 
-    return [f'Starting Pressure: {metric:.1f}'], [metricEncoding]
+    return {'Starting Pressure': float(pressure[key].iloc[0])}
 
 
-def ProcessCompressorCurrent(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessCompressorCurrent(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the pneumatics hub compresoor current telemetry data.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    current = robotTelemetry[robotTelemetry['Name'] == key]
-    if current.empty:
-        return 'Max Compressor Current: 0.0', 'metric_not_implemented'
-    current[key] = cFunc(current['Value'])
-
-    metric = current[key].max()
-    metricEncoding = 'metric_ok'
-    if metric > 20.0:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 16.0:
-        metricEncoding = 'metric_low_risk'
+    if key not in keyIndex:
+        return {'Max Compressor Current': None}
+    timestamps, values = keyIndex[key]
+    current = pd.DataFrame({'Timestamp': timestamps, key: cFunc(pd.Series(values))})
 
     # Create and save plots
-    fig, ax = plt.subplot_mosaic("A")
-    fig.suptitle('Compressor Current Analysis', fontsize=16)
-    current.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
-    plt.savefig(r'..\..\output\Current.png', bbox_inches='tight')
-
-    return [f'Max Compressor Current: {metric:.1f}'], [metricEncoding]
+    with dlh.PYPLOT_LOCK:
+        fig, ax = plt.subplot_mosaic("A")
+        fig.suptitle('Compressor Current Analysis', fontsize=16)
+        current.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
+        fig.savefig(outputDir / 'Current.png', bbox_inches='tight')
+        plt.close(fig)
+
+    return {'Max Compressor Current': float(current[key].max())}
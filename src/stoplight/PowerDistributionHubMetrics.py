@@ -1,50 +1,39 @@
+import DataLogHelpers as dlh
 import pandas as pd
 import matplotlib.pyplot as plt
+from pathlib import Path
 from typing import Callable
 pd.options.mode.chained_assignment = None
 
 
-def ProcessInputVoltage(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
-    ''' Process the power distribution hub pressure telemetry data.
+def ProcessInputVoltage(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
+    ''' Process the power distribution hub input voltage telemetry data.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    voltage = robotTelemetry[robotTelemetry['Name'] == key]
-    if voltage.empty:
-        return 'Ending Voltage: 0.0', 'metric_not_implemented'
-    voltage[key] = cFunc(voltage['Value'])
-
-    endVoltage = voltage[key].iloc[-1]
-    endVoltageMetricEncoding = 'metric_ok'
-    if endVoltage < 11.0:
-        endVoltageMetricEncoding = 'metric_high_risk'
-    elif endVoltage < 11.2:
-        endVoltageMetricEncoding = 'metric_low_risk'
-
-    startVoltage = voltage[key].iloc[0]
-    startVoltageMetricEncoding = 'metric_ok'
-    if startVoltage < 11.5:
-        startVoltageMetricEncoding = 'metric_high_risk'
-    elif startVoltage < 11.7:
-        startVoltageMetricEncoding = 'metric_low_risk'
+    if key not in keyIndex:
+        return {'Starting Voltage': None, 'Ending Voltage': None}
+    timestamps, values = keyIndex[key]
+    voltage = pd.DataFrame({'Timestamp': timestamps, key: cFunc(pd.Series(values))})
 
     # Create and save plots
-    fig, ax = plt.subplot_mosaic("A")
-    fig.suptitle('Voltage Analysis', fontsize=16)
-    voltage.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
-    plt.savefig(r'..\..\output\Voltage.png', bbox_inches='tight')
-
-    metrics = [f'Starting Voltage: {startVoltage:.2f}', f'Ending Voltage: {endVoltage:.2f}']
-
-    return metrics, [endVoltageMetricEncoding, startVoltageMetricEncoding]
+    with dlh.PYPLOT_LOCK:
+        fig, ax = plt.subplot_mosaic("A")
+        fig.suptitle('Voltage Analysis', fontsize=16)
+        voltage.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
+        fig.savefig(outputDir / 'Voltage.png', bbox_inches='tight')
+        plt.close(fig)
+
+    return {'Starting Voltage': float(voltage[key].iloc[0]), 'Ending Voltage': float(voltage[key].iloc[-1])}
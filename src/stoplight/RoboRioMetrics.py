@@ -1,252 +1,210 @@
 import pandas as pd
 import numpy as np
+from pathlib import Path
 from typing import Callable
 from scipy.stats import shapiro
 import matplotlib.pyplot as plt
+import DataLogHelpers as dlh
+import RunLengthSignals as rls
 pd.options.mode.chained_assignment = None
 
 
-def ProcessBrownedOut(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessBrownedOut(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio browned out telemetry data.
 
-    Get the count of brownouts.
+    Get the count of brownouts. The flag is read from the run-length index of the log, so each brownout counts once
+    no matter how many samples it lasts and the count costs O(runs).
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    brownOut = robotTelemetry[robotTelemetry['Name'] == key]
-    if brownOut.empty:
-        return 'Brownout Count: 0', 'metric_not_implemented'
-    brownOut[key] = cFunc(brownOut['Value'])
+    brownOut = rls.GetRunLengthSignal(keyIndex, key, runLengthIndex)
+    if brownOut is None:
+        return {'Brownout Count': None}
 
-    metric = brownOut[key].sum()
-    metricEncoding = 'metric_ok'
-    if metric > 1:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 0:
-        metricEncoding = 'metric_low_risk'
+    # Count the runs where the robot is browned out rather than every browned out sample
+    return {'Brownout Count': int((cFunc(pd.Series(brownOut.runValues)) == 1).sum())}
 
-    return [f'Brownout Count: {metric}'], [metricEncoding]
 
-
-def ProcessCanUtilization(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessCanUtilization(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio CAN utilization telemetry data.
 
-    Take the average of all CAN utilization data and spec that.
+    Take the average of all CAN utilization data (a fraction of the bus bandwidth) and spec that.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    canUtilization = robotTelemetry[robotTelemetry['Name'] == key]
-    if canUtilization.empty:
-        return 'CAN Utilization: 0.0', 'metric_not_implemented'
-    canUtilization[key] = cFunc(canUtilization['Value'])
-
-    metric = canUtilization[key].mean()
-    metricEncoding = 'metric_ok'
-    if metric > 80.0:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 60.0:
-        metricEncoding = 'metric_low_risk'
+    if key not in keyIndex:
+        return {'CAN Utilization': None}
+    timestamps, values = keyIndex[key]
+    canUtilization = pd.DataFrame({'Timestamp': timestamps, key: cFunc(pd.Series(values))})
 
-    return [f'CAN Utilization: {metric:.2f}'], [metricEncoding]
+    return {'CAN Utilization': float(canUtilization[key].mean())}
 
 
-def ProcessCanOffCount(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessCanOffCount(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio CAN off count telemetry data.
 
-    Filter this to grab the latest output. This will be used to spec the ending count and not used as an event to
-    correlate to another metric.
+    The counter is read from the run-length index of the log, so grabbing the latest output costs O(runs) (see
+    `GetRunLengthSignal`). This will be used to spec the ending count, see `EventDetection.IncrementEvents` to
+    correlate the increments to another metric.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    canOffCount = robotTelemetry[robotTelemetry['Name'] == key]
-    canOffCount = canOffCount[canOffCount['Timestamp'] == canOffCount['Timestamp'].max()]
-    if canOffCount.empty:
-        return 'CAN Off Count: 0', 'metric_not_implemented'
-    canOffCount[key] = cFunc(canOffCount['Value'])
-
-    metric = canOffCount[key].values[0]
-    metricEncoding = 'metric_ok'
-    if metric > 5:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 0:
-        metricEncoding = 'metric_low_risk'
+    canOffCount = rls.GetRunLengthSignal(keyIndex, key, runLengthIndex)
+    if canOffCount is None:
+        return {'CAN Off Count': None}
 
-    return [f'CAN Off Count: {metric}'], [metricEncoding]
+    return {'CAN Off Count': float(cFunc(pd.Series([canOffCount.LastValue()])).iloc[0])}
 
 
-def ProcessCanRxErrorCount(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessCanRxErrorCount(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio CAN receive error count telemetry data.
 
-    Filter this to grab the latest output. This will be used to spec the ending count and not used as an event to
-    correlate to another metric.
+    The counter is read from the run-length index of the log, so grabbing the latest output costs O(runs) (see
+    `GetRunLengthSignal`). This will be used to spec the ending count, see `EventDetection.IncrementEvents` to
+    correlate the increments to another metric.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    canRxErrCount = robotTelemetry[robotTelemetry['Name'] == key]
-    canRxErrCount = canRxErrCount[canRxErrCount['Timestamp'] == canRxErrCount['Timestamp'].max()]
-    if canRxErrCount.empty:
-        return 'CAN Rx Error Count: 0', 'metric_not_implemented'
-    canRxErrCount[key] = cFunc(canRxErrCount['Value'])
+    canRxErrCount = rls.GetRunLengthSignal(keyIndex, key, runLengthIndex)
+    if canRxErrCount is None:
+        return {'CAN Rx Error Count': None}
 
-    metric = canRxErrCount[key].values[0]
-    metricEncoding = 'metric_ok'
-    if metric > 5:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 0:
-        metricEncoding = 'metric_low_risk'
+    return {'CAN Rx Error Count': float(cFunc(pd.Series([canRxErrCount.LastValue()])).iloc[0])}
 
-    return [f'CAN Rx Error Count: {metric}'], [metricEncoding]
 
-
-def ProcessCanTxErrorCount(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessCanTxErrorCount(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio CAN transmit error count telemetry data.
 
-    Filter this to grab the latest output. This will be used to spec the ending count and not used as an event to
-    correlate to another metric.
+    The counter is read from the run-length index of the log, so grabbing the latest output costs O(runs) (see
+    `GetRunLengthSignal`). This will be used to spec the ending count, see `EventDetection.IncrementEvents` to
+    correlate the increments to another metric.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    canTxErrCount = robotTelemetry[robotTelemetry['Name'] == key]
-    canTxErrCount = canTxErrCount[canTxErrCount['Timestamp'] == canTxErrCount['Timestamp'].max()]
-    if canTxErrCount.empty:
-        return 'CAN Tx Error Count: 0', 'metric_not_implemented'
-    canTxErrCount[key] = cFunc(canTxErrCount['Value'])
-
-    metric = canTxErrCount[key].values[0]
-    metricEncoding = 'metric_ok'
-    if metric > 5:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 0:
-        metricEncoding = 'metric_low_risk'
+    canTxErrCount = rls.GetRunLengthSignal(keyIndex, key, runLengthIndex)
+    if canTxErrCount is None:
+        return {'CAN Tx Error Count': None}
 
-    return [f'CAN Tx Error Count: {metric}'], [metricEncoding]
+    return {'CAN Tx Error Count': float(cFunc(pd.Series([canTxErrCount.LastValue()])).iloc[0])}
 
 
-def ProcessCanTxFullCount(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessCanTxFullCount(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio CAN transmit full count telemetry data.
 
-    Filter this to grab the latest output. This will be used to spec the ending count and not used as an event to
-    correlate to another metric.
+    The counter is read from the run-length index of the log, so grabbing the latest output costs O(runs) (see
+    `GetRunLengthSignal`). This will be used to spec the ending count, see `EventDetection.IncrementEvents` to
+    correlate the increments to another metric.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    canTxFullCount = robotTelemetry[robotTelemetry['Name'] == key]
-    canTxFullCount = canTxFullCount[canTxFullCount['Timestamp'] == canTxFullCount['Timestamp'].max()]
-    if canTxFullCount.empty:
-        return 'CAN Tx Full Count: 0', 'metric_not_implemented'
-    canTxFullCount[key] = cFunc(canTxFullCount['Value'])
+    canTxFullCount = rls.GetRunLengthSignal(keyIndex, key, runLengthIndex)
+    if canTxFullCount is None:
+        return {'CAN Tx Full Count': None}
 
-    metric = canTxFullCount[key].values[0]
-    metricEncoding = 'metric_ok'
-    if metric > 5:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 0:
-        metricEncoding = 'metric_low_risk'
+    return {'CAN Tx Full Count': float(cFunc(pd.Series([canTxFullCount.LastValue()])).iloc[0])}
 
-    return [f'CAN Tx Full Count: {metric}'], [metricEncoding]
 
-
-def ProcessStaleDsData(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessStaleDsData(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the RoboRio stale drivers station telemetry data.
 
     Count the number of times there is stale data from the drivers station. TODO: this doesn't represent communication
     issues.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    staleDsData = robotTelemetry[robotTelemetry['Name'] == key]
-    if staleDsData.empty:
-        return 'Stale DS Data Count: 0', 'metric_not_implemented'
-    staleDsData[key] = cFunc(staleDsData['Value'])
-
-    metric = staleDsData[key].count()
-    metricEncoding = 'metric_ok'
-    if metric > 1:
-        metricEncoding = 'metric_high_risk'
-    elif metric > 0:
-        metricEncoding = 'metric_low_risk'
+    if key not in keyIndex:
+        return {'Stale DS Data Count': None}
+    timestamps, values = keyIndex[key]
+    staleDsData = pd.DataFrame({'Timestamp': timestamps, key: cFunc(pd.Series(values))})
 
-    return [f'Stale DS Data Count: {metric}'], [metricEncoding]
+    return {'Stale DS Data Count': int(staleDsData[key].count())}
 
 
-def ProcessImuYawAngle(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
+def ProcessImuYawAngle(keyIndex: dict, key: str, cFunc: Callable, outputDir: Path, runLengthIndex: dict = None):
     ''' Process the IMU yaw angle telemetry data.
 
     Filter the IMU data to only use the samples collected while the robot is not moving and in a known postion. This
@@ -254,55 +212,53 @@ def ProcessImuYawAngle(robotTelemetry: pd.DataFrame, key: str, cFunc: Callable):
     minimum of the `Auto` and `Teleop` states.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
+        keyIndex: the key index from `BuildKeyIndex`
         key: the telemetry key
         cFunc: the conversion function for the `Value` column
+        outputDir: the directory to save plots to
+        runLengthIndex: the run-length index of the log from `DetectRunLengthKeys`
 
     Returns:
-        metric: the string label used for displaying the metric in HTML
-        metricEncoding: the string encoding used to style the metric in HTML
+        metrics: Dictionary of metric name to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
 
     Raises:
         None
 
     '''
-    fmsMode = robotTelemetry[robotTelemetry['Name'] == 'FMS Mode']
-    startTime = fmsMode[fmsMode['Value'] == 'Disabled']['Timestamp'].min()
-    stopTime = fmsMode[fmsMode['Value'].isin(['Teleop', 'Auto'])]['Timestamp'].min()
-    imuYawAngle = robotTelemetry[robotTelemetry['Name'] == key]
-    imuYawAngle = imuYawAngle[(imuYawAngle['Timestamp'] <= stopTime) &
-                              (imuYawAngle['Timestamp'] >= startTime)]
-    imuYawAngle[key] = cFunc(imuYawAngle['Value'])
+    fmsTimestamps, fmsModes = keyIndex.get('FMS Mode', (np.empty(0), np.empty(0, dtype=object)))
+    disabled = fmsTimestamps[fmsModes == 'Disabled']
+    enabled = fmsTimestamps[np.isin(fmsModes, ['Teleop', 'Auto'])]
+    if key not in keyIndex or disabled.size == 0 or enabled.size == 0:
+        return {'IMU Yaw ?Norm Error? P-val': None, 'IMU Yaw DpM': None}
+    timestamps, values = keyIndex[key]
+    stationary = (timestamps <= enabled.min()) & (timestamps >= disabled.min())
+    imuYawAngle = pd.DataFrame({'Timestamp': timestamps[stationary], key: cFunc(pd.Series(values[stationary]))})
+    imuYawAngle = imuYawAngle.dropna(subset=[key])
+    if len(imuYawAngle) < 3:
+        return {'IMU Yaw ?Norm Error? P-val': None, 'IMU Yaw DpM': None}
 
     # Test for gaussian (gaussian means there is no drift which is good)
-    gaussianMetricEncoding = 'metric_ok'
-    stat, p = shapiro(imuYawAngle[key].dropna())
+    stat, p = shapiro(imuYawAngle[key])
     alpha = 0.05  # 95% confidence
     if p > alpha:
         txt = 'Gaussian (fail to reject H0), p = %.3f' % (p)
     else:
-        gaussianMetricEncoding = 'metric_low_risk'
         txt = 'Not Gaussian (reject H0), p = %.3f' % (p)
 
     # Fit a linear model and spec the slope...which is the drift
     linearModel = np.polyfit(imuYawAngle['Timestamp'], imuYawAngle[key], 1)
     predictor = np.poly1d(linearModel)
     imuYawAngle['Linear Regression'] = predictor(imuYawAngle['Timestamp'])
-    driftDegPerMinMetricEncoding = 'metric_ok'
     driftDegPerMin = abs(linearModel[0]*60.0)
-    if driftDegPerMin > 1.0:
-        driftDegPerMinMetricEncoding = 'metric_high_risk'
-    elif driftDegPerMin > 0.5:
-        driftDegPerMinMetricEncoding = 'metric_low_risk'
 
     # Create and save plots
-    fig, ax = plt.subplot_mosaic("A;B")
-    fig.suptitle('IMU Yaw Angle (deg) Analysis', fontsize=16)
-    imuYawAngle.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
-    imuYawAngle[key].plot(kind='hist', ax=ax["B"], bins=10, legend=True)
-    ax["B"].legend([txt])
-    plt.savefig(r'..\..\output\IMU Yaw Angle.png', bbox_inches='tight')
-
-    metrics = [f'IMU Yaw ?Norm Error? P-val: {p:.3f}', f'IMU Yaw DpM: {driftDegPerMin:.2f}']
-
-    return metrics, [gaussianMetricEncoding, driftDegPerMinMetricEncoding]
+    with dlh.PYPLOT_LOCK:
+        fig, ax = plt.subplot_mosaic("A;B")
+        fig.suptitle('IMU Yaw Angle (deg) Analysis', fontsize=16)
+        imuYawAngle.plot(ax=ax["A"], x='Timestamp', linestyle='--', marker='o')
+        imuYawAngle[key].plot(kind='hist', ax=ax["B"], bins=10, legend=True)
+        ax["B"].legend([txt])
+        fig.savefig(outputDir / 'IMU Yaw Angle.png', bbox_inches='tight')
+        plt.close(fig)
+
+    return {'IMU Yaw ?Norm Error? P-val': float(p), 'IMU Yaw DpM': float(driftDegPerMin)}
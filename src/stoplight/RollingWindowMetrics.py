@@ -0,0 +1,32 @@
+import RollingWindow as rw
+import SignalAlignment as sa
+
+
+def ProcessRollingWindowMetrics(keyIndex: dict, key: str, rollingWindowMetrics: list):
+    ''' Process the rolling-window metrics of a key.
+
+    Each metric is the worst `window` second window of the key (see `RollingWindow.WorstWindow`), so a sustained
+    burst or sag isn't averaged away over the whole log.
+
+    Args:
+        keyIndex: the key index from `BuildKeyIndex`, shared by every key so the log is only indexed once
+        key: the telemetry key
+        rollingWindowMetrics: the `label`, `window` and `statistic` of each metric of the key
+
+    Returns:
+        metrics: Dictionary of metric label to its raw value, None if the key isn't logged (see `METRIC_THRESHOLDS`)
+
+    Raises:
+        ValueError: if a statistic isn't supported
+
+    '''
+    timestamps, values = sa.GetSignal(keyIndex, key) if key in keyIndex else ([], [])
+
+    metrics = {}
+    for config in rollingWindowMetrics:
+        if len(values) == 0:
+            metrics[config['label']] = None
+        else:
+            metrics[config['label']], _ = rw.WorstWindow(timestamps, values, config['window'], config['statistic'])
+
+    return metrics
@@ -0,0 +1,119 @@
+from html import escape
+from string import Template
+
+""" The cell styles used by the stoplight chart. The keys are the cell encodings returned by the metric functions."""
+STOPLIGHT_STYLES = {
+    'device_ok':              'background-color: #00FF00;',
+    'device_high_risk':       'background-color: #FF0000;',
+    'device_low_risk':        'background-color: #FFFF00;',
+    'metric_not_implemented': 'text-align: right; color: #FFFFFF; background-color: #000000;',
+    'metric_ok':              'text-align: right; color: #00FF00; background-color: #000000;',
+    'metric_high_risk':       'text-align: right; color: #FF0000; background-color: #000000;',
+    'metric_low_risk':        'text-align: right; color: #FFFF00; background-color: #000000;',
+}
+
+_STYLE_SHEET = '\n'.join(f'.{encoding} {{{props}}}' for encoding, props in STOPLIGHT_STYLES.items())
+
+_PAGE_TEMPLATE = Template('''<style type="text/css">
+body {
+  background-color: #444444;
+}
+th {
+  color: #FFFFFF;
+}
+$styles
+</style>
+<table>
+$header<tbody>
+$rows
+</tbody>
+</table>
+''')
+
+_HEADER_TEMPLATE = Template('<thead>\n<tr>\n$cells\n</tr>\n</thead>\n')
+_HEADER_CELL_TEMPLATE = Template('<th colspan="$span">$label</th>')
+_CELL_TEMPLATE = Template('<td class="$encoding">$metric</td>')
+
+
+def RenderStoplightHtml(stoplightColumns: dict):
+    """ Render a single stoplight summary as an HTML page.
+
+    Each column is a device (RoboRIO, PH, PDH). The first entry of the metrics is the device image and the first entry
+    of the encodings is the device encoding, as returned by `ClassifyStoplights`.
+
+    Args:
+        stoplightColumns: Dictionary of column name to a (metrics, cellEncodings) tuple
+
+    Returns:
+        html: the stoplight summary as an HTML string
+
+    Raises:
+        None
+
+    """
+
+    return _PAGE_TEMPLATE.substitute(styles=_STYLE_SHEET, header='', rows=_RenderRows(list(stoplightColumns.values())))
+
+
+def RenderStoplightDashboard(logColumns: dict):
+    """ Render the stoplight summaries of several logs side by side as a single HTML page.
+
+    Every log gets a group of columns with the log name as the group header. The logs are rendered in a single pass
+    over the metric and encoding lists.
+
+    Args:
+        logColumns: Dictionary of log name to a stoplight columns dictionary (see `RenderStoplightHtml`)
+
+    Returns:
+        html: the stoplight dashboard as an HTML string
+
+    Raises:
+        None
+
+    """
+
+    columns = []
+    headerCells = []
+    for logName, stoplightColumns in logColumns.items():
+        columns.extend(stoplightColumns.values())
+        headerCells.append(_HEADER_CELL_TEMPLATE.substitute(span=len(stoplightColumns), label=escape(str(logName))))
+    header = _HEADER_TEMPLATE.substitute(cells='\n'.join(headerCells))
+
+    return _PAGE_TEMPLATE.substitute(styles=_STYLE_SHEET, header=header, rows=_RenderRows(columns))
+
+
+def StoplightRecords(stoplightColumns: dict):
+    """ Convert the stoplight columns into a list of row records (one dictionary per table row).
+
+    Missing cells are filled with an empty string, the same as the rendered table.
+
+    Args:
+        stoplightColumns: Dictionary of column name to a (metrics, cellEncodings) tuple
+
+    Returns:
+        records: List of dictionaries of column name to metric
+
+    Raises:
+        None
+
+    """
+
+    numRows = max((len(metrics) for metrics, _ in stoplightColumns.values()), default=0)
+    return [{name: metrics[row] if row < len(metrics) else '' for name, (metrics, _) in stoplightColumns.items()}
+            for row in range(numRows)]
+
+
+def _RenderRows(columns):
+    numRows = max((len(metrics) for metrics, _ in columns), default=0)
+    rows = []
+    for row in range(numRows):
+        cells = []
+        for metrics, encodings in columns:
+            if row < len(metrics):
+                metric = metrics[row]
+                encoding = encodings[row] if row < len(encodings) else 'metric_not_implemented'
+            else:
+                metric, encoding = '', 'metric_not_implemented'
+            cells.append(_CELL_TEMPLATE.substitute(encoding=encoding, metric=metric))
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+    return '\n'.join(rows)
@@ -1,53 +1,152 @@
-from logging.config import stopListening
+import json
+import os
+import sys
+from html import escape
+import numpy as np
 import pandas as pd
 from pathlib import Path
-import TelemetryKeys as tk
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import DataLogReader as dlr  # noqa: E402
+import MetricThresholds as mt  # noqa: E402
+import OtherSignalMetrics as osm  # noqa: E402
+import RollingWindowMetrics as rwm  # noqa: E402
+import SignalAlignment as sa  # noqa: E402
+import StoplightRenderer as sr  # noqa: E402
+import TelemetryKeys as tk  # noqa: E402
 
+OUTPUT_DIR = Path(__file__).resolve().parents[2] / 'output'
+RESOURCES_DIR = Path(__file__).resolve().parents[2] / 'resources'
 
-def GetStoplightMetricsAndCellEncodings(robotTelemetry: pd.DataFrame, telemetryKeys: dict):
-    """ Process the device telemetry and generate the stoplight chart metrics.
+""" The stoplight columns, each with the telemetry keys of the device and its image in the resources directory."""
+STOPLIGHT_DEVICES = {
+    'RoboRIO': {'telemetryKeys': tk.ROBORIO_TELEMETRY_KEYS, 'image': 'roborio.png'},
+    'PH':      {'telemetryKeys': tk.PH_TELEMETRY_KEYS,      'image': 'pneumatics_hub.png'},
+    'PDH':     {'telemetryKeys': tk.PDH_TELEMETRY_KEYS,     'image': 'power_distribution_hub.png'},
+}
+
+""" The auto-generated column of the numeric keys which look anomalous, out of every key that isn't in a device
+column (see `OtherSignalMetrics.ProcessOtherSignals`)."""
+OTHER_SIGNALS = 'Other Signals'
+
+""" The raw metric values of a log, the stoplight summary can be regenerated from this file alone."""
+METRICS_FILE = 'stoplight_metrics.json'
+
+
+def GetStoplightMetrics(keyIndex: dict, telemetryKeys: dict, outputDir: Path = OUTPUT_DIR,
+                        rollingWindowMetrics: dict = tk.ROLLING_WINDOW_METRICS, runLengthIndex: dict = None):
+    """ Process the device telemetry into the raw values of the stoplight chart metrics.
 
     Args:
-        robotTelemetry: Pandas dataframe of robot telemetry
-        telemetryKeys:
+        keyIndex: the key index from `BuildKeyIndex`, shared by every metric so the log is only indexed once
+        telemetryKeys: key to the `pFunc` and `cFunc` of the key (see `ROBORIO_TELEMETRY_KEYS`)
+        outputDir: the directory the metric functions save their plots to
+        rollingWindowMetrics: key to the list of rolling-window metrics of the key (see `ROLLING_WINDOW_METRICS`)
+        runLengthIndex: optional run-length index of the log from `DetectRunLengthKeys`, for the counter and flag
+            metrics
 
     Returns:
-        roboRioStoplightMetrics: List of strings which summarizes the stoplight metrics
-        roboRioCellEncodings: List of stings which encode the cells for HTML styling
+        metrics: Dictionary of metric name to its raw value in stoplight order, None if it couldn't be computed
 
     Raises:
-        TypeError: if the input isn't a pandas dataframe object
+        TypeError: if the input isn't a key index
 
     """
 
-    if not isinstance(robotTelemetry, pd.DataFrame):
-        raise TypeError("expected a pandas dataframe input")
+    if not isinstance(keyIndex, dict):
+        raise TypeError("expected a key index input")
 
-    stoplightMetrics = []
-    cellEncodings = []
-    deviceEncoding = 'device_ok'
+    metrics = {}
     for key in telemetryKeys.keys():
         if telemetryKeys[key]['pFunc'] == None:
-            stoplightMetrics.append(key)
-            cellEncodings.append('metric_not_implemented')
+            metrics[key] = None
         else:
-            metrics, metricEncodings = telemetryKeys[key]['pFunc'](robotTelemetry, key, telemetryKeys[key]['cFunc'])
-            stoplightMetrics.extend(metrics)
-            cellEncodings.extend(metricEncodings)
-            if 'metric_high_risk' in metricEncodings:
-                deviceEncoding = 'device_high_risk'
-            elif 'metric_low_risk' in metricEncodings and deviceEncoding == 'device_ok':
-                deviceEncoding = 'device_low_risk'
-    cellEncodings.insert(0, deviceEncoding)
+            pFunc, cFunc = telemetryKeys[key]['pFunc'], telemetryKeys[key]['cFunc']
+            metrics.update(pFunc(keyIndex, key, cFunc, outputDir, runLengthIndex))
+        if key in rollingWindowMetrics:
+            metrics.update(rwm.ProcessRollingWindowMetrics(keyIndex, key, rollingWindowMetrics[key]))
+
+    return {name: None if value is None or np.isnan(value) else value for name, value in metrics.items()}
+
+
+def ClassifyStoplights(logMetrics: list, thresholdTable: pd.DataFrame = None):
+    """ Turn the raw metric values of one or more logs into stoplight columns.
+
+    The values of every log are classified together, one vectorized pass per device, so re-tuning the thresholds of
+    a whole event only costs the formatting of the labels. The `OTHER_SIGNALS` column only lists its keys with a
+    statistic at risk, labelled with their worst statistic.
+
+    Args:
+        logMetrics: list with a dictionary of device to its metrics (see `GetStoplightMetrics`) per log, the metrics
+            of `OTHER_SIGNALS` are a dictionary of key to its statistics
+        thresholdTable: the threshold table, by default `LoadMetricThresholds()`
+
+    Returns:
+        logColumns: list with the stoplight columns of each log, a dictionary of device to a (metrics, cellEncodings)
+            tuple where the metrics are the labels and the first encoding is the device encoding
+
+    Raises:
+        None
+
+    """
+
+    thresholdTable = mt.LoadMetricThresholds() if thresholdTable is None else thresholdTable
+    devices = list(dict.fromkeys(device for stoplightMetrics in logMetrics for device in stoplightMetrics))
+
+    logColumns = [{} for _ in logMetrics]
+    for device in devices:
+        rows = [stoplightMetrics.get(device, {}) for stoplightMetrics in logMetrics]
+        if device == OTHER_SIGNALS:
+            for i, stoplightColumn in enumerate(_ClassifyOtherSignals(rows, thresholdTable)):
+                logColumns[i][device] = stoplightColumn
+            continue
+        values = pd.DataFrame(rows).astype(np.float64)
+        cellEncodings = mt.ClassifyMetrics(values, thresholdTable)
+        deviceEncodings = mt.DeviceEncodings(cellEncodings)
+
+        encodingArray = cellEncodings.to_numpy()
+        columns = {name: j for j, name in enumerate(values.columns)}
+        for i, metrics in enumerate(rows):
+            labels = [mt.FormatMetric(name, value, thresholdTable) for name, value in metrics.items()]
+            encodings = [str(deviceEncodings[i])] + encodingArray[i, [columns[name] for name in metrics]].tolist()
+            logColumns[i][device] = (labels, encodings)
+
+    return logColumns
 
-    return stoplightMetrics, cellEncodings
 
+def _ClassifyOtherSignals(rows, thresholdTable):
+    # Classify the statistics of every key of every log at once, then keep the worst statistic of each key
+    keys = [(i, key) for i, signals in enumerate(rows) for key in signals]
+    values = pd.DataFrame([rows[i][key] for i, key in keys], columns=list(osm.ANOMALY_STATISTICS)).astype(np.float64)
+    cellEncodings = mt.ClassifyMetrics(values, thresholdTable).to_numpy()
+    severity = 2 * (cellEncodings == 'metric_high_risk') + (cellEncodings == 'metric_low_risk')
+    worst, worstStatistic = severity.max(axis=1, initial=0), severity.argmax(axis=1)
 
-def CreateStoplightSummary(telemetryFile: Path):
+    flagged = [[] for _ in rows]
+    for j in np.flatnonzero(worst > 0):
+        flagged[keys[j][0]].append(j)
+
+    stoplightColumns = []
+    for signals in flagged:
+        signals.sort(key=lambda j: (-worst[j], keys[j][1]))
+        labels = [f'{escape(keys[j][1])} ' + mt.FormatMetric(values.columns[worstStatistic[j]],
+                                                             values.iat[j, worstStatistic[j]], thresholdTable)
+                  for j in signals]
+        encodings = [cellEncodings[j, worstStatistic[j]] for j in signals]
+        deviceEncoding = 'device_high_risk' if 'metric_high_risk' in encodings else \
+            'device_low_risk' if encodings else 'device_ok'
+        if not signals:
+            labels, encodings = ['No Anomalous Signals'], ['metric_ok']
+        stoplightColumns.append((labels, [deviceEncoding] + encodings))
+
+    return stoplightColumns
+
+
+def CreateStoplightSummary(telemetryFile: Path, outputDir: Path = OUTPUT_DIR):
     """ Gather all of the device telemetry metrics and create a stoplight summary in HTML format.
 
     Args:
         telemetryFile: Absolute path to the robot telemetry file
+        outputDir: the directory to write the stoplight summary and plots to
 
     Returns:
         None
@@ -60,68 +159,115 @@ def CreateStoplightSummary(telemetryFile: Path):
     if not isinstance(telemetryFile, Path):
         raise TypeError("expected a pathlib Path input")
 
-    # Get the metrics from the varoious components
-    robotTelemetry = pd.read_csv(str(telemetryFile))
-    rrMetrics, rrCellEncodings = GetStoplightMetricsAndCellEncodings(robotTelemetry, tk.ROBORIO_TELEMETRY_KEYS)
-    phMetrics, phCellEncodings = GetStoplightMetricsAndCellEncodings(robotTelemetry, tk.PH_TELEMETRY_KEYS)
-    pdhMetrics, pdhCellEncodings = GetStoplightMetricsAndCellEncodings(robotTelemetry, tk.PDH_TELEMETRY_KEYS)
-
-    # Build the stoplight summary and cell color dataframes
-    rrMetrics.insert(0, r'<img src="..\resources\roborio.png">')
-    phMetrics.insert(0, r'<img src="..\resources\pneumatics_hub.png">')
-    pdhMetrics.insert(0, r'<img src="..\resources\power_distribution_hub.png">')
-    stoplightSummary = pd.DataFrame({
-        'RoboRIO': pd.Series(rrMetrics),
-        'PH': pd.Series(phMetrics),
-        'PDH': pd.Series(pdhMetrics)
-    })
-
-    # Style the cells based on their encodings
-    s = stoplightSummary.style
-    stoplightCellEncodings = pd.DataFrame({
-        'RoboRIO': pd.Series(rrCellEncodings),
-        'PH': pd.Series(phCellEncodings),
-        'PDH': pd.Series(pdhCellEncodings)
-    }, index=stoplightSummary.index, columns=stoplightSummary.columns[:len(stoplightSummary.columns)])
-
-    stoplightSummary.fillna('', inplace=True)
-    stoplightCellEncodings.fillna('metric_not_implemented', inplace=True)
-
-    with open('..\..\output\stoplight.json', 'w') as f:
-        f.write(stoplightSummary.to_json(orient='records', lines=True))
-
-    s.set_table_styles([
-        {'selector': 'thead', 'props': [('display', 'none')]},
-        {'selector': '.device_ok', 'props': 'background-color: #00FF00;'},
-        {'selector': '.device_high_risk', 'props': 'background-color: #FF0000;'},
-        {'selector': '.device_low_risk', 'props': 'background-color: #FFFF00;'},
-        {'selector': '.metric_not_implemented', 'props': 'text-align: right; color: #FFFFFF; background-color: #000000;'},
-        {'selector': '.metric_ok', 'props': 'text-align: right; color: #00FF00; background-color: #000000;'},
-        {'selector': '.metric_high_risk', 'props': 'text-align: right; color: #FF0000; background-color: #000000;'},
-        {'selector': '.metric_low_risk', 'props': 'text-align: right; color: #FFFF00; background-color: #000000;'},
-    ], overwrite=False)
-    s.set_td_classes(stoplightCellEncodings)
-    s.hide(axis="index")
-
-    # Kludge to add a background color the HTML <body> tag
-    html = s.to_html(escape=False)
-    html_lines = html.splitlines()
-    new_html_lines = html_lines[:1]
-    new_html_lines.extend(['body {', '  background-color: #444444;', '}'])
-    new_html_lines.extend(html_lines[1:])
+    WriteStoplightSummary(dlr.ReadDataLog(telemetryFile), outputDir)
+
+
+def WriteStoplightSummary(source, outputDir: Path = OUTPUT_DIR, thresholdTable: pd.DataFrame = None,
+                          runLengthIndex: dict = None):
+    """ Create the stoplight summary of telemetry that has already been loaded.
+
+    Writes the raw metric values to `METRICS_FILE`, then `stoplight.json`, `stoplight_robot.html` and the metric plots
+    to the output directory. Every metric reads the same key index, so the log is indexed once (or not at all when
+    the caller already has its key index).
+
+    Args:
+        source: Pandas dataframe of robot telemetry or a key index from `BuildKeyIndex`
+        outputDir: the directory to write the stoplight summary and plots to
+        thresholdTable: the threshold table, by default `LoadMetricThresholds()`
+        runLengthIndex: optional run-length index of the log from `DetectRunLengthKeys`
+
+    Returns:
+        stoplightColumns: Dictionary of column name to a (metrics, cellEncodings) tuple
+
+    Raises:
+        TypeError: if the input isn't a pandas dataframe object or a key index
+
+    """
+
+    outputDir = Path(outputDir)
+    outputDir.mkdir(parents=True, exist_ok=True)
+    keyIndex = sa.BuildKeyIndex(source) if isinstance(source, pd.DataFrame) else source
+
+    # Get the metrics from the various components
+    stoplightMetrics = {device: GetStoplightMetrics(keyIndex, config['telemetryKeys'], outputDir,
+                                                    runLengthIndex=runLengthIndex)
+                        for device, config in STOPLIGHT_DEVICES.items()}
+    deviceKeys = [key for config in STOPLIGHT_DEVICES.values() for key in config['telemetryKeys']]
+    stoplightMetrics[OTHER_SIGNALS] = osm.ProcessOtherSignals(keyIndex, deviceKeys, tk.CONSTANT_KEYS)
+    with open(outputDir / METRICS_FILE, 'w') as f:
+        json.dump(stoplightMetrics, f, indent=2)
+
+    return _WriteStoplight(ClassifyStoplights([stoplightMetrics], thresholdTable)[0], outputDir)
+
+
+def RegenerateStoplightSummaries(outputDirs: list, thresholdTable: pd.DataFrame = None):
+    """ Regenerate the stoplight summaries of processed logs from their stored metric values, without the logs.
+
+    Args:
+        outputDirs: list of the output directories of the logs, each with a `METRICS_FILE`
+        thresholdTable: the threshold table, by default `LoadMetricThresholds()`
+
+    Returns:
+        logColumns: list with the stoplight columns of each log (see `ClassifyStoplights`)
+
+    Raises:
+        OSError: if an output directory doesn't have a `METRICS_FILE`
+
+    """
+
+    logMetrics = []
+    for outputDir in outputDirs:
+        with open(Path(outputDir) / METRICS_FILE) as f:
+            logMetrics.append(json.load(f))
+
+    logColumns = ClassifyStoplights(logMetrics, thresholdTable)
+    return [_WriteStoplight(stoplightColumns, Path(outputDir))
+            for stoplightColumns, outputDir in zip(logColumns, outputDirs)]
+
+
+def _WriteStoplight(stoplightColumns, outputDir):
+    # Put the device image (or the column name if it doesn't have one) at the top of each column
+    resources = Path(os.path.relpath(RESOURCES_DIR, outputDir)).as_posix()
+    for device, (metrics, _) in stoplightColumns.items():
+        if device in STOPLIGHT_DEVICES:
+            metrics.insert(0, f'<img src="{resources}/{STOPLIGHT_DEVICES[device]["image"]}">')
+        else:
+            metrics.insert(0, escape(device))
+
+    with open(outputDir / 'stoplight.json', 'w') as f:
+        records = sr.StoplightRecords(stoplightColumns)
+        f.write('\n'.join(json.dumps(record, separators=(',', ':')) for record in records))
 
     # Write the HTML to a file for viewing
-    with open(r'..\..\output\stoplight_robot.html', 'w') as f:
-        f.write("\n".join(new_html_lines))
+    with open(outputDir / 'stoplight_robot.html', 'w') as f:
+        f.write(sr.RenderStoplightHtml(stoplightColumns))
+
+    return stoplightColumns
 
 
 if __name__ == "__main__":
     import argparse
+    import time
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("telemetryfile")
+    parser.add_argument("telemetryfile", help='the telemetry file, or with --regenerate a directory of processed logs')
+    parser.add_argument("--output", default=str(OUTPUT_DIR))
+    parser.add_argument("--thresholds", default=None, help='JSON file of metric thresholds overriding the defaults')
+    parser.add_argument("--regenerate", action='store_true',
+                        help='re-classify the stored metric values of every log in the directory, without the logs')
     args = parser.parse_args()
-    telemetryFile = Path(args.telemetryfile)
-    if not telemetryFile.is_file():
-        raise OSError(2, 'File not found', telemetryFile)
-    CreateStoplightSummary(telemetryFile)
+    thresholdTable = mt.LoadMetricThresholds(args.thresholds)
+    if args.regenerate:
+        outputDir = Path(args.telemetryfile)
+        if not outputDir.is_dir():
+            raise OSError(2, 'Directory not found', outputDir)
+        outputDirs = [path.parent for path in sorted([*outputDir.glob(METRICS_FILE),
+                                                      *outputDir.glob(f'*/{METRICS_FILE}')])]
+        start = time.perf_counter()
+        RegenerateStoplightSummaries(outputDirs, thresholdTable)
+        print(f'{len(outputDirs)} stoplight summaries regenerated in {1000 * (time.perf_counter() - start):.1f} ms')
+    else:
+        telemetryFile = Path(args.telemetryfile)
+        if not telemetryFile.is_file():
+            raise OSError(2, 'File not found', telemetryFile)
+        WriteStoplightSummary(dlr.ReadDataLog(telemetryFile), Path(args.output), thresholdTable)
@@ -27,3 +27,54 @@ PDH_TELEMETRY_KEYS = {
     # 'PDH Total Current (A)':      {'pFunc': phm.ProcessTotalCurrent,      'cFunc': pd.to_numeric},
     # 'PDH Total Power (W)':        {'pFunc': phm.ProcessTotalPower,        'cFunc': pd.to_numeric},
 }
+
+""" The rolling-window metrics of each key, in addition to the metrics of its `pFunc`. Each one is the worst `window`
+second window of the `statistic` (see `RollingWindow.WINDOW_STATISTICS`), and is classified by the `METRIC_THRESHOLDS`
+of its label."""
+ROLLING_WINDOW_METRICS = {
+    'RoboRio CAN Utilization': [
+        {'label': 'Worst 1 s CAN Utilization', 'window': 1.0, 'statistic': 'max mean'},
+    ],
+    'Compressor Current (A)': [
+        {'label': 'Sustained Compressor Current', 'window': 2.0, 'statistic': 'max min'},
+    ],
+    'PDH Input Voltage (V)': [
+        {'label': 'Min 500 ms Voltage', 'window': 0.5, 'statistic': 'min mean'},
+    ],
+}
+
+""" Globs of the keys which are expected to hold one value for the whole log, e.g. the turn feed-forward outputs which
+are logged but not used. Their `Stuck Fraction` isn't classified in the other signals column, every other statistic
+still is."""
+CONSTANT_KEYS = [
+    '* Turn Feed-forward Output (V)',
+]
+
+""" The risk thresholds of each stoplight metric. The metric functions only return raw values, these thresholds turn
+them into cell encodings so they can be re-tuned (see `MetricThresholds.LoadMetricThresholds`) without reading the
+logs again. A `direction` of `above` is high risk above the thresholds and `below` is high risk below them, and the
+`format` is the format spec of the value in the stoplight. The CAN utilization is logged as a fraction of the bus
+bandwidth."""
+METRIC_THRESHOLDS = {
+    'Brownout Count':               {'lowRisk': 0,     'highRisk': 1,     'direction': 'above', 'format': '.0f'},
+    'CAN Utilization':              {'lowRisk': 0.6,   'highRisk': 0.8,   'direction': 'above', 'format': '.2f'},
+    'Worst 1 s CAN Utilization':    {'lowRisk': 0.8,   'highRisk': 0.9,   'direction': 'above', 'format': '.2f'},
+    'CAN Off Count':                {'lowRisk': 0,     'highRisk': 5,     'direction': 'above', 'format': '.0f'},
+    'CAN Rx Error Count':           {'lowRisk': 0,     'highRisk': 5,     'direction': 'above', 'format': '.0f'},
+    'CAN Tx Error Count':           {'lowRisk': 0,     'highRisk': 5,     'direction': 'above', 'format': '.0f'},
+    'CAN Tx Full Count':            {'lowRisk': 0,     'highRisk': 5,     'direction': 'above', 'format': '.0f'},
+    'IMU Yaw ?Norm Error? P-val':   {'lowRisk': 0.05,  'highRisk': None,  'direction': 'below', 'format': '.3f'},
+    'IMU Yaw DpM':                  {'lowRisk': 0.5,   'highRisk': 1.0,   'direction': 'above', 'format': '.2f'},
+    'Stale DS Data Count':          {'lowRisk': 0,     'highRisk': 1,     'direction': 'above', 'format': '.0f'},
+    'Starting Pressure':            {'lowRisk': 100.0, 'highRisk': 80.0,  'direction': 'below', 'format': '.1f'},
+    'Max Compressor Current':       {'lowRisk': 16.0,  'highRisk': 20.0,  'direction': 'above', 'format': '.1f'},
+    'Sustained Compressor Current': {'lowRisk': 16.0,  'highRisk': 20.0,  'direction': 'above', 'format': '.2f'},
+    'Starting Voltage':             {'lowRisk': 11.7,  'highRisk': 11.5,  'direction': 'below', 'format': '.2f'},
+    'Ending Voltage':               {'lowRisk': 11.2,  'highRisk': 11.0,  'direction': 'below', 'format': '.2f'},
+    'Min 500 ms Voltage':           {'lowRisk': 10.0,  'highRisk': 9.0,   'direction': 'below', 'format': '.2f'},
+    # The anomaly scan statistics of the other signals column (see `AnomalyScan.ScanAnomalies`)
+    'Spike Count':                  {'lowRisk': 5,     'highRisk': 25,    'direction': 'above', 'format': '.0f'},
+    'Stuck Fraction':               {'lowRisk': 0.9,   'highRisk': 0.98,  'direction': 'above', 'format': '.2f'},
+    'NaN Count':                    {'lowRisk': 0,     'highRisk': 10,    'direction': 'above', 'format': '.0f'},
+    'Gap Ratio':                    {'lowRisk': 5.0,   'highRisk': 20.0,  'direction': 'above', 'format': '.1f'},
+}
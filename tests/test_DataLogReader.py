@@ -0,0 +1,25 @@
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / 'src'
+sys.path.insert(0, str(SRC_DIR))
+import DataLogReader as dlr  # noqa: E402
+
+LOG_CSV = 'Timestamp,Name,Value\n0.02,PDH Input Voltage (V),12.5\n0.04,PDH Input Voltage (V),12.4\n'
+
+
+def test_FindDataLogs_archived_log_found_once(tmp_path):
+    for name in ('FRC_20221116_011206', 'FRC_20221116_011621'):
+        (tmp_path / f'{name}.csv').write_text(LOG_CSV)
+    subprocess.run([sys.executable, str(SRC_DIR / 'DataLogArchive.py'), str(tmp_path), '--format', 'gz'],
+                   check=True, capture_output=True)
+    assert len(list(tmp_path.glob('*.csv.gz'))) == 2
+
+    telemetryFiles = dlr.FindDataLogs(tmp_path)
+    assert [path.name for path in telemetryFiles] == ['FRC_20221116_011206.csv', 'FRC_20221116_011621.csv']
+
+    # Once the original is gone the archive is found instead
+    (tmp_path / 'FRC_20221116_011206.csv').unlink()
+    telemetryFiles = dlr.FindDataLogs(tmp_path)
+    assert [path.name for path in telemetryFiles] == ['FRC_20221116_011206.csv.gz', 'FRC_20221116_011621.csv']